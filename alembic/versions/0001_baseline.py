@@ -0,0 +1,195 @@
+"""baseline
+
+Schema as created by init_db() before migrations were introduced. Databases
+that already have these tables are adopted instead: missing tables, the
+users.points_balance column and the expiry index are added in place.
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 16:02:31.620629
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _create_cache_versions() -> None:
+    op.create_table('cache_versions',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def _create_job_leases() -> None:
+    op.create_table('job_leases',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('holder', sa.String(length=100), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('acquired_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def _adopt_existing_schema() -> None:
+    """Bring a database created by init_db() up to the baseline"""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('cache_versions'):
+        _create_cache_versions()
+    if not inspector.has_table('job_leases'):
+        _create_job_leases()
+    if 'points_balance' not in {column['name'] for column in inspector.get_columns('users')}:
+        op.add_column('users', sa.Column('points_balance', sa.Integer(), server_default='0', nullable=False))
+        # Seed the materialized balance from the ledger
+        op.execute(
+            "UPDATE users u SET points_balance = l.total "
+            "FROM (SELECT user_id, SUM(points) AS total FROM referral_points GROUP BY user_id) l "
+            "WHERE l.user_id = u.id"
+        )
+    op.create_index('ix_subscriptions_status_end_date', 'subscriptions', ['status', 'end_date'],
+                    unique=False, if_not_exists=True)
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table('users'):
+        _adopt_existing_schema()
+        return
+
+    _create_cache_versions()
+    _create_job_leases()
+    op.create_table('plans',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('name_ar', sa.String(length=255), nullable=True),
+    sa.Column('name_en', sa.String(length=255), nullable=True),
+    sa.Column('duration', sa.Enum('WEEKLY', 'MONTHLY', 'YEARLY', name='planduration'), nullable=False),
+    sa.Column('duration_days', sa.Integer(), nullable=False),
+    sa.Column('price', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('currency', sa.String(length=10), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_plans_id'), 'plans', ['id'], unique=False)
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('telegram_id', sa.BigInteger(), nullable=False),
+    sa.Column('username', sa.String(length=255), nullable=True),
+    sa.Column('first_name', sa.String(length=255), nullable=True),
+    sa.Column('last_name', sa.String(length=255), nullable=True),
+    sa.Column('language_code', sa.String(length=10), nullable=True),
+    sa.Column('referral_code', sa.String(length=20), nullable=False),
+    sa.Column('free_trial_used', sa.Boolean(), nullable=True),
+    sa.Column('points_balance', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+    op.create_index(op.f('ix_users_referral_code'), 'users', ['referral_code'], unique=True)
+    op.create_index(op.f('ix_users_telegram_id'), 'users', ['telegram_id'], unique=True)
+    op.create_table('referrals',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('referrer_id', sa.Integer(), nullable=False),
+    sa.Column('referred_id', sa.Integer(), nullable=False),
+    sa.Column('points_awarded', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['referred_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['referrer_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_referrals_id'), 'referrals', ['id'], unique=False)
+    op.create_index(op.f('ix_referrals_referred_id'), 'referrals', ['referred_id'], unique=False)
+    op.create_index(op.f('ix_referrals_referrer_id'), 'referrals', ['referrer_id'], unique=False)
+    op.create_table('subscriptions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('plan_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.Enum('ACTIVE', 'EXPIRED', 'CANCELLED', 'TRIAL', name='subscriptionstatus'), nullable=True),
+    sa.Column('start_date', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('end_date', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('is_trial', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['plan_id'], ['plans.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_subscriptions_id'), 'subscriptions', ['id'], unique=False)
+    op.create_index('ix_subscriptions_status_end_date', 'subscriptions', ['status', 'end_date'], unique=False)
+    op.create_index(op.f('ix_subscriptions_user_id'), 'subscriptions', ['user_id'], unique=False)
+    op.create_table('payments',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('subscription_id', sa.Integer(), nullable=True),
+    sa.Column('plan_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('currency', sa.String(length=10), nullable=False),
+    sa.Column('network', sa.String(length=20), nullable=True),
+    sa.Column('status', sa.Enum('PENDING', 'COMPLETED', 'FAILED', 'REFUNDED', name='paymentstatus'), nullable=True),
+    sa.Column('provider', sa.String(length=50), nullable=True),
+    sa.Column('transaction_id', sa.String(length=255), nullable=True),
+    sa.Column('wallet_address', sa.String(length=255), nullable=True),
+    sa.Column('payment_proof', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['plan_id'], ['plans.id'], ),
+    sa.ForeignKeyConstraint(['subscription_id'], ['subscriptions.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_payments_id'), 'payments', ['id'], unique=False)
+    op.create_index(op.f('ix_payments_transaction_id'), 'payments', ['transaction_id'], unique=True)
+    op.create_index(op.f('ix_payments_user_id'), 'payments', ['user_id'], unique=False)
+    op.create_table('referral_points',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('points', sa.Integer(), nullable=False),
+    sa.Column('description', sa.String(length=255), nullable=True),
+    sa.Column('referral_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['referral_id'], ['referrals.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_referral_points_id'), 'referral_points', ['id'], unique=False)
+    op.create_index(op.f('ix_referral_points_user_id'), 'referral_points', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_referral_points_user_id'), table_name='referral_points')
+    op.drop_index(op.f('ix_referral_points_id'), table_name='referral_points')
+    op.drop_table('referral_points')
+    op.drop_index(op.f('ix_payments_user_id'), table_name='payments')
+    op.drop_index(op.f('ix_payments_transaction_id'), table_name='payments')
+    op.drop_index(op.f('ix_payments_id'), table_name='payments')
+    op.drop_table('payments')
+    op.drop_index(op.f('ix_subscriptions_user_id'), table_name='subscriptions')
+    op.drop_index('ix_subscriptions_status_end_date', table_name='subscriptions')
+    op.drop_index(op.f('ix_subscriptions_id'), table_name='subscriptions')
+    op.drop_table('subscriptions')
+    op.drop_index(op.f('ix_referrals_referrer_id'), table_name='referrals')
+    op.drop_index(op.f('ix_referrals_referred_id'), table_name='referrals')
+    op.drop_index(op.f('ix_referrals_id'), table_name='referrals')
+    op.drop_table('referrals')
+    op.drop_index(op.f('ix_users_telegram_id'), table_name='users')
+    op.drop_index(op.f('ix_users_referral_code'), table_name='users')
+    op.drop_index(op.f('ix_users_id'), table_name='users')
+    op.drop_table('users')
+    op.drop_index(op.f('ix_plans_id'), table_name='plans')
+    op.drop_table('plans')
+    op.drop_table('job_leases')
+    op.drop_table('cache_versions')
+    for enum_name in ('paymentstatus', 'subscriptionstatus', 'planduration'):
+        sa.Enum(name=enum_name).drop(op.get_bind(), checkfirst=True)
+
@@ -0,0 +1,79 @@
+"""hot query indexes
+
+Composite and partial indexes for the filters the bot and the admin panel
+run on every request. Single-column indexes that become a prefix of a new
+composite index are dropped. Indexes are built CONCURRENTLY so large tables
+stay writable during the upgrade; existing ones are skipped, since init_db()
+creates the model's indexes when it builds tables itself.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 16:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Enum columns store member names
+LIVE_SUBSCRIPTIONS = sa.text("status IN ('ACTIVE', 'TRIAL')")
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_subscriptions_user_id_status', 'subscriptions', ['user_id', 'status'],
+                        if_not_exists=True, postgresql_concurrently=True)
+        op.create_index('ix_subscriptions_live_end_date', 'subscriptions', ['end_date', 'id'],
+                        postgresql_where=LIVE_SUBSCRIPTIONS, if_not_exists=True, postgresql_concurrently=True)
+        op.create_index('ix_subscriptions_status_updated_at', 'subscriptions', ['status', 'updated_at'],
+                        if_not_exists=True, postgresql_concurrently=True)
+        op.create_index('ix_payments_user_id_status', 'payments', ['user_id', 'status'],
+                        if_not_exists=True, postgresql_concurrently=True)
+        op.create_index(op.f('ix_payments_status'), 'payments', ['status'],
+                        if_not_exists=True, postgresql_concurrently=True)
+        op.create_index('ix_referrals_referrer_id_referred_id', 'referrals', ['referrer_id', 'referred_id'],
+                        if_not_exists=True, postgresql_concurrently=True)
+        op.create_index(op.f('ix_plans_is_active'), 'plans', ['is_active'],
+                        if_not_exists=True, postgresql_concurrently=True)
+
+        # Covered by the composite and partial indexes above
+        op.drop_index('ix_subscriptions_status_end_date', table_name='subscriptions',
+                      if_exists=True, postgresql_concurrently=True)
+        op.drop_index(op.f('ix_subscriptions_user_id'), table_name='subscriptions',
+                      if_exists=True, postgresql_concurrently=True)
+        op.drop_index(op.f('ix_payments_user_id'), table_name='payments',
+                      if_exists=True, postgresql_concurrently=True)
+        op.drop_index(op.f('ix_referrals_referrer_id'), table_name='referrals',
+                      if_exists=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_referrals_referrer_id'), 'referrals', ['referrer_id'],
+                        postgresql_concurrently=True)
+        op.create_index(op.f('ix_payments_user_id'), 'payments', ['user_id'],
+                        postgresql_concurrently=True)
+        op.create_index(op.f('ix_subscriptions_user_id'), 'subscriptions', ['user_id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_subscriptions_status_end_date', 'subscriptions', ['status', 'end_date'],
+                        postgresql_concurrently=True)
+
+        op.drop_index(op.f('ix_plans_is_active'), table_name='plans', postgresql_concurrently=True)
+        op.drop_index('ix_referrals_referrer_id_referred_id', table_name='referrals',
+                      postgresql_concurrently=True)
+        op.drop_index(op.f('ix_payments_status'), table_name='payments', postgresql_concurrently=True)
+        op.drop_index('ix_payments_user_id_status', table_name='payments', postgresql_concurrently=True)
+        op.drop_index('ix_subscriptions_status_updated_at', table_name='subscriptions',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_subscriptions_live_end_date', table_name='subscriptions',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_subscriptions_user_id_status', table_name='subscriptions',
+                      postgresql_concurrently=True)
@@ -0,0 +1,51 @@
+"""stats counters
+
+Counters read by the admin dashboard, maintained by the services and
+recounted periodically by the bot. Seeded from the current tables.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 16:45:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Created by init_db(); the bot's periodic recount fills it
+    if sa.inspect(op.get_bind()).has_table('stats_counters'):
+        return
+
+    op.create_table('stats_counters',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.Numeric(precision=20, scale=2), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Names match services/stats_service.py (enum columns store upper-case member names)
+    op.execute("""
+        INSERT INTO stats_counters (name, value)
+        SELECT 'users', count(*) FROM users
+        UNION ALL
+        SELECT 'subscriptions.' || lower(status::text), count(*) FROM subscriptions
+        WHERE status IS NOT NULL GROUP BY status
+        UNION ALL
+        SELECT 'payments.' || lower(status::text), count(*) FROM payments
+        WHERE status IS NOT NULL GROUP BY status
+        UNION ALL
+        SELECT 'payments.revenue', COALESCE(sum(amount), 0) FROM payments WHERE status = 'COMPLETED'
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('stats_counters')
@@ -0,0 +1,38 @@
+"""admin pagination indexes
+
+Indexes for keyset pagination of the admin users and subscriptions lists,
+ordered by (created_at, id) newest first.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 17:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'],
+                        if_not_exists=True, postgresql_concurrently=True)
+        op.create_index('ix_subscriptions_created_at_id', 'subscriptions', ['created_at', 'id'],
+                        if_not_exists=True, postgresql_concurrently=True)
+        op.create_index('ix_subscriptions_status_created_at_id', 'subscriptions', ['status', 'created_at', 'id'],
+                        if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_subscriptions_status_created_at_id', table_name='subscriptions',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_subscriptions_created_at_id', table_name='subscriptions', postgresql_concurrently=True)
+        op.drop_index('ix_users_created_at_id', table_name='users', postgresql_concurrently=True)
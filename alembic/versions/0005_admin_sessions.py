@@ -0,0 +1,40 @@
+"""admin sessions
+
+Admin panel login sessions shared by every web worker
+(web/session_store.py DatabaseSessionStore).
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 17:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table('admin_sessions'):
+        return
+
+    op.create_table('admin_sessions',
+    sa.Column('session_key', sa.String(length=64), nullable=False),
+    sa.Column('data', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('session_key')
+    )
+    op.create_index(op.f('ix_admin_sessions_expires_at'), 'admin_sessions', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_admin_sessions_expires_at'), table_name='admin_sessions')
+    op.drop_table('admin_sessions')
@@ -0,0 +1,37 @@
+"""payment idempotency key
+
+Key of the request that confirmed a payment, so a retried confirmation
+returns the original result (services/payment_service.py).
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 18:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # Already there on databases created by init_db()
+    if 'idempotency_key' not in {column['name'] for column in inspector.get_columns('payments')}:
+        # Nullable without a default: no table rewrite, and the constraint's index starts empty
+        op.add_column('payments', sa.Column('idempotency_key', sa.String(length=255), nullable=True))
+    constraints = {constraint['name'] for constraint in inspector.get_unique_constraints('payments')}
+    if 'payments_idempotency_key_key' not in constraints:
+        op.create_unique_constraint('payments_idempotency_key_key', 'payments', ['idempotency_key'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('payments_idempotency_key_key', 'payments', type_='unique')
+    op.drop_column('payments', 'idempotency_key')
@@ -0,0 +1,43 @@
+"""payment amount slots
+
+Unique cent suffixes held by open on-chain payments
+(services/amount_slots.py).
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table('payment_amount_slots'):
+        return
+
+    op.create_table('payment_amount_slots',
+    sa.Column('network', sa.String(length=20), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('payment_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['payment_id'], ['payments.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('network', 'amount'),
+    sa.UniqueConstraint('payment_id')
+    )
+    op.create_index(op.f('ix_payment_amount_slots_user_id'), 'payment_amount_slots', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_payment_amount_slots_user_id'), table_name='payment_amount_slots')
+    op.drop_table('payment_amount_slots')
@@ -0,0 +1,38 @@
+"""subscription removal pending
+
+Expired subscriptions whose member still has to be removed from the channel
+(bot/channel_workers.py), so removals survive a restart or a leadership
+change.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 20:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('subscriptions')}
+    if 'removal_pending' not in columns:
+        # Constant default: no table rewrite
+        op.add_column('subscriptions', sa.Column('removal_pending', sa.Boolean(), server_default='false',
+                                                 nullable=False))
+    op.create_index('ix_subscriptions_removal_pending', 'subscriptions', ['id'], unique=False,
+                    postgresql_where=sa.text('removal_pending'), if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_subscriptions_removal_pending', table_name='subscriptions',
+                  postgresql_where=sa.text('removal_pending'))
+    op.drop_column('subscriptions', 'removal_pending')
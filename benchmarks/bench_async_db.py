@@ -0,0 +1,91 @@
+"""
+Benchmark: concurrent update throughput, sync vs async database layer
+
+Simulates N bot updates processed concurrently on one event loop. Each update
+performs the lookups a typical callback does (user by telegram id + active
+subscription check). The sync run calls the blocking services directly on the
+loop (the old handler behaviour); the async run uses the asyncpg engine.
+
+Usage:
+    python -m benchmarks.bench_async_db --updates 500 --concurrency 50 --delay-ms 5
+
+--delay-ms adds a server-side pg_sleep per update to model a slow round trip
+(PostgreSQL only).
+"""
+import sys
+import os
+import argparse
+import asyncio
+import time
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database.base import init_db, get_session, get_async_session, engine, async_engine
+from services.user_service import UserService
+from services.subscription_service import SubscriptionService
+
+BENCH_TELEGRAM_ID = -424242
+
+
+def _delay_sql(delay_ms: float):
+    if delay_ms <= 0 or engine.dialect.name != "postgresql":
+        return None
+    return text(f"SELECT pg_sleep({delay_ms / 1000.0})")
+
+
+async def _sync_update(delay_sql):
+    user = UserService.get_user_by_telegram_id(BENCH_TELEGRAM_ID)
+    SubscriptionService.has_active_subscription(user.id)
+    if delay_sql is not None:
+        with get_session() as session:
+            session.execute(delay_sql)
+
+
+async def _async_update(delay_sql):
+    user = await UserService.get_user_by_telegram_id_async(BENCH_TELEGRAM_ID)
+    await SubscriptionService.has_active_subscription_async(user.id)
+    if delay_sql is not None:
+        async with get_async_session() as session:
+            await session.execute(delay_sql)
+
+
+async def _run(update_fn, updates: int, concurrency: int, delay_sql) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await update_fn(delay_sql)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(updates)))
+    return time.perf_counter() - start
+
+
+async def main(updates: int, concurrency: int, delay_ms: float):
+    init_db()
+    UserService.get_or_create_user(BENCH_TELEGRAM_ID, username="bench")
+    delay_sql = _delay_sql(delay_ms)
+    if delay_ms > 0 and delay_sql is None:
+        print("--delay-ms ignored: pg_sleep requires PostgreSQL")
+
+    # Warm up both connection pools
+    await _run(_sync_update, concurrency, concurrency, None)
+    await _run(_async_update, concurrency, concurrency, None)
+
+    print(f"updates={updates} concurrency={concurrency} delay_ms={delay_ms}")
+    for name, fn in (("sync", _sync_update), ("async", _async_update)):
+        elapsed = await _run(fn, updates, concurrency, delay_sql)
+        print(f"{name:>5}: {elapsed:8.3f}s  {updates / elapsed:10.1f} updates/sec")
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--delay-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.updates, args.concurrency, args.delay_ms))
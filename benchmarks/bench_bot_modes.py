@@ -0,0 +1,212 @@
+"""
+Load test: long polling vs webhook (with N workers)
+
+Starts the fake Bot API (benchmarks/fake_bot_api.py) in this process and runs
+the real bot entry point (python -m bot.main) against it in a subprocess:
+
+  * polling - updates are queued on the fake API and fetched with getUpdates
+  * webhook - updates are POSTed to the bot's webhook endpoint with the
+              secret token header, --concurrency requests in flight
+
+Every update is a "plans" callback; it is done when the bot answers the
+callback query. Reports updates/sec and p50/p95 latency per mode, either at
+saturation (default) or at a fixed offered --rate. Send-queue
+rate limits are lifted for the run so the bot, not the shaper, is measured.
+
+Requires a reachable database (DATABASE_URL) and the usual bot settings.
+
+Usage:
+    python -m benchmarks.bench_bot_modes --updates 2000 --workers 1 2 4
+    python -m benchmarks.bench_bot_modes --updates 1000 --rate 50
+"""
+import sys
+import os
+import argparse
+import asyncio
+import signal
+import statistics
+import subprocess
+import time
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from benchmarks.fake_bot_api import FakeBotAPI
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEBHOOK_PATH = "/telegram/webhook"
+WEBHOOK_SECRET = "bench-secret"
+WARMUP_UPDATES = 100
+
+
+def bot_env(args, **overrides) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_API_SERVER": f"http://127.0.0.1:{args.api_port}",
+        "TELEGRAM_GLOBAL_RATE": "1000000",
+        "TELEGRAM_PER_CHAT_RATE": "1000000",
+        "TELEGRAM_PER_CHAT_BURST": "1000000",
+        "LOG_LEVEL": "WARNING",
+    })
+    env.update({key: str(value) for key, value in overrides.items()})
+    return env
+
+
+def start_bot(env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", "bot.main"], cwd=PROJECT_ROOT, env=env)
+
+
+def stop_bot(process: subprocess.Popen):
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def make_updates(api: FakeBotAPI, count: int, users: int) -> list:
+    return [api.callback_update(5_000_000 + i % users, "plans") for i in range(count)]
+
+
+def summarize(name: str, count: int, elapsed: float, latencies: list):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+    print(
+        f"{name:>12}: {count / elapsed:8.1f} updates/s  ({count} in {elapsed:.2f}s)  "
+        f"latency p50={statistics.median(latencies) * 1000:7.1f}ms p95={p95 * 1000:7.1f}ms"
+    )
+
+
+async def paced(updates: list, rate: float, send):
+    """Call send(update) for every update, at ``rate`` per second (0 = all at once)"""
+    if not rate:
+        await send(updates)
+        return
+    start = time.perf_counter()
+    tasks = []
+    for index, update in enumerate(updates):
+        delay = start + index / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send([update])))
+    await asyncio.gather(*tasks)
+
+
+async def run_polling(api: FakeBotAPI, args):
+    process = start_bot(bot_env(args, BOT_MODE="polling"))
+    try:
+        await asyncio.wait_for(api.polling.wait(), 60)
+
+        api.enqueue(make_updates(api, WARMUP_UPDATES, args.users))
+        await api.wait_answered(api.answered + WARMUP_UPDATES, 60)
+
+        api.latencies.clear()
+        target = api.answered + args.updates
+        start = time.perf_counter()
+
+        async def send(updates):
+            api.enqueue(updates)
+
+        await paced(make_updates(api, args.updates, args.users), args.rate, send)
+        await api.wait_answered(target, args.timeout)
+        summarize("polling", args.updates, time.perf_counter() - start, api.latencies)
+    finally:
+        stop_bot(process)
+
+
+async def post_updates(session: aiohttp.ClientSession, api: FakeBotAPI, url: str, updates: list, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET}
+
+    async def post(update: dict):
+        async with semaphore:
+            api.mark_sent(update)
+            async with session.post(url, json=update, headers=headers) as response:
+                response.raise_for_status()
+
+    await asyncio.gather(*(post(update) for update in updates))
+
+
+async def wait_for_webhook(session: aiohttp.ClientSession, url: str, timeout: float) -> int:
+    """Wait until the endpoint is up; returns the status for a wrong secret token"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.post(url, json={}, headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as response:
+                return response.status
+        except aiohttp.ClientConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def run_webhook(api: FakeBotAPI, args, workers: int):
+    process = start_bot(bot_env(
+        args,
+        BOT_MODE="webhook",
+        WEBHOOK_URL=f"http://127.0.0.1:{args.webhook_port}",
+        WEBHOOK_PATH=WEBHOOK_PATH,
+        WEBHOOK_SECRET=WEBHOOK_SECRET,
+        WEBHOOK_HOST="127.0.0.1",
+        WEBHOOK_PORT=args.webhook_port,
+        WEBHOOK_WORKERS=workers,
+    ))
+    url = f"http://127.0.0.1:{args.webhook_port}{WEBHOOK_PATH}"
+    try:
+        async with aiohttp.ClientSession() as session:
+            status = await wait_for_webhook(session, url, 60)
+            if status != 401:
+                print(f"  warning: wrong secret token answered {status}, expected 401")
+            # Give every worker time to bind the shared port
+            await asyncio.sleep(2 * workers)
+
+            warmup = make_updates(api, WARMUP_UPDATES * workers, args.users)
+            target = api.answered + len(warmup)
+            await post_updates(session, api, url, warmup, args.concurrency)
+            await api.wait_answered(target, 60)
+
+            api.latencies.clear()
+            target = api.answered + args.updates
+            start = time.perf_counter()
+
+            async def send(updates):
+                await post_updates(session, api, url, updates, args.concurrency)
+
+            await paced(make_updates(api, args.updates, args.users), args.rate, send)
+            await api.wait_answered(target, args.timeout)
+            summarize(f"webhook x{workers}", args.updates, time.perf_counter() - start, api.latencies)
+    finally:
+        stop_bot(process)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200, help="distinct users sending updates")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2], help="webhook worker counts to test")
+    parser.add_argument("--concurrency", type=int, default=64, help="webhook requests in flight")
+    parser.add_argument("--rate", type=float, default=0, help="offered updates/sec (0 = send everything at once)")
+    parser.add_argument("--api-port", type=int, default=8090)
+    parser.add_argument("--webhook-port", type=int, default=8095)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--skip-polling", action="store_true")
+    args = parser.parse_args()
+
+    api = FakeBotAPI()
+    runner = await api.start("127.0.0.1", args.api_port)
+    print(f"updates={args.updates} users={args.users} concurrency={args.concurrency} "
+          f"rate={args.rate or 'max'} cpus={os.cpu_count()}")
+    try:
+        if not args.skip_polling:
+            await run_polling(api, args)
+        for workers in args.workers:
+            await run_webhook(api, args, workers)
+        print(f"fake API calls: {dict(api.calls)}")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
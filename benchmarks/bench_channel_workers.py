@@ -0,0 +1,136 @@
+"""
+Benchmark: serial vs pooled channel removals
+
+Removes N expired members through a fake Bot API session that adds a fixed
+latency to every call and can answer with flood control (429 retry_after).
+The serial run is the old expiry loop (ban, then notify, one member at a
+time); the pooled run goes through ChannelWorkerPool with its rate limits.
+
+Usage:
+    python -m benchmarks.bench_channel_workers --members 500 --latency-ms 150 --workers 8
+    python -m benchmarks.bench_channel_workers --flood-every 200
+"""
+import sys
+import os
+import argparse
+import asyncio
+import datetime
+import time
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message
+from bot.channel_manager import ChannelManager
+from bot.channel_workers import ChannelWorkerPool, REMOVAL_NOTICE
+from utils.rate_limit import TelegramRateLimiter
+
+
+class FakeBotSession(BaseSession):
+    """Bot API stand-in with fixed latency and optional flood control"""
+
+    def __init__(self, latency: float, flood_every: int, retry_after: int):
+        super().__init__()
+        self.latency = latency
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.calls = 0
+        self.floods = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.flood_every and self.calls % self.flood_every == 0:
+            self.floods += 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=self.retry_after)
+        if isinstance(method, SendMessage):
+            return Message(message_id=1, date=datetime.datetime.now(), chat=Chat(id=method.chat_id, type="private"), text=method.text)
+        return True
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+
+async def run_serial(bot: Bot, members: list) -> dict:
+    channel_manager = ChannelManager(bot)
+    removed = 0
+    start = time.perf_counter()
+    for telegram_id in members:
+        try:
+            if await channel_manager.remove_user(telegram_id):
+                removed += 1
+            await bot.send_message(telegram_id, REMOVAL_NOTICE)
+        except Exception:
+            pass
+    return {"seconds": time.perf_counter() - start, "removed": removed}
+
+
+async def run_pool(bot: Bot, members: list, args) -> dict:
+    channel_manager = ChannelManager(bot)
+    limiter = TelegramRateLimiter(global_rate=args.global_rate, per_chat_rate=1.0)
+    limiter.set_chat_rate(channel_manager.channel_id, args.channel_rate)
+    pool = ChannelWorkerPool(
+        bot=bot,
+        channel_manager=channel_manager,
+        limiter=limiter,
+        workers=args.workers,
+        queue_size=len(members),
+        max_retries=5,
+        progress_every=0,
+    )
+    pool.start()
+    start = time.perf_counter()
+    for telegram_id in members:
+        await pool.submit_removal(telegram_id)
+    await pool.join()
+    elapsed = time.perf_counter() - start
+    stats = pool.stats()
+    await pool.stop()
+    return {"seconds": elapsed, "removed": stats["removed"], "stats": stats}
+
+
+def report(name: str, result: dict, session: FakeBotSession):
+    rate = result["removed"] / result["seconds"] if result["seconds"] else 0.0
+    print(
+        f"{name:>6}: {result['seconds']:7.2f}s  removed={result['removed']:>6}  "
+        f"{rate:7.1f} members/s  api_calls={session.calls}  flood_429s={session.floods}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="simulated Bot API round trip")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--global-rate", type=float, default=25.0)
+    parser.add_argument("--channel-rate", type=float, default=20.0)
+    parser.add_argument("--flood-every", type=int, default=0, help="answer every Nth call with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--skip-serial", action="store_true")
+    args = parser.parse_args()
+
+    members = list(range(1_000_000, 1_000_000 + args.members))
+    print(f"members={args.members} latency={args.latency_ms}ms workers={args.workers} "
+          f"global_rate={args.global_rate}/s channel_rate={args.channel_rate}/s flood_every={args.flood_every}")
+
+    if not args.skip_serial:
+        session = FakeBotSession(args.latency_ms / 1000.0, args.flood_every, args.retry_after)
+        bot = Bot(token="123456:ABCDEF", session=session)
+        report("serial", await run_serial(bot, members), session)
+
+    session = FakeBotSession(args.latency_ms / 1000.0, args.flood_every, args.retry_after)
+    bot = Bot(token="123456:ABCDEF", session=session)
+    result = await run_pool(bot, members, args)
+    report("pool", result, session)
+    print(f"  pool stats: {result['stats']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,226 @@
+"""
+Load test: the bot's Dispatcher under a realistic update mix
+
+Builds the real Bot and Dispatcher (bot.main.create_bot / create_dispatcher)
+in this process, pointed at the fake Bot API (benchmarks/fake_bot_api.py),
+and drives them with a scripted mix of updates from --users users:
+
+    /start, plans browsing (plans, plan_<id>), pay flows (pay_<id>,
+    pay_network_<id>_TRC20), my_subscriptions, referral screens
+    (referral, referral_stats)
+
+Modes:
+  * direct  - --concurrency workers call dp.feed_update() back to back;
+              latency is the whole update: middlewares, handler, database
+              and Bot API calls
+  * polling - dp.start_polling() fetches the script through the fake
+              getUpdates; latency runs from the getUpdates answer to the end
+              of the update's handling
+
+Reports updates/sec and p50/p95/p99 latency, overall and per update kind,
+plus the Bot API calls made. Every user sends /start once before the
+measured run. The fake API can add --latency/--jitter and answer a
+--rate-limited share of chat calls with 429, which the send queue retries.
+Send queue rate limits are lifted unless --keep-rate-limits is given.
+
+The pay_network updates create payments, so run against a scratch database
+(DATABASE_URL) with at least one active plan.
+
+Usage:
+    python -m benchmarks.bench_dispatcher --updates 2000 --users 500
+    python -m benchmarks.bench_dispatcher --mode polling --latency 0.03 --rate-limited 0.01
+"""
+import sys
+import os
+import argparse
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import defaultdict
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+FIRST_USER_ID = 6_000_000
+
+# (kind, weight) of the scripted mix
+MIX = [
+    ("start", 15),
+    ("plans", 25),
+    ("plan", 15),
+    ("pay", 8),
+    ("pay_network", 4),
+    ("my_subscriptions", 10),
+    ("referral", 15),
+    ("referral_stats", 8),
+]
+
+
+def make_update(api: FakeBotAPI, kind: str, user_id: int, plan_ids: list) -> dict:
+    plan_id = random.choice(plan_ids)
+    if kind == "start":
+        return api.message_update(user_id, "/start")
+    data = {
+        "plan": f"plan_{plan_id}",
+        "pay": f"pay_{plan_id}",
+        "pay_network": f"pay_network_{plan_id}_TRC20",
+    }.get(kind, kind)
+    return api.callback_update(user_id, data)
+
+
+def scripted_updates(api: FakeBotAPI, count: int, users: int, plan_ids: list, kinds: dict):
+    """Yield ``count`` updates drawn from MIX, remembering each update's kind"""
+    names = [kind for kind, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    for _ in range(count):
+        kind = random.choices(names, weights)[0]
+        update = make_update(api, kind, FIRST_USER_ID + random.randrange(users), plan_ids)
+        kinds[update["update_id"]] = kind
+        yield update
+
+
+def percentile(values: list, share: float) -> float:
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+
+def report(title: str, latencies: dict, elapsed: float):
+    everything = sorted(value for values in latencies.values() for value in values)
+    print(f"\n{title}: {len(everything)} updates in {elapsed:.2f}s = {len(everything) / elapsed:.1f} updates/s")
+    print(f"{'kind':18} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    rows = [("all", everything)] + [(kind, sorted(latencies[kind])) for kind, _ in MIX if latencies[kind]]
+    for kind, values in rows:
+        print(f"{kind:18} {len(values):>6} {percentile(values, 0.50) * 1000:8.1f} "
+              f"{percentile(values, 0.95) * 1000:8.1f} {percentile(values, 0.99) * 1000:8.1f}")
+
+
+async def run_direct(bot, dp, updates, kinds: dict, concurrency: int) -> dict:
+    from aiogram.types import Update
+
+    latencies = defaultdict(list)
+
+    async def worker():
+        for data in updates:
+            update = Update.model_validate(data, context={"bot": bot})
+            started = time.perf_counter()
+            await dp.feed_update(bot, update)
+            latencies[kinds.pop(update.update_id)].append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+async def run_polling(api: FakeBotAPI, bot, dp, updates, kinds: dict, count: int, timeout: float) -> dict:
+    latencies = defaultdict(list)
+    done = asyncio.Event()
+
+    async def timing(handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            handed_out = api.handed_out.pop(event.update_id, None)
+            kind = kinds.pop(event.update_id, None)
+            if handed_out is not None and kind is not None:
+                latencies[kind].append(time.perf_counter() - handed_out)
+                if sum(len(values) for values in latencies.values()) >= count:
+                    done.set()
+
+    dp.update.outer_middleware(timing)
+    api.script(updates)
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False))
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    finally:
+        await dp.stop_polling()
+        await asyncio.gather(polling, return_exceptions=True)
+    return latencies
+
+
+async def main_async(args):
+    from bot.main import create_bot, create_dispatcher
+    from bot.send_queue import send_queue
+    from database.base import async_engine
+    from services.plan_service import PlanService
+
+    # aiogram logs every handled update at INFO
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    plan_ids = [plan.id for plan in await PlanService.get_active_plans_async()]
+    if not plan_ids:
+        sys.exit("No active plans in the database")
+
+    random.seed(args.seed)
+    api = FakeBotAPI()
+    runner = await api.start("127.0.0.1", args.api_port)
+    bot = create_bot()
+    dp = create_dispatcher()
+    try:
+        # Returning users: everyone has a database row before the measured run
+        warmup_kinds = {}
+        warmup = [api.message_update(FIRST_USER_ID + user, "/start") for user in range(args.users)]
+        for update in warmup:
+            warmup_kinds[update["update_id"]] = "start"
+        await run_direct(bot, dp, iter(warmup), warmup_kinds, args.concurrency)
+
+        api.calls.clear()
+        api.latency, api.jitter = args.latency, args.jitter
+        api.rate_limited, api.retry_after = args.rate_limited, args.retry_after
+
+        kinds = {}
+        updates = scripted_updates(api, args.updates, args.users, plan_ids, kinds)
+        started = time.perf_counter()
+        if args.mode == "direct":
+            latencies = await run_direct(bot, dp, updates, kinds, args.concurrency)
+        else:
+            latencies = await run_polling(api, bot, dp, updates, kinds, args.updates, args.timeout)
+        elapsed = time.perf_counter() - started
+    finally:
+        await send_queue.close()
+        await bot.session.close()
+        await runner.cleanup()
+        await async_engine.dispose()
+
+    report(
+        f"{args.mode if args.mode == 'polling' else f'direct (concurrency={args.concurrency})'} "
+        f"(users={args.users}, api latency={args.latency * 1000:.0f}ms"
+        f"+{args.jitter * 1000:.0f}ms, 429 share={args.rate_limited})",
+        latencies, elapsed,
+    )
+    print(f"\nBot API calls: {dict(api.calls)}")
+    if api.rejected:
+        print(f"Injected 429s: {dict(api.rejected)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["direct", "polling"], default="direct")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500, help="distinct users sending updates")
+    parser.add_argument("--concurrency", type=int, default=32, help="updates in flight (direct mode)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake API adds to every call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds per call")
+    parser.add_argument("--rate-limited", type=float, default=0.0, help="share of chat calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--keep-rate-limits", action="store_true", help="keep the send queue rate limits")
+    parser.add_argument("--api-port", type=int, default=8096)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # Settings are read at import time, so configure them before importing the bot
+    os.environ["TELEGRAM_API_SERVER"] = f"http://127.0.0.1:{args.api_port}"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if not args.keep_rate_limits:
+        os.environ.update({
+            "TELEGRAM_GLOBAL_RATE": "1000000",
+            "TELEGRAM_PER_CHAT_RATE": "1000000",
+            "TELEGRAM_PER_CHAT_BURST": "1000000",
+            "CHANNEL_ADMIN_RATE": "1000000",
+        })
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
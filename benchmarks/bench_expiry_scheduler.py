@@ -0,0 +1,179 @@
+"""
+Benchmark: hourly expiry polling vs the deadline-driven expiry scheduler
+
+Simulation (default): generates N synthetic subscriptions with end dates spread
+over the next --days days and replays --hours of wall time against both
+strategies:
+
+  * polling   - every hour, walk every live subscription and expire the
+                overdue ones (the old check_expired_subscriptions loop)
+  * scheduler - keep the next --batch deadlines in a heap loaded in keyset
+                batches from a sorted index, fire each one at its deadline
+
+It reports rows examined, CPU time and the delay between a subscription's
+end_date and its removal.
+
+--db additionally times the real queries on PostgreSQL, using a temporary
+1M-row copy of the subscriptions layout: the old unindexed overdue scan vs
+one keyset batch load over (status, end_date).
+
+Usage:
+    python -m benchmarks.bench_expiry_scheduler --subscriptions 1000000 --hours 24
+    python -m benchmarks.bench_expiry_scheduler --db
+"""
+import sys
+import os
+import argparse
+import heapq
+import random
+import statistics
+import time
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+POLL_INTERVAL = 3600
+FIRE_DELAY = 1.0
+
+
+def generate_deadlines(count: int, days: int, seed: int) -> list:
+    rng = random.Random(seed)
+    span = days * 86400
+    return [rng.uniform(0, span) for _ in range(count)]
+
+
+def simulate_polling(deadlines: list, hours: int) -> dict:
+    live = list(deadlines)
+    examined = 0
+    delays = []
+    start = time.process_time()
+    for tick in range(1, hours + 1):
+        now = tick * POLL_INTERVAL
+        examined += len(live)
+        still_live = []
+        for deadline in live:
+            if deadline < now:
+                delays.append(now - deadline)
+            else:
+                still_live.append(deadline)
+        live = still_live
+    return {
+        "cpu_seconds": time.process_time() - start,
+        "rows_examined": examined,
+        "expired": len(delays),
+        "delays": delays,
+    }
+
+
+def simulate_scheduler(deadlines: list, hours: int, batch_size: int) -> dict:
+    index = sorted(deadlines)  # stands in for the (status, end_date) index
+    end = hours * POLL_INTERVAL
+    heap = []
+    cursor = 0
+    examined = 0
+    delays = []
+    start = time.process_time()
+    while True:
+        if not heap:
+            if cursor >= len(index):
+                break
+            batch = index[cursor:cursor + batch_size]
+            cursor += len(batch)
+            examined += len(batch)
+            for deadline in batch:
+                heapq.heappush(heap, deadline)
+
+        due = heap[0]
+        fire_at = due + FIRE_DELAY
+        if fire_at > end:
+            break
+        # Everything due at fire time is expired by one set-based statement
+        while heap and heap[0] <= due:
+            delays.append(fire_at - heapq.heappop(heap))
+    return {
+        "cpu_seconds": time.process_time() - start,
+        "rows_examined": examined,
+        "expired": len(delays),
+        "delays": delays,
+    }
+
+
+def report(name: str, result: dict):
+    delays = result["delays"]
+    mean_delay = statistics.fmean(delays) if delays else 0.0
+    max_delay = max(delays) if delays else 0.0
+    print(
+        f"{name:>9}: cpu={result['cpu_seconds']:7.3f}s  rows_examined={result['rows_examined']:>12,}  "
+        f"expired={result['expired']:>9,}  delay mean={mean_delay:8.1f}s max={max_delay:8.1f}s"
+    )
+
+
+def run_db(count: int, batch_size: int):
+    from sqlalchemy import text
+    from database.base import engine
+
+    if engine.dialect.name != "postgresql":
+        print("--db requires PostgreSQL")
+        return
+
+    with engine.connect() as conn:
+        conn.execute(text(
+            "CREATE TEMP TABLE bench_subscriptions ("
+            " id serial PRIMARY KEY, user_id integer NOT NULL, status text NOT NULL,"
+            " end_date timestamptz NOT NULL)"
+        ))
+        conn.execute(text(
+            "INSERT INTO bench_subscriptions (user_id, status, end_date) "
+            "SELECT g, CASE WHEN g % 10 < 7 THEN 'ACTIVE' WHEN g % 10 < 8 THEN 'TRIAL' ELSE 'EXPIRED' END, "
+            "now() - interval '1 hour' + (random() * interval '30 days') "
+            "FROM generate_series(1, :n) g"
+        ), {"n": count})
+        conn.execute(text("ANALYZE bench_subscriptions"))
+
+        def timed(sql: str, params: dict = None, runs: int = 5) -> float:
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                conn.execute(text(sql), params or {}).fetchall()
+                timings.append(time.perf_counter() - start)
+            return statistics.median(timings) * 1000
+
+        poll_sql = (
+            "SELECT id, user_id FROM bench_subscriptions "
+            "WHERE status IN ('ACTIVE', 'TRIAL') AND end_date < now()"
+        )
+        batch_sql = (
+            "SELECT end_date, id FROM bench_subscriptions WHERE status IN ('ACTIVE', 'TRIAL') "
+            "ORDER BY end_date, id LIMIT :limit"
+        )
+
+        print(f"db: {count:,} rows, median of 5 runs")
+        print(f"  hourly overdue scan (no index):      {timed(poll_sql):9.2f} ms")
+        conn.execute(text("CREATE INDEX ON bench_subscriptions (status, end_date)"))
+        conn.execute(text("ANALYZE bench_subscriptions"))
+        print(f"  overdue scan with (status, end_date): {timed(poll_sql):9.2f} ms")
+        print(f"  scheduler batch load ({batch_size} rows):     {timed(batch_sql, {'limit': batch_size}):9.2f} ms")
+        conn.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscriptions", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=30, help="spread of end dates")
+    parser.add_argument("--hours", type=int, default=24, help="simulated wall time")
+    parser.add_argument("--batch", type=int, default=1000, help="scheduler heap batch size")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", action="store_true", help="also time the queries on PostgreSQL")
+    args = parser.parse_args()
+
+    deadlines = generate_deadlines(args.subscriptions, args.days, args.seed)
+    print(f"subscriptions={args.subscriptions:,} days={args.days} simulated_hours={args.hours} batch={args.batch}")
+    report("polling", simulate_polling(deadlines, args.hours))
+    report("scheduler", simulate_scheduler(deadlines, args.hours, args.batch))
+
+    if args.db:
+        run_db(args.subscriptions, args.batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Benchmark: EXPLAIN ANALYZE of the hot service queries before and after the
+index migration (alembic revision 0002)
+
+Builds the schema in a scratch PostgreSQL schema with the real migrations,
+seeds it with generate_series (--users users, about five subscriptions,
+three payments and one referral each), then times every query at the
+baseline revision and again after upgrading to head. Each query reports the
+median server-side execution time over --runs runs and the scans chosen by
+the planner. Statements that write run inside a savepoint that is rolled
+back.
+
+Usage:
+    python -m benchmarks.bench_query_plans --users 200000
+    python -m benchmarks.bench_query_plans --keep   # leave the scratch schema in place
+"""
+import sys
+import os
+import argparse
+import json
+import statistics
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import text
+from database.base import engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA = "bench_query_plans"
+BASELINE_REVISION = "0001"
+
+SEED_SQL = [
+    "SELECT setseed(0.42)",
+    """
+    INSERT INTO plans (name, duration, duration_days, price, currency, is_active)
+    VALUES ('1 Month', 'MONTHLY', 30, 30, 'USDT', true), ('3 Months', 'MONTHLY', 90, 80, 'USDT', true),
+           ('6 Months', 'MONTHLY', 180, 150, 'USDT', true), ('Legacy', 'YEARLY', 365, 280, 'USDT', false)
+    """,
+    """
+    INSERT INTO users (telegram_id, referral_code, free_trial_used, points_balance, created_at)
+    SELECT 100000000 + g, 'U' || g, random() < 0.6, 0, now() - g * interval '1 minute'
+    FROM generate_series(1, :users) g
+    """,
+    # ~80% expired, 3% cancelled, 12% active, 5% trial; 1% of the live ones overdue
+    """
+    INSERT INTO subscriptions (user_id, plan_id, status, start_date, end_date, is_trial, created_at, updated_at)
+    SELECT user_id, 1 + (g % 3), status::subscriptionstatus, end_date - interval '30 days', end_date,
+           status = 'TRIAL', end_date - interval '30 days', end_date - interval '30 days' * random()
+    FROM (
+        SELECT g, 1 + (g % :users) AS user_id, r,
+               CASE WHEN r < 0.80 THEN 'EXPIRED' WHEN r < 0.83 THEN 'CANCELLED'
+                    WHEN r < 0.95 THEN 'ACTIVE' ELSE 'TRIAL' END AS status,
+               CASE WHEN r < 0.83 THEN now() - random() * interval '365 days'
+                    WHEN random() < 0.01 THEN now() - random() * interval '1 hour'
+                    ELSE now() + random() * interval '30 days' END AS end_date
+        FROM (SELECT g, random() AS r FROM generate_series(1, :users * 5) g) s
+    ) t
+    """,
+    # ~90% completed, 4% pending, 5% failed, 1% refunded
+    """
+    INSERT INTO payments (user_id, plan_id, amount, currency, network, status, provider, created_at)
+    SELECT 1 + (g % :users), 1 + (g % 3), 30, 'USDT', 'TRC20',
+           (CASE WHEN r < 0.90 THEN 'COMPLETED' WHEN r < 0.94 THEN 'PENDING'
+                 WHEN r < 0.99 THEN 'FAILED' ELSE 'REFUNDED' END)::paymentstatus,
+           'manual', now() - random() * interval '365 days'
+    FROM (SELECT g, random() AS r FROM generate_series(1, :users * 3) g) s
+    """,
+    """
+    INSERT INTO referrals (referrer_id, referred_id, points_awarded)
+    SELECT 1 + (g * 7919 % :users), 1 + g % :users, 10
+    FROM generate_series(1, :users) g
+    """,
+    "ANALYZE",
+]
+
+# (name, statement) pairs mirroring the service and admin panel queries
+QUERIES = [
+    ("active subscription of user",
+     "SELECT * FROM subscriptions WHERE user_id = :user_id AND status = 'ACTIVE' LIMIT 1"),
+    ("trial subscription of user",
+     "SELECT * FROM subscriptions WHERE user_id = :user_id AND status = 'TRIAL' LIMIT 1"),
+    ("subscriptions of user",
+     "SELECT * FROM subscriptions WHERE user_id = :user_id ORDER BY created_at DESC"),
+    ("expiry: upcoming deadlines",
+     "SELECT end_date, id FROM subscriptions WHERE status IN ('ACTIVE', 'TRIAL') "
+     "ORDER BY end_date, id LIMIT 1000"),
+    ("expiry: expire overdue",
+     "UPDATE subscriptions SET status = 'EXPIRED', updated_at = now() FROM users "
+     "WHERE subscriptions.user_id = users.id AND subscriptions.status IN ('ACTIVE', 'TRIAL') "
+     "AND subscriptions.end_date < now() RETURNING subscriptions.id, users.telegram_id"),
+    ("recently expired subscriptions",
+     "SELECT id, user_id FROM subscriptions WHERE status = 'EXPIRED' ORDER BY updated_at DESC LIMIT 100"),
+    ("dashboard: active subscriptions",
+     "SELECT count(*) FROM subscriptions WHERE status = 'ACTIVE'"),
+    ("dashboard: pending payments",
+     "SELECT count(*) FROM payments WHERE status = 'PENDING'"),
+    ("dashboard: revenue",
+     "SELECT sum(amount) FROM payments WHERE status = 'COMPLETED'"),
+    ("pending payments of user",
+     "SELECT * FROM payments WHERE user_id = :user_id AND status = 'PENDING'"),
+    ("payments of user",
+     "SELECT * FROM payments WHERE user_id = :user_id ORDER BY created_at DESC"),
+    ("referral exists",
+     "SELECT * FROM referrals WHERE referrer_id = :referrer_id AND referred_id = :user_id LIMIT 1"),
+    ("referral count",
+     "SELECT count(id) FROM referrals WHERE referrer_id = :referrer_id"),
+    ("active plans",
+     "SELECT * FROM plans WHERE is_active = true"),
+]
+
+
+def scans(plan: dict) -> list:
+    """Scan nodes of a JSON plan, e.g. 'Index Scan ix_payments_user_id_status'"""
+    found = []
+    if "Scan" in plan["Node Type"]:
+        found.append(f"{plan['Node Type']} {plan.get('Index Name', plan.get('Relation Name', ''))}".strip())
+    for child in plan.get("Plans", []):
+        found.extend(scans(child))
+    return found
+
+
+def explain(conn, sql: str, params: dict, runs: int) -> tuple:
+    times = []
+    plan = None
+    for _ in range(runs):
+        savepoint = conn.begin_nested()
+        result = conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"), params).scalar()
+        savepoint.rollback()
+        if isinstance(result, str):
+            result = json.loads(result)
+        times.append(result[0]["Execution Time"])
+        plan = result[0]["Plan"]
+    return statistics.median(times), scans(plan)
+
+
+def measure(conn, params: dict, runs: int) -> dict:
+    return {name: explain(conn, sql, params, runs) for name, sql in QUERIES}
+
+
+def migrate(conn, revision: str):
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.attributes["connection"] = conn
+    # Alembic needs to own the transaction (0002 builds indexes outside of one)
+    conn.commit()
+    command.upgrade(config, revision)
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--runs", type=int, default=5, help="EXPLAIN ANALYZE runs per query")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema")
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        # Session-wide, so it survives the commits made by the migrations
+        conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        conn.commit()
+        try:
+            migrate(conn, BASELINE_REVISION)
+            for sql in SEED_SQL:
+                conn.execute(text(sql), {"users": args.users})
+            conn.commit()
+            params = {"user_id": args.users // 2, "referrer_id": 1 + (args.users // 2 * 7919 % args.users)}
+
+            before = measure(conn, params, args.runs)
+            migrate(conn, "head")
+            conn.execute(text("ANALYZE"))
+            conn.commit()
+            after = measure(conn, params, args.runs)
+        finally:
+            conn.rollback()
+            if not args.keep:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+                conn.commit()
+
+    print(f"\nusers={args.users:,} subscriptions={args.users * 5:,} payments={args.users * 3:,} "
+          f"referrals={args.users:,}, median of {args.runs} runs (server execution time)")
+    print(f"{'query':34} {'0001 ms':>9} {'head ms':>9}  plan at head")
+    for name, _ in QUERIES:
+        before_ms, _ = before[name]
+        after_ms, after_scans = after[name]
+        print(f"{name:34} {before_ms:9.2f} {after_ms:9.2f}  {', '.join(after_scans)}")
+    print("\nplans at 0001:")
+    for name, _ in QUERIES:
+        print(f"  {name:32} {', '.join(before[name][1])}")
+
+
+if __name__ == "__main__":
+    main()
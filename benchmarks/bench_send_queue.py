@@ -0,0 +1,152 @@
+"""
+Benchmark: unshaped sends vs the global priority send queue
+
+Fires a broadcast of --broadcast LOW-priority notices to distinct chats and,
+while it is in flight, --urgent HIGH-priority messages (payment
+confirmations). The fake Bot API enforces a global limit of --server-limit
+calls per second and answers anything above it with 429 retry_after=1.
+
+Without the queue, every call goes out at once: most of the broadcast is
+rejected and lost, and urgent messages compete with it. With the queue,
+calls are shaped under the limit, urgent messages overtake the backlog, and
+rejected calls are retried.
+
+Usage:
+    python -m benchmarks.bench_send_queue --broadcast 300 --urgent 20
+"""
+import sys
+import os
+import argparse
+import asyncio
+import datetime
+import statistics
+import time
+from collections import deque
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Chat, Message
+from bot.send_queue import SendPriority, SendQueue, send_priority
+from utils.rate_limit import TelegramRateLimiter
+
+
+class FloodLimitedSession(BaseSession):
+    """Fake Bot API with a sliding one-second global limit"""
+
+    def __init__(self, latency: float, limit: int):
+        super().__init__()
+        self.latency = latency
+        self.limit = limit
+        self._window = deque()
+        self.calls = 0
+        self.floods = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        now = time.monotonic()
+        while self._window and self._window[0] < now - 1.0:
+            self._window.popleft()
+        if len(self._window) >= self.limit:
+            self.floods += 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+        self._window.append(now)
+        await asyncio.sleep(self.latency)
+        return Message(message_id=1, date=datetime.datetime.now(), chat=Chat(id=method.chat_id, type="private"), text="ok")
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+
+async def send(bot: Bot, chat_id: int, priority: SendPriority, latencies: list) -> bool:
+    start = time.perf_counter()
+    try:
+        with send_priority(priority):
+            await bot.send_message(chat_id, "notice")
+    except TelegramRetryAfter:
+        return False
+    latencies.append(time.perf_counter() - start)
+    return True
+
+
+async def run(args, queued: bool) -> dict:
+    session = FloodLimitedSession(args.latency_ms / 1000.0, args.server_limit)
+    bot = Bot(token="123456:ABCDEF", session=session)
+    queue = None
+    if queued:
+        limiter = TelegramRateLimiter(global_rate=args.global_rate, per_chat_rate=1.0)
+        queue = SendQueue(limiter, max_retries=5)
+        bot.session.middleware(queue)
+
+    low, high = [], []
+    start = time.perf_counter()
+    broadcast = [
+        asyncio.create_task(send(bot, 2_000_000 + i, SendPriority.LOW, low))
+        for i in range(args.broadcast)
+    ]
+    await asyncio.sleep(0.5)
+    urgent = [
+        asyncio.create_task(send(bot, 3_000_000 + i, SendPriority.HIGH, high))
+        for i in range(args.urgent)
+    ]
+    results = await asyncio.gather(*broadcast, *urgent)
+    elapsed = time.perf_counter() - start
+    if queue is not None:
+        await queue.close()
+
+    return {
+        "seconds": elapsed,
+        "delivered": sum(results),
+        "lost": len(results) - sum(results),
+        "calls": session.calls,
+        "floods": session.floods,
+        "low": low,
+        "high": high,
+        "queue": queue.stats() if queue is not None else None,
+    }
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+
+def report(name: str, result: dict):
+    print(
+        f"{name:>9}: {result['seconds']:6.2f}s  delivered={result['delivered']:>5}  lost={result['lost']:>5}  "
+        f"api_calls={result['calls']:>5}  429s={result['floods']:>5}"
+    )
+    for label in ("high", "low"):
+        values = result[label]
+        if values:
+            print(f"           {label:>4} latency p50={statistics.median(values) * 1000:8.1f}ms  "
+                  f"p95={percentile(values, 0.95):8.1f}ms  (n={len(values)})")
+    if result["queue"]:
+        print(f"           queue stats: {result['queue']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--broadcast", type=int, default=300)
+    parser.add_argument("--urgent", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--server-limit", type=int, default=30, help="calls per second the fake API accepts")
+    parser.add_argument("--global-rate", type=float, default=25.0, help="send queue global rate")
+    args = parser.parse_args()
+
+    print(f"broadcast={args.broadcast} urgent={args.urgent} latency={args.latency_ms}ms "
+          f"server_limit={args.server_limit}/s queue_rate={args.global_rate}/s")
+    report("unshaped", await run(args, queued=False))
+    report("queued", await run(args, queued=True))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""
+Benchmark: admin panel Bot API calls with a Bot per request vs one shared Bot
+
+Starts the fake Bot API (benchmarks/fake_bot_api.py) in this process and runs
+--requests channel activations (ChannelManager.add_user: unban, invite link,
+message) with --concurrency in flight, two ways:
+
+  * per-request - a new Bot and aiohttp session for every activation, closed
+                  afterwards (what the activate route used to do)
+  * shared      - one Bot opened up front (web/bot_client.py), as the web app
+                  lifespan does
+
+Reports activations/sec, p50/p95 latency and the TCP connections the fake
+API accepted. Closing an aiogram session also waits 250 ms for the
+connections to shut down, which per-request mode pays on every activation.
+The fake API is plain HTTP on localhost, so the gap measured
+here leaves out the TLS handshake and round trips to api.telegram.org that
+the per-request mode also pays in production.
+
+Usage:
+    python -m benchmarks.bench_web_bot_client --requests 200 --concurrency 1 10
+"""
+import sys
+import os
+import argparse
+import asyncio
+import statistics
+import time
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from bot.channel_manager import ChannelManager
+from web.bot_client import BotClient, create_web_bot
+
+TOKEN = "42:bench"
+
+
+async def activate_per_request(api_server: str, user_id: int):
+    bot = create_web_bot(token=TOKEN, api_server=api_server)
+    try:
+        await ChannelManager(bot).add_user(user_id, use_invite_link=True)
+    finally:
+        await bot.session.close()
+
+
+async def run(mode: str, api_server: str, requests: int, concurrency: int) -> list:
+    client = BotClient()
+    if mode == "shared":
+        client.start(token=TOKEN, api_server=api_server)
+
+    latencies = []
+    user_ids = iter(range(1, requests + 1))
+
+    async def worker():
+        for user_id in user_ids:
+            started = time.perf_counter()
+            if mode == "shared":
+                await client.channel_manager.add_user(user_id, use_invite_link=True)
+            else:
+                await activate_per_request(api_server, user_id)
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        await client.close()
+    return latencies
+
+
+async def main_async(args):
+    print(f"{'mode':12} {'conc':>4} {'act/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'conns':>6}")
+    for concurrency in args.concurrency:
+        for mode in ("per-request", "shared"):
+            api = FakeBotAPI()
+            runner = await api.start("127.0.0.1", args.api_port)
+            try:
+                # Warm up imports and the event loop
+                await run(mode, f"http://127.0.0.1:{args.api_port}", 20, 1)
+                api.connections = 0
+                api._transports.clear()
+
+                started = time.perf_counter()
+                latencies = await run(mode, f"http://127.0.0.1:{args.api_port}", args.requests, concurrency)
+                elapsed = time.perf_counter() - started
+            finally:
+                await runner.cleanup()
+
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            print(f"{mode:12} {concurrency:>4} {len(latencies) / elapsed:8.0f} "
+                  f"{statistics.median(latencies) * 1000:8.2f} {p95 * 1000:8.2f} {api.connections:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--api-port", type=int, default=8091)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Fake Telegram Bot API server for local load tests
+
+Implements the subset of the Bot API the bot uses: getUpdates (long polling
+over an in-memory update queue, topped up from an optional scripted update
+generator), setWebhook/deleteWebhook, and the send/edit/answer/ban methods,
+which return plausible results. Every call is counted, the parameters of the
+methods in RECORDED_METHODS are kept, and the time between handing a
+callback update to the bot and the bot's answerCallbackQuery is recorded as
+the update's latency.
+
+Network conditions can be injected: ``latency`` seconds (plus up to
+``jitter``) before every answer, and a ``rate_limited`` share of the
+chat-bound calls answered with 429 Too Many Requests and ``retry_after``.
+
+Point the bot at it with TELEGRAM_API_SERVER=http://127.0.0.1:<port>.
+
+Usage (standalone):
+    python -m benchmarks.fake_bot_api --port 8090
+    python -m benchmarks.fake_bot_api --latency 0.05 --jitter 0.05 --rate-limited 0.01
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter, defaultdict, deque
+from typing import Dict, Iterator, List, Optional
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+# Calls whose parameters are kept in FakeBotAPI.recorded
+RECORDED_METHODS = {"sendMessage", "editMessageText", "banChatMember", "unbanChatMember", "createChatInviteLink"}
+# Calls that can be answered with an injected 429 (Telegram rate limits chat-bound calls)
+RATE_LIMITED_METHODS = RECORDED_METHODS | {"sendSticker"}
+
+
+class FakeBotAPI:
+    """In-process fake Bot API with update queue and latency tracking"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limited: float = 0.0, retry_after: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.rejected = Counter()  # injected 429s by method
+        self.recorded: Dict[str, List[dict]] = defaultdict(list)
+        self.handed_out: Dict[int, float] = {}  # update_id -> when getUpdates returned it
+        self.connections = 0  # TCP connections accepted
+        self._transports = set()
+        self.webhook_url = ""
+        self.polling = asyncio.Event()  # set once the bot has called getUpdates
+        self.latencies: List[float] = []
+        self._pending = deque()
+        self._new_updates = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._sent_at: Dict[str, float] = {}
+        self._answered = 0
+        self._answered_changed = asyncio.Event()
+        self._script: Optional[Iterator[dict]] = None
+
+    # Update generation
+
+    def callback_update(self, user_id: int, data: str) -> dict:
+        """Build a callback_query update for a private chat"""
+        update_id = next(self._update_ids)
+        chat = {"id": user_id, "type": "private"}
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "chat_instance": str(user_id),
+                "from": {"id": user_id, "is_bot": False, "first_name": "Load", "username": f"load{user_id}"},
+                "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "text": "menu"},
+                "data": data,
+            },
+        }
+
+    def message_update(self, user_id: int, text: str) -> dict:
+        """Build a text message update (commands get a bot_command entity)"""
+        update_id = next(self._update_ids)
+        message = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load", "username": f"load{user_id}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": update_id, "message": message}
+
+    def script(self, updates: Iterator[dict]):
+        """Serve updates from a generator whenever the queue runs dry"""
+        self._script = iter(updates)
+        self._new_updates.set()
+
+    def mark_sent(self, update: dict):
+        """Start the latency clock for an update"""
+        callback = update.get("callback_query")
+        if callback:
+            self._sent_at[callback["id"]] = time.perf_counter()
+
+    def enqueue(self, updates: List[dict]):
+        """Queue updates for getUpdates"""
+        for update in updates:
+            self.mark_sent(update)
+            self._pending.append(update)
+        self._new_updates.set()
+
+    async def wait_answered(self, count: int, timeout: float):
+        """Wait until ``count`` callback queries have been answered in total"""
+        deadline = time.monotonic() + timeout
+        while self._answered < count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"only {self._answered}/{count} callbacks answered")
+            self._answered_changed.clear()
+            try:
+                await asyncio.wait_for(self._answered_changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    @property
+    def answered(self) -> int:
+        return self._answered
+
+    # HTTP
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, host: str, port: int) -> web.AppRunner:
+        runner = web.AppRunner(self.make_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if request.transport not in self._transports:
+            self._transports.add(request.transport)
+            self.connections += 1
+        params = dict(await request.post())
+        if method != "getUpdates":
+            await self._network_delay()
+            if method in RATE_LIMITED_METHODS and self.rate_limited and random.random() < self.rate_limited:
+                self.rejected[method] += 1
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }, status=429)
+        if method in RECORDED_METHODS:
+            self.recorded[method].append(params)
+        handler = getattr(self, f"_method_{method.lower()}", None)
+        result = await handler(params) if handler else True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _network_delay(self):
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    # Bot API methods
+
+    async def _method_getme(self, params: dict):
+        return BOT_USER
+
+    async def _method_getupdates(self, params: dict):
+        self.polling.set()
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+
+        while self._pending and self._pending[0]["update_id"] < offset:
+            self._pending.popleft()
+        if not self._pending and self._script is not None:
+            self._pull_script(limit)
+        if not self._pending and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            if not self._pending and self._script is not None:
+                self._pull_script(limit)
+
+        updates = list(itertools.islice(self._pending, limit))
+        now = time.perf_counter()
+        for update in updates:
+            self.handed_out.setdefault(update["update_id"], now)
+        return updates
+
+    def _pull_script(self, limit: int):
+        for update in itertools.islice(self._script, limit):
+            self.mark_sent(update)
+            self._pending.append(update)
+
+    async def _method_setwebhook(self, params: dict):
+        self.webhook_url = params.get("url", "")
+        return True
+
+    async def _method_deletewebhook(self, params: dict):
+        self.webhook_url = ""
+        return True
+
+    async def _method_getwebhookinfo(self, params: dict):
+        return {"url": self.webhook_url, "has_custom_certificate": False, "pending_update_count": len(self._pending)}
+
+    async def _method_answercallbackquery(self, params: dict):
+        sent_at = self._sent_at.pop(params.get("callback_query_id"), None)
+        if sent_at is not None:
+            self.latencies.append(time.perf_counter() - sent_at)
+        self._answered += 1
+        self._answered_changed.set()
+        return True
+
+    async def _method_sendmessage(self, params: dict):
+        return self._message(params)
+
+    async def _method_editmessagetext(self, params: dict):
+        return self._message(params)
+
+    async def _method_sendsticker(self, params: dict):
+        return self._message(params)
+
+    async def _method_createchatinvitelink(self, params: dict):
+        return {
+            "invite_link": "https://t.me/+fake",
+            "creator": BOT_USER,
+            "creates_join_request": False,
+            "is_primary": False,
+            "is_revoked": False,
+        }
+
+    @staticmethod
+    def _message(params: dict) -> dict:
+        chat_id = int(params.get("chat_id") or 0)
+        return {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+
+async def serve(host: str, port: int, **conditions):
+    api = FakeBotAPI(**conditions)
+    await api.start(host, port)
+    print(f"Fake Bot API listening on http://{host}:{port}")
+    while True:
+        await asyncio.sleep(60)
+        print(f"calls: {dict(api.calls)}, 429s: {dict(api.rejected)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds per call")
+    parser.add_argument("--rate-limited", type=float, default=0.0, help="share of chat calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                      rate_limited=args.rate_limited, retry_after=args.retry_after))
+
+
+if __name__ == "__main__":
+    main()
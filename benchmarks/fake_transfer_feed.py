@@ -0,0 +1,161 @@
+"""
+Fake USDT transfer feeds for offline payment watcher runs
+
+Serves the two explorer API shapes services/transfer_feeds.py reads from an
+in-memory list of transfers:
+
+  * TronGrid  GET /v1/accounts/{address}/transactions/trc20
+  * BscScan   GET /api?module=account&action=tokentx
+              GET /api?module=block&action=getblocknobytime
+
+BSC blocks are derived from time (one every 3 seconds), so transfers gain
+confirmations as the clock moves on. Transfers are injected in process with
+add_transfer() or over HTTP:
+
+    curl -X POST localhost:8092/fake/transfers \\
+         -d '{"network": "TRC20", "to": "<wallet>", "amount": "30.00"}'
+
+Point the bot at it with TRONGRID_API_URL=http://127.0.0.1:<port> and
+BSCSCAN_API_URL=http://127.0.0.1:<port>/api.
+
+Usage (standalone):
+    python -m benchmarks.fake_transfer_feed --port 8092
+"""
+import argparse
+import asyncio
+import secrets
+import time
+from collections import Counter
+from decimal import Decimal
+from typing import List, Optional
+from aiohttp import web
+
+TRC20_DECIMALS = 6
+BSC_DECIMALS = 18
+BSC_BLOCK_SECONDS = 3
+BSC_GENESIS = 1_598_671_449  # timestamp of BSC block 0
+
+
+def bsc_block(timestamp: float) -> int:
+    return int((timestamp - BSC_GENESIS) // BSC_BLOCK_SECONDS)
+
+
+class FakeTransferFeed:
+    """In-process TronGrid and BscScan stand-ins sharing one transfer list"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.transfers: List[dict] = []
+
+    def add_transfer(self, network: str, to: str, amount, sender: str = "sender",
+                     timestamp: Optional[float] = None) -> str:
+        """Record a transfer, returning its transaction hash"""
+        tx_id = secrets.token_hex(32)
+        self.transfers.append({
+            "network": network,
+            "tx_id": tx_id,
+            "from": sender,
+            "to": to,
+            "amount": Decimal(str(amount)),
+            "timestamp": time.time() if timestamp is None else timestamp,
+        })
+        self.transfers.sort(key=lambda transfer: transfer["timestamp"])
+        return tx_id
+
+    # HTTP
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/v1/accounts/{address}/transactions/trc20", self.handle_trongrid)
+        app.router.add_get("/api", self.handle_bscscan)
+        app.router.add_post("/fake/transfers", self.handle_add)
+        return app
+
+    async def start(self, host: str, port: int) -> web.AppRunner:
+        runner = web.AppRunner(self.make_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+    async def handle_add(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        tx_id = self.add_transfer(body["network"], body["to"], body["amount"], body.get("from", "sender"))
+        return web.json_response({"tx_id": tx_id})
+
+    async def handle_trongrid(self, request: web.Request) -> web.Response:
+        self.calls["trongrid"] += 1
+        address = request.match_info["address"]
+        min_timestamp = int(request.query.get("min_timestamp", 0))
+        limit = int(request.query.get("limit", 20))
+        offset = int(request.query.get("fingerprint") or 0)
+        data = [
+            {
+                "transaction_id": transfer["tx_id"],
+                "token_info": {"symbol": "USDT", "decimals": TRC20_DECIMALS, "name": "Tether USD"},
+                "block_timestamp": int(transfer["timestamp"] * 1000),
+                "from": transfer["from"],
+                "to": transfer["to"],
+                "type": "Transfer",
+                "value": str(int(transfer["amount"].scaleb(TRC20_DECIMALS))),
+            }
+            for transfer in self.transfers
+            if transfer["network"] == "TRC20" and transfer["to"] == address
+            and int(transfer["timestamp"] * 1000) >= min_timestamp
+        ]
+        meta = {"page_size": min(limit, len(data) - offset)}
+        if offset + limit < len(data):
+            meta["fingerprint"] = str(offset + limit)
+        return web.json_response({"data": data[offset:offset + limit], "success": True, "meta": meta})
+
+    async def handle_bscscan(self, request: web.Request) -> web.Response:
+        self.calls["bscscan"] += 1
+        query = request.query
+        if query.get("module") == "block" and query.get("action") == "getblocknobytime":
+            return web.json_response({"status": "1", "message": "OK", "result": str(bsc_block(int(query["timestamp"])))})
+        if query.get("module") != "account" or query.get("action") != "tokentx":
+            return web.json_response({"status": "0", "message": "NOTOK", "result": "Unsupported action"})
+
+        address = query["address"].lower()
+        start_block = int(query.get("startblock", 0))
+        limit = int(query.get("offset", 100))
+        head = bsc_block(time.time())
+        result = []
+        for transfer in self.transfers:
+            block = bsc_block(transfer["timestamp"])
+            if transfer["network"] != "BSC" or transfer["to"].lower() != address or block < start_block:
+                continue
+            result.append({
+                "blockNumber": str(block),
+                "timeStamp": str(int(transfer["timestamp"])),
+                "hash": transfer["tx_id"],
+                "from": transfer["from"],
+                "to": transfer["to"],
+                "value": str(int(transfer["amount"].scaleb(BSC_DECIMALS))),
+                "tokenDecimal": str(BSC_DECIMALS),
+                "confirmations": str(head - block),
+            })
+        result = result[:limit]
+        if not result:
+            return web.json_response({"status": "0", "message": "No transactions found", "result": []})
+        return web.json_response({"status": "1", "message": "OK", "result": result})
+
+
+async def serve(host: str, port: int):
+    feed = FakeTransferFeed()
+    await feed.start(host, port)
+    print(f"Fake transfer feeds listening on http://{host}:{port}")
+    while True:
+        await asyncio.sleep(60)
+        print(f"calls: {dict(feed.calls)}, transfers: {len(feed.transfers)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8092)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from aiogram import Bot
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+from bot.send_queue import SendPriority, send_priority
 from config.settings import settings
 import logging
 
@@ -36,25 +37,27 @@ class ChannelManager:
                     user_id=user_id,
                     only_if_banned=True
                 )
-            except:
-                pass  # User might not be banned
+            except TelegramAPIError as e:
+                logger.debug(f"Could not unban user {user_id} before adding: {e}")
             
             if use_invite_link:
                 # Method 1: Use invite link (works best for private channels)
                 try:
-                    # Create a one-time invite link for this specific user
-                    invite_link = await self.bot.create_chat_invite_link(
-                        chat_id=self.channel_id,
-                        name=f"User_{user_id}",
-                        member_limit=1,
-                        creates_join_request=False  # Direct join, no approval needed
-                    )
+                    # Invite links jump the send queue ahead of broadcast notices
+                    with send_priority(SendPriority.HIGH):
+                        # Create a one-time invite link for this specific user
+                        invite_link = await self.bot.create_chat_invite_link(
+                            chat_id=self.channel_id,
+                            name=f"User_{user_id}",
+                            member_limit=1,
+                            creates_join_request=False  # Direct join, no approval needed
+                        )
                     
-                    # Send the invite link to the user
-                    await self.bot.send_message(
-                        chat_id=user_id,
-                        text=f"🔗 رابط الدعوة للقناة:\n{invite_link.invite_link}\n\nاضغط على الرابط للانضمام."
-                    )
+                        # Send the invite link to the user
+                        await self.bot.send_message(
+                            chat_id=user_id,
+                            text=f"🔗 رابط الدعوة للقناة:\n{invite_link.invite_link}\n\nاضغط على الرابط للانضمام."
+                        )
                     
                     logger.info(f"Sent invite link to user {user_id} for channel {self.channel_id}")
                     return True
@@ -83,7 +86,7 @@ class ChannelManager:
             return False
     
     async def remove_user(self, user_id: int) -> bool:
-        """Remove user from channel"""
+        """Remove user from channel (raises TelegramRetryAfter on flood control)"""
         try:
             await self.bot.ban_chat_member(
                 chat_id=self.channel_id,
@@ -91,6 +94,9 @@ class ChannelManager:
             )
             logger.info(f"Removed user {user_id} from channel {self.channel_id}")
             return True
+        except TelegramRetryAfter:
+            # Flood control: let the caller back off and retry
+            raise
         except TelegramBadRequest as e:
             logger.error(f"Failed to remove user {user_id} from channel: {e}")
             return False
@@ -0,0 +1,253 @@
+"""
+Bounded worker pool for channel membership operations
+
+Expired members are queued here instead of being removed one by one inside
+the expiry loop. A fixed number of workers drain the queue at LOW send
+priority. Rate limits are normally applied by the bot's send queue
+(bot/send_queue.py); a standalone TelegramRateLimiter can be passed instead.
+A TelegramRetryAfter that reaches the pool pauses every worker for the
+requested time before the call is retried; any other error re-queues the
+removal after an exponential backoff, up to CHANNEL_REMOVAL_ATTEMPTS.
+
+Removals submitted with their subscription id are persisted by the
+subscription's removal_pending flag, set by the expiry statement and cleared
+here once the removal has been attempted. Just before banning, a worker
+checks the flag still stands and the user has not renewed while queued.
+Removals dropped by stop(), out of attempts, or never queued because the
+expiry run was cancelled keep the flag, and the next leader queues them
+again (bot/main.py resume_pending_removals).
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from bot.channel_manager import ChannelManager
+from bot.send_queue import SendPriority, send_priority
+from config.settings import settings
+from services.subscription_service import SubscriptionService
+from utils.metrics import CHANNEL_REMOVAL_BACKLOG
+from utils.rate_limit import TelegramRateLimiter
+import logging
+
+logger = logging.getLogger(__name__)
+
+REMOVAL_NOTICE = "❌ تم إزالتك من القناة بسبب انتهاء الاشتراك."
+
+# Window used for the throughput figure in stats()
+THROUGHPUT_WINDOW_SECONDS = 60.0
+
+
+class ChannelWorkerPool:
+    """Rate-limited concurrent channel removals"""
+
+    def __init__(
+        self,
+        bot: Bot,
+        channel_manager: ChannelManager,
+        limiter: Optional[TelegramRateLimiter],
+        workers: int,
+        queue_size: int,
+        max_retries: int,
+        progress_every: int,
+        removal_attempts: int = 1,
+        retry_backoff: float = 0.0,
+    ):
+        self.bot = bot
+        self.channel_manager = channel_manager
+        self.limiter = limiter
+        self.workers = workers
+        self.max_retries = max_retries
+        self.progress_every = progress_every
+        self.removal_attempts = removal_attempts
+        self.retry_backoff = retry_backoff
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+        self._retry_tasks: Set[asyncio.Task] = set()
+        self._resume_at = 0.0  # monotonic time until which the pool is paused
+        self._completions = deque()
+        self.submitted = 0
+        self.removed = 0
+        self.failed = 0
+        self.retries = 0
+        self.pauses = 0
+        self.requeued = 0
+        self.skipped = 0
+        self.in_flight = 0
+
+    def start(self):
+        """Start the worker tasks"""
+        for index in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(index)))
+        logger.info(f"Channel worker pool started with {self.workers} workers")
+
+    async def stop(self):
+        """Cancel the worker tasks (queued removals are dropped, their removal_pending flags kept)"""
+        tasks = self._tasks + list(self._retry_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        CHANNEL_REMOVAL_BACKLOG.dec(self._queue.qsize() + len(self._retry_tasks))
+        self._retry_tasks.clear()
+
+    async def submit_removal(self, telegram_id: int, subscription_id: Optional[int] = None):
+        """Queue a member removal (waits while the queue is full)"""
+        await self._queue.put((telegram_id, subscription_id, 1))
+        self.submitted += 1
+        CHANNEL_REMOVAL_BACKLOG.inc()
+
+    async def join(self):
+        """Wait until every queued removal has been processed"""
+        await self._queue.join()
+
+    def stats(self) -> dict:
+        """Progress and throughput counters"""
+        self._trim_completions(time.monotonic())
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "removed": self.removed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "pauses": self.pauses,
+            "requeued": self.requeued,
+            "skipped": self.skipped,
+            "paused_for": round(max(0.0, self._resume_at - time.monotonic()), 1),
+            "throughput_per_sec": round(len(self._completions) / THROUGHPUT_WINDOW_SECONDS, 2),
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            telegram_id, subscription_id, attempt = await self._queue.get()
+            self.in_flight += 1
+            requeued = False
+            try:
+                if subscription_id is not None and not await SubscriptionService.is_removal_wanted_async(
+                        subscription_id):
+                    # Renewed (or already handled) while queued
+                    self.skipped += 1
+                    await self._removal_done(subscription_id)
+                    continue
+                with send_priority(SendPriority.LOW):
+                    await self._remove_member(telegram_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt < self.removal_attempts:
+                    delay = self.retry_backoff * 2 ** (attempt - 1)
+                    logger.warning(f"Channel worker {index} failed to remove user {telegram_id} "
+                                   f"(attempt {attempt}), retrying in {delay:.0f}s: {e}")
+                    self._retry_later((telegram_id, subscription_id, attempt + 1), delay)
+                    requeued = True
+                else:
+                    self.failed += 1
+                    logger.error(f"Channel worker {index} failed to remove user {telegram_id}: {e}", exc_info=True)
+            else:
+                await self._removal_done(subscription_id)
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+                if not requeued:
+                    CHANNEL_REMOVAL_BACKLOG.dec()
+                    self._record_completion()
+
+    def _retry_later(self, item: Tuple[int, Optional[int], int], delay: float):
+        """Put a removal back on the queue after ``delay`` seconds (still counted in the backlog)"""
+        async def requeue():
+            await asyncio.sleep(delay)
+            await self._queue.put(item)
+            self._retry_tasks.discard(task)
+
+        self.requeued += 1
+        task = asyncio.create_task(requeue())
+        self._retry_tasks.add(task)
+
+    async def _remove_member(self, telegram_id: int):
+        removed = await self._call(
+            self.channel_manager.channel_id,
+            lambda: self.channel_manager.remove_user(telegram_id),
+        )
+        if not removed:
+            self.failed += 1
+            return
+        self.removed += 1
+
+        try:
+            await self._call(telegram_id, lambda: self.bot.send_message(telegram_id, REMOVAL_NOTICE))
+        except TelegramAPIError as e:
+            # The user may have blocked the bot; the removal itself succeeded
+            logger.debug(f"Could not notify removed user {telegram_id}: {e}")
+
+    async def _removal_done(self, subscription_id: Optional[int]):
+        # Also after a refused removal (remove_user returned False): retrying would not help
+        if subscription_id is None:
+            return
+        try:
+            await SubscriptionService.clear_removal_pending_async([subscription_id])
+        except Exception as e:
+            # Left pending: the next leader retries the removal
+            logger.error(f"Could not clear removal_pending of subscription {subscription_id}: {e}")
+
+    async def _call(self, chat_id, request: Callable[[], Awaitable]):
+        """Run one Bot API call within the rate limits, retrying on flood control"""
+        attempt = 0
+        while True:
+            await self._wait_if_paused()
+            if self.limiter is not None:
+                await self.limiter.acquire(chat_id)
+            try:
+                return await request()
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self._pause(e.retry_after)
+                if attempt > self.max_retries:
+                    raise
+                self.retries += 1
+
+    def _pause(self, retry_after: float):
+        resume_at = time.monotonic() + retry_after
+        if resume_at > self._resume_at:
+            self._resume_at = resume_at
+            self.pauses += 1
+            logger.warning(f"Flood control hit, pausing channel workers for {retry_after}s")
+
+    async def _wait_if_paused(self):
+        while True:
+            delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def _record_completion(self):
+        now = time.monotonic()
+        self._completions.append(now)
+        self._trim_completions(now)
+
+        done = self.removed + self.failed
+        if self.progress_every and done % self.progress_every == 0:
+            logger.info(f"Channel removals progress: {self.stats()}")
+        elif self._queue.empty() and self.in_flight == 0:
+            logger.info(f"Channel removal queue drained: {self.stats()}")
+
+    def _trim_completions(self, now: float):
+        while self._completions and self._completions[0] < now - THROUGHPUT_WINDOW_SECONDS:
+            self._completions.popleft()
+
+
+def create_channel_worker_pool(bot: Bot, channel_manager: Optional[ChannelManager] = None) -> ChannelWorkerPool:
+    """Build a worker pool configured from settings (rate limited by the bot's send queue)"""
+    return ChannelWorkerPool(
+        bot=bot,
+        channel_manager=channel_manager or ChannelManager(bot),
+        limiter=None,
+        workers=settings.CHANNEL_WORKERS,
+        queue_size=settings.CHANNEL_QUEUE_SIZE,
+        max_retries=settings.CHANNEL_MAX_RETRIES,
+        progress_every=settings.CHANNEL_PROGRESS_LOG_EVERY,
+        removal_attempts=settings.CHANNEL_REMOVAL_ATTEMPTS,
+        retry_backoff=settings.CHANNEL_RETRY_BACKOFF_SECONDS,
+    )
@@ -2,15 +2,14 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command, CommandStart
 from aiogram.exceptions import TelegramBadRequest
-from database.models import Plan, SubscriptionStatus
-from database.base import get_session
+from typing import Optional
+from database.models import User
 from services.user_service import UserService
 from services.subscription_service import SubscriptionService
 from services.payment_service import PaymentService
 from services.referral_service import ReferralService
 from bot.keyboards import (
     get_main_menu_keyboard,
-    get_plans_keyboard,
     get_plan_details_keyboard,
     get_payment_keyboard,
     get_payment_network_keyboard,
@@ -19,7 +18,9 @@ from bot.keyboards import (
     get_info_keyboard,
 )
 from bot.texts import Texts
+from bot.plan_catalog import plan_catalog
 from bot.channel_manager import ChannelManager
+from bot.send_queue import SendPriority, send_priority
 from bot.sticker_helpers import send_sticker_if_available
 from config.settings import settings
 import logging
@@ -33,24 +34,28 @@ router = Router()
 
 
 @router.message(CommandStart())
-async def cmd_start(message: Message):
+async def cmd_start(message: Message, db_user: Optional[User]):
     """Handle /start command"""
     try:
-        # Get or create user
-        user = UserService.get_or_create_user(
-            telegram_id=message.from_user.id,
-            username=message.from_user.username,
-            first_name=message.from_user.first_name,
-            last_name=message.from_user.last_name,
-            language_code=message.from_user.language_code or "ar"
-        )
+        from_user = message.from_user
+        user = db_user
+        # Create the user or refresh a changed profile (returning users skip the write)
+        if user is None or UserService.profile_changed(user, from_user.username, from_user.first_name,
+                                                       from_user.last_name):
+            user = await UserService.get_or_create_user_async(
+                telegram_id=from_user.id,
+                username=from_user.username,
+                first_name=from_user.first_name,
+                last_name=from_user.last_name,
+                language_code=from_user.language_code or "ar"
+            )
         
         # Check for referral code
         if len(message.text.split()) > 1:
             referral_code = message.text.split()[1]
-            referrer = UserService.get_user_by_referral_code(referral_code)
+            referrer = await UserService.get_user_by_referral_code_async(referral_code)
             if referrer and referrer.id != user.id:
-                ReferralService.process_referral(referrer.id, user.id)
+                await ReferralService.process_referral_async(referrer.id, user.id)
                 logger.info(f"Processed referral: {referrer.id} -> {user.id}")
         
         # Send welcome message (only new message for welcome)
@@ -99,10 +104,9 @@ async def callback_menu(callback: CallbackQuery):
 async def callback_plans(callback: CallbackQuery):
     """Handle plans callback"""
     try:
-        with get_session() as session:
-            plans = session.query(Plan).filter(Plan.is_active == True).all()
+        catalog = await plan_catalog.get()
         
-        if not plans:
+        if not catalog.active_plans:
             await callback.message.edit_text(
                 "⚠️ لا توجد خطط متاحة حالياً",
                 reply_markup=get_main_menu_keyboard()
@@ -112,7 +116,7 @@ async def callback_plans(callback: CallbackQuery):
         
         await callback.message.edit_text(
             Texts.PLANS_TITLE,
-            reply_markup=get_plans_keyboard(plans)
+            reply_markup=catalog.plans_keyboard
         )
         await callback.answer()
     except TelegramBadRequest:
@@ -123,22 +127,22 @@ async def callback_plans(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("plan_"))
-async def callback_plan_details(callback: CallbackQuery):
+async def callback_plan_details(callback: CallbackQuery, db_user: Optional[User]):
     """Handle plan details callback"""
     try:
         plan_id = int(callback.data.split("_")[1])
         
-        with get_session() as session:
-            plan = session.query(Plan).filter(Plan.id == plan_id).first()
+        catalog = await plan_catalog.get()
+        plan = catalog.get_plan(plan_id)
         
         if not plan:
             await callback.answer("الخطة غير موجودة", show_alert=True)
             return
         
-        can_use_trial = UserService.can_use_free_trial(callback.from_user.id)
+        can_use_trial = await UserService.can_use_free_trial_async(callback.from_user.id, user=db_user)
         
         await callback.message.edit_text(
-            Texts.format_plan_details(plan),
+            catalog.plan_details[plan_id],
             reply_markup=get_plan_details_keyboard(plan_id, can_use_trial)
         )
         await callback.answer()
@@ -150,31 +154,30 @@ async def callback_plan_details(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("trial_"))
-async def callback_trial(callback: CallbackQuery):
+async def callback_trial(callback: CallbackQuery, db_user: Optional[User]):
     """Handle trial activation callback"""
     try:
         plan_id = int(callback.data.split("_")[1])
         
         # Check if user can use trial
-        if not UserService.can_use_free_trial(callback.from_user.id):
+        if not await UserService.can_use_free_trial_async(callback.from_user.id, user=db_user):
             await callback.answer(Texts.TRIAL_ALREADY_USED, show_alert=True)
             return
         
         # Check if user already has active subscription
-        if SubscriptionService.has_active_subscription(callback.from_user.id):
+        if await SubscriptionService.has_active_subscription_async(db_user.id):
             await callback.answer("لديك اشتراك نشط بالفعل", show_alert=True)
             return
         
         # Create trial subscription
-        user = UserService.get_user_by_telegram_id(callback.from_user.id)
-        subscription = SubscriptionService.create_subscription(
-            user.id,
+        subscription = await SubscriptionService.create_subscription_async(
+            db_user.id,
             plan_id,
             is_trial=True
         )
         
         # Mark trial as used
-        UserService.mark_free_trial_used(callback.from_user.id)
+        await UserService.mark_free_trial_used_async(callback.from_user.id)
         
         # Add user to channel
         channel_manager = ChannelManager(callback.bot)
@@ -200,7 +203,7 @@ async def callback_trial(callback: CallbackQuery):
 # IMPORTANT: Register pay_network BEFORE pay_ because it's more specific
 # aiogram matches handlers in order, so more specific patterns should come first
 @router.callback_query(F.data.startswith("pay_network_"))
-async def callback_pay_network(callback: CallbackQuery):
+async def callback_pay_network(callback: CallbackQuery, db_user: Optional[User]):
     """Handle payment network selection callback"""
     logger.info(f"callback_pay_network called with data: {callback.data}")
     try:
@@ -216,8 +219,7 @@ async def callback_pay_network(callback: CallbackQuery):
         
         logger.info(f"Processing payment network: plan_id={plan_id}, network={network}, user={callback.from_user.id}")
         
-        with get_session() as session:
-            plan = session.query(Plan).filter(Plan.id == plan_id).first()
+        plan = (await plan_catalog.get()).get_plan(plan_id)
         
         if not plan:
             await callback.answer("الخطة غير موجودة", show_alert=True)
@@ -243,15 +245,18 @@ async def callback_pay_network(callback: CallbackQuery):
             )
             return
         
+        if not db_user:
+            await callback.answer("المستخدم غير موجود", show_alert=True)
+            return
+        
         # Check if user already has active subscription
-        if SubscriptionService.has_active_subscription(callback.from_user.id):
+        if await SubscriptionService.has_active_subscription_async(db_user.id):
             await callback.answer("لديك اشتراك نشط بالفعل", show_alert=True)
             return
         
         # Create payment with network
-        user = UserService.get_user_by_telegram_id(callback.from_user.id)
-        payment = PaymentService.create_payment(
-            user.id,
+        payment = await PaymentService.create_payment_async(
+            db_user.id,
             plan_id,
             float(plan.price),
             plan.currency,
@@ -262,7 +267,7 @@ async def callback_pay_network(callback: CallbackQuery):
         
         payment_text = Texts.PAYMENT_INSTRUCTIONS.format(
             plan_name=plan.name_ar or plan.name,
-            amount=plan.price,
+            amount=payment.amount,  # may carry a unique cent suffix
             currency=plan.currency,
             network=network_name,
             wallet_address=wallet_address
@@ -305,7 +310,7 @@ async def callback_pay_network(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("pay_") & ~F.data.startswith("pay_network_"))
-async def callback_pay(callback: CallbackQuery):
+async def callback_pay(callback: CallbackQuery, db_user: Optional[User]):
     """Handle payment callback - show network selection"""
     logger.info(f"callback_pay called with data: {callback.data}")
     try:
@@ -319,8 +324,7 @@ async def callback_pay(callback: CallbackQuery):
         plan_id = int(parts[1])
         logger.info(f"Processing payment for plan_id={plan_id}, user={callback.from_user.id}")
         
-        with get_session() as session:
-            plan = session.query(Plan).filter(Plan.id == plan_id).first()
+        plan = (await plan_catalog.get()).get_plan(plan_id)
         
         if not plan:
             logger.error(f"Plan {plan_id} not found")
@@ -328,7 +332,7 @@ async def callback_pay(callback: CallbackQuery):
             return
         
         # Check if user already has active subscription
-        if SubscriptionService.has_active_subscription(callback.from_user.id):
+        if db_user and await SubscriptionService.has_active_subscription_async(db_user.id):
             await callback.answer("لديك اشتراك نشط بالفعل", show_alert=True)
             return
         
@@ -359,17 +363,17 @@ async def callback_pay(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("confirm_payment_"))
-async def callback_confirm_payment(callback: CallbackQuery):
+async def callback_confirm_payment(callback: CallbackQuery, db_user: Optional[User]):
     """Handle payment confirmation callback"""
     try:
         payment_id = int(callback.data.split("_")[2])
         
-        payment = PaymentService.get_payment(payment_id)
+        payment = await PaymentService.get_payment_async(payment_id)
         if not payment:
             await callback.answer("الدفعة غير موجودة", show_alert=True)
             return
         
-        if payment.user.telegram_id != callback.from_user.id:
+        if not db_user or payment.user_id != db_user.id:
             await callback.answer("ليس لديك صلاحية لهذه الدفعة", show_alert=True)
             return
         
@@ -379,21 +383,29 @@ async def callback_confirm_payment(callback: CallbackQuery):
         
         # Confirm payment (admin should verify manually or via webhook)
         # For now, we'll auto-confirm (in production, add admin verification)
-        success = PaymentService.confirm_payment(payment_id)
-        
-        if success:
-            # Add user to channel
-            channel_manager = ChannelManager(callback.bot)
-            await channel_manager.add_user(callback.from_user.id)
-            
-            # Send success message (new message for payment confirmation)
-            # Send payment success sticker
-            await send_sticker_if_available(callback.bot, callback.from_user.id, "payment")
-            
-            await callback.message.answer(
-                Texts.PAYMENT_CONFIRMED,
-                reply_markup=get_main_menu_keyboard()
-            )
+        # The callback id makes Telegram redeliveries of this update no-ops;
+        # double clicks are serialized by the payment row lock
+        confirmation = await PaymentService.confirm_payment_async(
+            payment_id, idempotency_key=f"callback:{callback.id}"
+        )
+        
+        if confirmation and not confirmation.confirmed:
+            await callback.answer("تم تأكيد هذه الدفعة مسبقاً", show_alert=True)
+        elif confirmation:
+            # Payment confirmations go ahead of queued broadcast notices
+            with send_priority(SendPriority.HIGH):
+                # Add user to channel
+                channel_manager = ChannelManager(callback.bot)
+                await channel_manager.add_user(callback.from_user.id)
+                
+                # Send success message (new message for payment confirmation)
+                # Send payment success sticker
+                await send_sticker_if_available(callback.bot, callback.from_user.id, "payment")
+                
+                await callback.message.answer(
+                    Texts.PAYMENT_CONFIRMED,
+                    reply_markup=get_main_menu_keyboard()
+                )
             await callback.answer("تم تأكيد الدفع بنجاح!")
         else:
             await callback.answer("فشل تأكيد الدفع", show_alert=True)
@@ -403,17 +415,15 @@ async def callback_confirm_payment(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "my_subscriptions")
-async def callback_my_subscriptions(callback: CallbackQuery):
+async def callback_my_subscriptions(callback: CallbackQuery, db_user: Optional[User]):
     """Handle my subscriptions callback"""
     try:
-        user = UserService.get_user_by_telegram_id(callback.from_user.id)
-        if not user:
+        if not db_user:
             await callback.answer("المستخدم غير موجود", show_alert=True)
             return
         
-        # Get user_id before session closes
-        user_id = user.id
-        subscriptions = SubscriptionService.get_user_subscriptions(user_id)
+        user_id = db_user.id
+        subscriptions = await SubscriptionService.get_user_subscriptions_async(user_id)
         
         if not subscriptions:
             text = Texts.NO_SUBSCRIPTION
@@ -435,16 +445,14 @@ async def callback_my_subscriptions(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "referral")
-async def callback_referral(callback: CallbackQuery):
+async def callback_referral(callback: CallbackQuery, db_user: Optional[User]):
     """Handle referral callback"""
     try:
-        user = UserService.get_user_by_telegram_id(callback.from_user.id)
-        if not user:
+        if not db_user:
             await callback.answer("المستخدم غير موجود", show_alert=True)
             return
         
-        # Get referral_code before session closes
-        referral_code = user.referral_code
+        referral_code = db_user.referral_code
         
         await callback.message.edit_text(
             Texts.REFERRAL_CODE.format(referral_code=referral_code),
@@ -472,19 +480,17 @@ async def callback_copy_referral(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "referral_stats")
-async def callback_referral_stats(callback: CallbackQuery):
+async def callback_referral_stats(callback: CallbackQuery, db_user: Optional[User]):
     """Handle referral stats callback"""
     try:
-        user = UserService.get_user_by_telegram_id(callback.from_user.id)
-        if not user:
+        if not db_user:
             await callback.answer("المستخدم غير موجود", show_alert=True)
             return
         
-        # Get values before session closes
-        user_id = user.id
-        referral_code = user.referral_code
+        user_id = db_user.id
+        referral_code = db_user.referral_code
         
-        stats = ReferralService.get_referral_stats(user_id)
+        stats = await ReferralService.get_referral_stats_async(user_id, user=db_user)
         
         from services.referral_service import REFERRAL_POINTS
         
@@ -505,19 +511,16 @@ async def callback_referral_stats(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "redeem_points")
-async def callback_redeem_points(callback: CallbackQuery):
+async def callback_redeem_points(callback: CallbackQuery, db_user: Optional[User]):
     """Handle redeem points callback"""
     try:
-        user = UserService.get_user_by_telegram_id(callback.from_user.id)
-        if not user:
+        if not db_user:
             await callback.answer("المستخدم غير موجود", show_alert=True)
             return
         
-        # Get values before session closes
-        user_id = user.id
-        referral_code = user.referral_code
+        referral_code = db_user.referral_code
         
-        total_points = ReferralService.get_user_total_points(user_id)
+        total_points = db_user.points_balance
         
         if total_points == 0:
             await callback.answer(Texts.NO_POINTS, show_alert=True)
@@ -1,109 +1,246 @@
 import asyncio
-import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from config.settings import settings
 from bot.handlers import router
 from bot.admin_handlers import admin_router
 from bot.channel_manager import ChannelManager
+from bot.channel_workers import ChannelWorkerPool, create_channel_worker_pool
+from bot.middlewares import APIMetricsMiddleware, HandlerMetricsMiddleware, UpdateMetricsMiddleware, UserMiddleware
+from bot.plan_catalog import plan_catalog
+from bot.keyboards import get_main_menu_keyboard
+from bot.send_queue import SendPriority, send_priority, send_queue
+from bot.texts import Texts
 from utils.logging import setup_logging
-from database.base import init_db, get_session
+from utils.metrics import serve_metrics
+from database.base import init_db, async_engine
+from services.expiry_scheduler import expiry_scheduler
+from services.leader_election import leader_election
+from services.payment_service import PendingTransferPayment
+from services.payment_watcher import payment_watcher
+from services.stats_service import StatsService
+from services.subscription_cache import subscription_cache
 from services.subscription_service import SubscriptionService
-import signal
+from typing import List, Optional
 import sys
 
 logger = setup_logging()
 
 
-async def check_expired_subscriptions(bot: Bot, channel_manager: ChannelManager):
-    """Periodically check and expire subscriptions"""
+async def remove_expired_members(channel_workers: ChannelWorkerPool, expired: list):
+    """Queue newly expired members for removal from the channel"""
+    for member in expired:
+        if member.still_subscribed:
+            continue
+        await channel_workers.submit_removal(member.telegram_id, member.subscription_id)
+
+
+async def resume_pending_removals(channel_workers: ChannelWorkerPool):
+    """Queue the removals a previous leader left undone (stopped or cancelled mid-run)"""
+    pending = await SubscriptionService.get_pending_removals_async()
+    renewed = [removal.subscription_id for removal in pending if removal.still_subscribed]
+    await SubscriptionService.clear_removal_pending_async(renewed)
+    for removal in pending:
+        if not removal.still_subscribed:
+            await channel_workers.submit_removal(removal.telegram_id, removal.subscription_id)
+    if pending:
+        logger.info(f"Resumed {len(pending) - len(renewed)} pending channel removals "
+                    f"({len(renewed)} users renewed since)")
+
+
+async def check_expired_subscriptions(channel_workers: ChannelWorkerPool):
+    """Expire subscriptions at their deadlines and remove members from the channel"""
+    # Before the first expiry run, so its removals are not queued twice
+    try:
+        await resume_pending_removals(channel_workers)
+    except Exception as e:
+        logger.error(f"Error resuming pending channel removals: {e}", exc_info=True)
+    await expiry_scheduler.run(
+        lambda expired: remove_expired_members(channel_workers, expired)
+    )
+
+
+async def notify_paid(bot: Bot, channel_manager: ChannelManager, payment: PendingTransferPayment):
+    """Add the user to the channel and tell them their transfer was received"""
+    with send_priority(SendPriority.HIGH):
+        await channel_manager.add_user(payment.telegram_id)
+        await bot.send_message(payment.telegram_id, Texts.PAYMENT_CONFIRMED, reply_markup=get_main_menu_keyboard())
+
+
+async def log_cache_stats(channel_workers: ChannelWorkerPool, interval: float = 3600):
+    """Periodically log cache, scheduler, channel worker and send queue counters"""
+    while True:
+        await asyncio.sleep(interval)
+        logger.info(f"Subscription cache stats: {subscription_cache.stats()}")
+        logger.info(f"Expiry scheduler stats: {expiry_scheduler.stats()}")
+        logger.info(f"Channel worker stats: {channel_workers.stats()}")
+        logger.info(f"Send queue stats: {send_queue.stats()}")
+        logger.info(f"Leader election: {leader_election.stats()}")
+        if payment_watcher.enabled:
+            logger.info(f"Payment watcher stats: {payment_watcher.stats()}")
+
+
+async def reconcile_stats(interval: float):
+    """Recount the dashboard counters now and then periodically"""
     while True:
         try:
-            expired_count = SubscriptionService.check_and_expire_subscriptions()
-            
-            if expired_count > 0:
-                logger.info(f"Expired {expired_count} subscriptions")
-                
-                # Remove expired users from channel
-                # Get recently expired subscriptions (in the last hour)
-                from datetime import datetime, timedelta
-                from database.models import Subscription, SubscriptionStatus
-                
-                with get_session() as session:
-                    one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-                    expired_subs = session.query(Subscription).filter(
-                        Subscription.status == SubscriptionStatus.EXPIRED,
-                        Subscription.updated_at >= one_hour_ago
-                    ).all()
-                    
-                    for sub in expired_subs:
-                        try:
-                            await channel_manager.remove_user(sub.user.telegram_id)
-                            # Send notification (optional)
-                            try:
-                                await bot.send_message(
-                                    sub.user.telegram_id,
-                                    "❌ تم إزالتك من القناة بسبب انتهاء الاشتراك."
-                                )
-                            except:
-                                pass
-                        except Exception as e:
-                            logger.error(f"Error removing user {sub.user.telegram_id}: {e}")
-            
-            # Check every hour
-            await asyncio.sleep(3600)
+            await StatsService.reconcile_async()
         except Exception as e:
-            logger.error(f"Error in check_expired_subscriptions: {e}", exc_info=True)
-            await asyncio.sleep(3600)
+            logger.error(f"Error reconciling stats counters: {e}", exc_info=True)
+        await asyncio.sleep(interval)
 
 
-async def main():
-    """Main function to run the bot"""
-    logger.info("Starting bot...")
+def create_bot() -> Bot:
+    """Create the Bot instance (custom API server and send queue applied)"""
+    if settings.TELEGRAM_API_SERVER:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_SERVER))
+    else:
+        session = AiohttpSession()
+    # Shape every outgoing request through the global send queue
+    session.middleware(send_queue)
+    # Inside the queue: times each attempt, not the wait for a send slot
+    session.middleware(APIMetricsMiddleware())
     
-    # Initialize database
-    try:
-        init_db()
-        logger.info("Database initialized")
-    except Exception as e:
-        logger.error(f"Failed to initialize database: {e}", exc_info=True)
-        sys.exit(1)
-    
-    # Initialize bot and dispatcher
-    bot = Bot(
+    return Bot(
         token=settings.BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-    
+
+
+def create_dispatcher() -> Dispatcher:
+    """Create the dispatcher with middlewares and routers"""
     dp = Dispatcher()
+    # Count updates and their database statements (outermost, so UserMiddleware is included)
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    # Resolve the database user once per update (passed to handlers as db_user)
+    dp.update.outer_middleware(UserMiddleware())
+    # Time the matched handler of every router
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
     # Include admin router first (more specific handlers)
     dp.include_router(admin_router)
     # Include main router (general handlers)
     dp.include_router(router)
+    return dp
+
+
+class BackgroundJobs:
+    """Jobs that must run in exactly one replica (started by the lease holder)"""
     
-    # Initialize channel manager
-    channel_manager = ChannelManager(bot)
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.channel_workers: Optional[ChannelWorkerPool] = None
+        self._tasks: List[asyncio.Task] = []
     
-    # Start background task for checking expired subscriptions
-    asyncio.create_task(check_expired_subscriptions(bot, channel_manager))
+    async def start(self):
+        """Start expiry, channel removal, stats logging, counter reconciliation and payment watcher tasks"""
+        logger.info("Starting background jobs")
+        # Initialize channel manager and the rate-limited removal workers
+        channel_manager = ChannelManager(self.bot)
+        self.channel_workers = create_channel_worker_pool(self.bot, channel_manager)
+        self.channel_workers.start()
+        
+        self._tasks = [
+            # Start background task for checking expired subscriptions
+            asyncio.create_task(check_expired_subscriptions(self.channel_workers)),
+            asyncio.create_task(log_cache_stats(self.channel_workers)),
+            asyncio.create_task(reconcile_stats(settings.STATS_RECONCILE_SECONDS)),
+        ]
+        if payment_watcher.enabled:
+            # Confirm payments from incoming USDT transfers
+            self._tasks.append(asyncio.create_task(payment_watcher.run(
+                lambda payment: notify_paid(self.bot, channel_manager, payment)
+            )))
+    
+    async def stop(self):
+        """Cancel the tasks (another replica takes over)"""
+        logger.info("Stopping background jobs")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.channel_workers is not None:
+            await self.channel_workers.stop()
+            self.channel_workers = None
+
+
+def start_background_jobs(bot: Bot) -> asyncio.Task:
+    """Run the background jobs in whichever replica holds the leader lease"""
+    jobs = BackgroundJobs(bot)
+    return asyncio.create_task(leader_election.run(jobs.start, jobs.stop))
+
+
+def start_cache_watchers():
+    """Start per-process cache refresh tasks"""
+    # Pick up plan changes made by the web admin
+    asyncio.create_task(plan_catalog.watch(settings.PLAN_CATALOG_POLL_SECONDS))
+    # Pick up subscription activations and early expiries made by other processes
+    asyncio.create_task(subscription_cache.watch(settings.SUBSCRIPTION_CACHE_POLL_SECONDS))
+
+
+async def shutdown(bot: Bot, jobs_task: Optional[asyncio.Task] = None):
+    """Stop background jobs (releasing the lease) and close connections"""
+    if jobs_task is not None:
+        jobs_task.cancel()
+        await asyncio.gather(jobs_task, return_exceptions=True)
+    await send_queue.close()
+    await bot.session.close()
+    await async_engine.dispose()
+
+
+def init_database():
+    """Create tables, exiting on failure"""
+    try:
+        init_db()
+        logger.info("Database initialized")
+    except Exception as e:
+        logger.error(f"Failed to initialize database: {e}", exc_info=True)
+        sys.exit(1)
+
+
+async def run_polling():
+    """Run the bot with long polling (single process)"""
+    serve_metrics(settings.METRICS_HOST, settings.METRICS_PORT)
+    bot = create_bot()
+    dp = create_dispatcher()
+    jobs_task = start_background_jobs(bot)
+    start_cache_watchers()
     
     # Start polling
     logger.info("Bot started, waiting for messages...")
     try:
+        # Telegram refuses getUpdates while a webhook is set
+        await bot.delete_webhook()
         await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"Error in polling: {e}", exc_info=True)
     finally:
-        await bot.session.close()
+        await shutdown(bot, jobs_task)
+
+
+def main():
+    """Main function to run the bot"""
+    logger.info(f"Starting bot in {settings.BOT_MODE} mode...")
+    
+    # Initialize database
+    init_database()
+    
+    if settings.BOT_MODE == "webhook":
+        from bot.webhook import run_webhook
+        run_webhook()
+    else:
+        asyncio.run(run_polling())
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        main()
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
         logger.error(f"Fatal error: {e}", exc_info=True)
         sys.exit(1)
-
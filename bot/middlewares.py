@@ -0,0 +1,136 @@
+"""
+Dispatcher and Bot API request middlewares
+"""
+import time
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramConflictError, TelegramEntityTooLarge, TelegramForbiddenError,
+    TelegramMigrateToChat, TelegramNetworkError, TelegramNotFound, TelegramRetryAfter, TelegramServerError,
+    TelegramUnauthorizedError,
+)
+from aiogram.types import TelegramObject, Update
+from typing import Any, Awaitable, Callable, Dict
+from database.instrumentation import current_scope, query_scope
+from services.user_service import UserService
+from utils.metrics import (
+    HANDLER_SECONDS, TELEGRAM_API_REQUESTS, TELEGRAM_API_SECONDS, UPDATE_QUERIES, UPDATE_QUERY_SECONDS, UPDATES,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bot API error classes by the code reported in metrics (subclasses before their bases)
+API_ERROR_CODES = [
+    (TelegramRetryAfter, "429"),
+    (TelegramMigrateToChat, "400"),
+    (TelegramBadRequest, "400"),
+    (TelegramUnauthorizedError, "401"),
+    (TelegramForbiddenError, "403"),
+    (TelegramNotFound, "404"),
+    (TelegramConflictError, "409"),
+    (TelegramEntityTooLarge, "413"),
+    (TelegramServerError, "5xx"),
+    (TelegramNetworkError, "network"),
+]
+
+
+def api_error_code(error: Exception) -> str:
+    for error_class, code in API_ERROR_CODES:
+        if isinstance(error, error_class):
+            return code
+    return "error"
+
+
+class UserMiddleware(BaseMiddleware):
+    """
+    Resolve the database user once per update
+    
+    Registered as an outer middleware on ``dp.update``, after aiogram's
+    UserContextMiddleware, so ``event_from_user`` is already available.
+    Handlers receive the loaded ``User`` (or None for unknown users) as the
+    ``db_user`` argument instead of querying it themselves.
+    """
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        db_user = None
+        if from_user is not None:
+            db_user = await UserService.get_user_by_telegram_id_async(from_user.id)
+        data["db_user"] = db_user
+        return await handler(event, data)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Count updates and the database statements each one runs
+    
+    Registered as the first outer middleware on ``dp.update`` so statements
+    made by later middlewares (UserMiddleware) are included. Opens the query
+    scope of the update, renamed after its handler by HandlerMetricsMiddleware.
+    """
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        result = "error"
+        with query_scope(f"update:{event.event_type}") as scope:
+            try:
+                response = await handler(event, data)
+                result = "handled"
+                return response
+            finally:
+                UPDATES.labels(event.event_type, result).inc()
+                UPDATE_QUERIES.observe(scope.count)
+                UPDATE_QUERY_SECONDS.observe(scope.seconds)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Time each router handler and attribute the update's statements to it
+    
+    Registered as an inner middleware on the dispatcher's message and
+    callback_query observers, which wraps the matched handler of every
+    included router; aiogram passes that handler as ``data["handler"]``.
+    """
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        name = data["handler"].callback.__name__
+        scope = current_scope()
+        if scope is not None:
+            scope.name = f"handler:{name}"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            HANDLER_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+class APIMetricsMiddleware(BaseRequestMiddleware):
+    """Bot API call latency and outcome per method (installed on the bot session)"""
+    
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        result = "ok"
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            result = api_error_code(e)
+            raise
+        finally:
+            TELEGRAM_API_SECONDS.labels(name).observe(time.perf_counter() - started)
+            TELEGRAM_API_REQUESTS.labels(name, result).inc()
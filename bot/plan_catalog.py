@@ -0,0 +1,100 @@
+"""
+In-process plan catalog cache
+
+Plans change a few times a year, so the bot keeps a versioned snapshot of the
+plans table together with the pre-rendered plans keyboard and plan details
+texts. Every plan write (PlanService, used by the web admin) bumps the
+``plans`` row in ``cache_versions``; the bot polls that row and reloads the
+snapshot when the version changes.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from aiogram.types import InlineKeyboardMarkup
+from database.models import Plan
+from services.plan_service import PlanService
+from bot.keyboards import get_plans_keyboard
+from bot.texts import Texts
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Immutable view of the plans table at a given version"""
+    version: int
+    plans: Dict[int, Plan]
+    active_plans: List[Plan]
+    plans_keyboard: InlineKeyboardMarkup
+    plan_details: Dict[int, str]
+
+    def get_plan(self, plan_id: int) -> Optional[Plan]:
+        """Get plan by ID"""
+        return self.plans.get(plan_id)
+
+
+class PlanCatalog:
+    """Versioned plan catalog shared by all handlers"""
+
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> CatalogSnapshot:
+        """Get the current snapshot, loading it if needed"""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+
+        async with self._lock:
+            if self._snapshot is None:
+                self._snapshot = await self._load()
+            return self._snapshot
+
+    def invalidate(self):
+        """Drop the current snapshot (reloaded on next access)"""
+        self._snapshot = None
+
+    async def refresh_if_changed(self) -> bool:
+        """Invalidate the snapshot if the stored catalog version changed"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return False
+
+        version = await PlanService.get_catalog_version_async()
+        if version == snapshot.version:
+            return False
+
+        logger.info(f"Plan catalog version changed ({snapshot.version} -> {version}), reloading")
+        self.invalidate()
+        return True
+
+    async def watch(self, interval: float):
+        """Periodically poll the catalog version (run as a background task)"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_if_changed()
+            except Exception as e:
+                logger.error(f"Error polling plan catalog version: {e}")
+
+    @staticmethod
+    async def _load() -> CatalogSnapshot:
+        # Read the version first: a write racing with the load leaves us with
+        # an older version number, which only causes one extra reload
+        version = await PlanService.get_catalog_version_async()
+        plans = await PlanService.get_all_plans_async()
+        active_plans = [plan for plan in plans if plan.is_active]
+
+        logger.info(f"Loaded plan catalog version {version} ({len(active_plans)}/{len(plans)} active plans)")
+        return CatalogSnapshot(
+            version=version,
+            plans={plan.id: plan for plan in plans},
+            active_plans=active_plans,
+            plans_keyboard=get_plans_keyboard(active_plans),
+            plan_details={plan.id: Texts.format_plan_details(plan) for plan in plans},
+        )
+
+
+plan_catalog = PlanCatalog()
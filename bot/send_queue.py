@@ -0,0 +1,186 @@
+"""
+Global outbound Telegram send queue
+
+Installed as a request middleware on the bot session, so every Bot API call
+that targets a chat (send_message, send_sticker, edit_message_text,
+create_chat_invite_link, ban_chat_member, ...) is shaped in one place:
+
+  * a per-chat token bucket keeps each chat under its own limit
+  * a global token bucket is handed out in priority order, so payment
+    confirmations and invite links overtake broadcast-style notices
+  * TelegramRetryAfter pauses every send for the requested time and the call
+    is retried automatically
+
+Calls without a chat (getUpdates, answerCallbackQuery, getMe, ...) pass
+straight through. Callers pick a priority with ``send_priority(...)``; methods
+listed in DEFAULT_PRIORITIES get theirs automatically.
+"""
+import asyncio
+import heapq
+import itertools
+import statistics
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Optional
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import CreateChatInviteLink
+from config.settings import settings
+from utils.rate_limit import TelegramRateLimiter
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SendPriority(IntEnum):
+    """Lower value is sent first"""
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+DEFAULT_PRIORITIES = {
+    CreateChatInviteLink: SendPriority.HIGH,
+}
+
+_current_priority: ContextVar[Optional[SendPriority]] = ContextVar("send_priority", default=None)
+
+
+@contextmanager
+def send_priority(priority: SendPriority):
+    """Send every Bot API call made inside the block with the given priority"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class SendQueue(BaseRequestMiddleware):
+    """Priority-ordered, rate-limited Bot API request middleware"""
+
+    def __init__(self, limiter: TelegramRateLimiter, max_retries: int, latency_samples: int = 1000):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._resume_at = 0.0  # monotonic time until which sends are paused
+        self._waits = deque(maxlen=latency_samples)
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.pauses = 0
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        priority = _current_priority.get()
+        if priority is None:
+            priority = DEFAULT_PRIORITIES.get(type(method), SendPriority.NORMAL)
+
+        attempt = 0
+        while True:
+            queued_at = time.monotonic()
+            await self.limiter.chat_bucket(chat_id).acquire()
+            await self._wait_turn(priority)
+            self._waits.append(time.monotonic() - queued_at)
+            try:
+                response = await make_request(bot, method)
+                self.sent += 1
+                return response
+            except TelegramRetryAfter as e:
+                self._pause(e.retry_after)
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.failed += 1
+                    raise
+                self.retries += 1
+                logger.debug(f"Retrying {type(method).__name__} to chat {chat_id} (attempt {attempt})")
+            except Exception:
+                self.failed += 1
+                raise
+
+    async def close(self):
+        """Stop the dispatcher task"""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+    def stats(self) -> dict:
+        """Queue depth, outcome counters and queueing latency"""
+        depth = {priority.name.lower(): 0 for priority in SendPriority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depth[SendPriority(priority).name.lower()] += 1
+
+        waits = sorted(self._waits)
+        return {
+            "depth": depth,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "pauses": self.pauses,
+            "paused_for": round(max(0.0, self._resume_at - time.monotonic()), 1),
+            "wait_ms_p50": round(statistics.median(waits) * 1000, 1) if waits else 0.0,
+            "wait_ms_p95": round(waits[int(len(waits) * 0.95) - 1] * 1000, 1) if waits else 0.0,
+            "wait_ms_max": round(waits[-1] * 1000, 1) if waits else 0.0,
+        }
+
+    async def _wait_turn(self, priority: SendPriority):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self):
+        """Hand out global tokens to the highest-priority waiter"""
+        while True:
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            await self.limiter.global_bucket.acquire()
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():  # skip callers that were cancelled while queued
+                    future.set_result(None)
+                    break
+
+    def _pause(self, retry_after: float):
+        resume_at = time.monotonic() + retry_after
+        if resume_at > self._resume_at:
+            self._resume_at = resume_at
+            self.pauses += 1
+            logger.warning(f"Flood control hit, pausing outgoing Telegram requests for {retry_after}s")
+
+
+def create_send_queue() -> SendQueue:
+    """Build a send queue configured from settings"""
+    limiter = TelegramRateLimiter(
+        global_rate=settings.TELEGRAM_GLOBAL_RATE,
+        per_chat_rate=settings.TELEGRAM_PER_CHAT_RATE,
+        per_chat_burst=settings.TELEGRAM_PER_CHAT_BURST,
+    )
+    limiter.set_chat_rate(settings.CHANNEL_ID, settings.CHANNEL_ADMIN_RATE)
+    return SendQueue(limiter, max_retries=settings.SEND_MAX_RETRIES)
+
+
+send_queue = create_send_queue()
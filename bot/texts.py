@@ -73,6 +73,7 @@ class Texts:
 {wallet_address}
 
 ⚠️ تأكد من إرسال المبلغ على الشبكة الصحيحة ({network})
+⚠️ أرسل المبلغ بالضبط كما هو مذكور (بما في ذلك الكسور) ليتم التعرف على دفعتك تلقائياً
 
 بعد إتمام الدفع، اضغط على زر "✅ تأكيد الدفع"."""
 
@@ -0,0 +1,141 @@
+"""
+Webhook entry point
+
+Runs the dispatcher behind aiohttp instead of long polling. Telegram POSTs
+updates to WEBHOOK_URL + WEBHOOK_PATH; aiogram's SimpleRequestHandler rejects
+requests whose X-Telegram-Bot-Api-Secret-Token header does not match
+WEBHOOK_SECRET and answers accepted updates immediately, handling them in the
+background.
+
+With WEBHOOK_WORKERS > 1 the parent process registers the webhook once and
+starts that many worker processes sharing WEBHOOK_PORT through SO_REUSEPORT,
+so the kernel spreads incoming connections across them. Background jobs
+(expiry scheduler, channel removals) run in whichever worker or replica holds
+the leader lease (services/leader_election.py).
+"""
+import asyncio
+import multiprocessing
+import signal
+import sys
+from typing import Optional
+from aiohttp import web
+from aiogram import Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from config.settings import settings
+from bot.send_queue import send_queue
+from utils.metrics import serve_metrics
+from bot.main import create_bot, create_dispatcher, shutdown, start_background_jobs, start_cache_watchers
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def webhook_url() -> str:
+    """Public URL Telegram delivers updates to"""
+    return settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH
+
+
+async def register_webhook(dp: Dispatcher):
+    """Point Telegram at this deployment's webhook"""
+    bot = create_bot()
+    try:
+        await bot.set_webhook(
+            url=webhook_url(),
+            secret_token=settings.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info(f"Webhook set to {webhook_url()}")
+    finally:
+        await shutdown(bot)
+
+
+def create_app(dp: Dispatcher) -> web.Application:
+    """aiohttp application serving the webhook endpoint"""
+    bot = create_bot()
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=settings.WEBHOOK_SECRET,
+    ).register(app, path=settings.WEBHOOK_PATH)
+
+    async def on_startup(app: web.Application):
+        await dp.emit_startup(bot=bot, dispatcher=dp)
+        start_cache_watchers()
+        app["jobs_task"] = start_background_jobs(bot)
+
+    async def on_cleanup(app: web.Application):
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await shutdown(bot, app.get("jobs_task"))
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def _graceful_exit(signum, frame):
+    # Ignore further signals so a second one cannot interrupt cleanup (lease release)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise web.GracefulExit()
+
+
+def run_worker(index: int, dp: Optional[Dispatcher] = None):
+    """Serve the webhook in this process"""
+    logger.info(f"Webhook worker {index} listening on {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}")
+    # Telegram's global limit applies to the bot, not to each process
+    send_queue.limiter.set_global_rate(settings.TELEGRAM_GLOBAL_RATE / max(1, settings.WEBHOOK_WORKERS))
+    # Each worker process serves its own metrics, on consecutive ports
+    serve_metrics(settings.METRICS_HOST, settings.METRICS_PORT + index if settings.METRICS_PORT else 0)
+
+    spawned = dp is None
+    if spawned:
+        # Ctrl+C reaches the whole process group; the parent forwards it as one SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, _graceful_exit)
+
+    web.run_app(
+        create_app(dp or create_dispatcher()),
+        host=settings.WEBHOOK_HOST,
+        port=settings.WEBHOOK_PORT,
+        reuse_port=settings.WEBHOOK_WORKERS > 1,
+        handle_signals=not spawned,
+        print=None,
+    )
+
+
+def run_webhook():
+    """Register the webhook and serve it with WEBHOOK_WORKERS processes"""
+    if not settings.WEBHOOK_SECRET:
+        logger.error("WEBHOOK_SECRET is required in webhook mode")
+        sys.exit(1)
+
+    # Routers can only be attached to one dispatcher per process
+    dp = create_dispatcher()
+    if settings.WEBHOOK_URL:
+        asyncio.run(register_webhook(dp))
+    else:
+        logger.warning("WEBHOOK_URL is not set, assuming the webhook is registered elsewhere")
+
+    workers = max(1, settings.WEBHOOK_WORKERS)
+    if workers == 1:
+        run_worker(0, dp)
+        return
+
+    # spawn: children must not inherit the parent's database connections
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(index,), name=f"webhook-worker-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop_workers(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+    for process in processes:
+        process.join()
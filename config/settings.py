@@ -10,7 +10,11 @@ class Settings(BaseSettings):
     
     # Database Configuration
     DATABASE_URL: str
-    
+    # Optional override for the async engine (derived from DATABASE_URL if empty)
+    ASYNC_DATABASE_URL: str = ""
+    DB_SLOW_QUERY_MS: int = 500  # Log statements slower than this (parameters redacted), 0 disables
+    DB_REPEATED_QUERY_THRESHOLD: int = 10  # Warn when one handler/route runs the same statement this often (N+1)
+
     # Crypto Payment Configuration
     CRYPTO_PROVIDER: str = "manual"
     CRYPTO_WALLET_ADDRESS: str = ""
@@ -18,6 +22,21 @@ class Settings(BaseSettings):
     USDT_TRC20_ADDRESS: str = ""
     USDT_BSC_ADDRESS: str = ""
     
+    # On-chain payment watcher (confirms payments from incoming USDT transfers)
+    PAYMENT_WATCHER_ENABLED: bool = False
+    PAYMENT_WATCHER_POLL_SECONDS: int = 30  # How often the transfer feeds are polled
+    PAYMENT_WATCHER_BATCH_SIZE: int = 200  # Transfers fetched per feed request
+    PAYMENT_WATCHER_RELOAD_SECONDS: int = 300  # Full rebuild of the pending payment index
+    PAYMENT_AMOUNT_SLOTS: int = 99  # Cent suffixes per price and network for unique amounts (0 disables)
+    PAYMENT_AMOUNT_TTL_SECONDS: int = 21600  # How long an open payment keeps its unique amount (and can be matched)
+    TRONGRID_API_URL: str = "https://api.trongrid.io"
+    TRONGRID_API_KEY: str = ""
+    USDT_TRC20_CONTRACT: str = "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t"
+    BSCSCAN_API_URL: str = "https://api.etherscan.io/v2/api"  # Etherscan v2 (chainid 56) or BscScan-compatible
+    BSCSCAN_API_KEY: str = ""
+    USDT_BSC_CONTRACT: str = "0x55d398326f99059fF775485246999027B3197955"
+    BSC_MIN_CONFIRMATIONS: int = 15  # Blocks before a BSC transfer counts as paid
+    
     # Bot Configuration
     ADMIN_USER_IDS: str = ""
     FREE_TRIAL_DAYS: int = 7
@@ -28,13 +47,83 @@ class Settings(BaseSettings):
     # Channel Configuration
     USE_INVITE_LINKS: bool = True  # Use invite links instead of unban (better for private channels)
     
+    # Subscription expiry
+    EXPIRY_SCHEDULER_BATCH_SIZE: int = 1000  # Upcoming deadlines kept in memory
+    EXPIRY_SWEEP_SECONDS: int = 300  # Full catch-up pass (covers subscriptions changed by the web admin)
+    
+    # Update delivery
+    BOT_MODE: str = "polling"  # "polling" or "webhook"
+    WEBHOOK_URL: str = ""  # Public base URL Telegram posts updates to (e.g. https://bot.example.com)
+    WEBHOOK_PATH: str = "/telegram/webhook"
+    WEBHOOK_SECRET: str = ""  # Required in webhook mode, checked against X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8081
+    WEBHOOK_WORKERS: int = 1  # Processes sharing the webhook port (SO_REUSEPORT)
+    TELEGRAM_API_SERVER: str = ""  # Custom Bot API server (local server or load tests), default api.telegram.org
+    
+    # Metrics (Prometheus; the web admin serves them on /metrics)
+    METRICS_HOST: str = "0.0.0.0"
+    METRICS_PORT: int = 9100  # Bot metrics port, 0 disables (webhook worker N uses METRICS_PORT + N)
+    METRICS_TOKEN: str = ""  # Bearer token for the web /metrics (without it only admin sessions can read them)
+    
+    # Leader election (background jobs run in one replica only)
+    INSTANCE_ID: str = ""  # Replica name in job_leases, suffixed with the pid (default: hostname)
+    LEADER_LEASE_SECONDS: int = 30  # A dead leader is replaced within lease + renew interval
+    LEADER_RENEW_SECONDS: int = 5  # How often the leader renews and standbys retry (keep lease above 3x this)
+    
+    # Telegram rate limits (outbound send queue)
+    TELEGRAM_GLOBAL_RATE: float = 25.0  # Bot API calls per second across all chats
+    TELEGRAM_PER_CHAT_RATE: float = 1.0  # Messages per second to a single chat
+    TELEGRAM_PER_CHAT_BURST: int = 3  # Messages a chat may receive back to back
+    CHANNEL_ADMIN_RATE: float = 20.0  # Ban/unban/invite calls per second in the channel
+    SEND_MAX_RETRIES: int = 3  # Automatic retries after flood control (RetryAfter)
+    
+    # Channel workers
+    CHANNEL_WORKERS: int = 8  # Concurrent channel removals
+    CHANNEL_QUEUE_SIZE: int = 10000  # Pending removals before the expiry loop waits
+    CHANNEL_MAX_RETRIES: int = 5  # Flood-control retries per removal after the send queue gave up
+    CHANNEL_PROGRESS_LOG_EVERY: int = 500  # Log progress every N processed removals
+    CHANNEL_REMOVAL_ATTEMPTS: int = 5  # Attempts per removal that raised before it waits for the next leader
+    CHANNEL_RETRY_BACKOFF_SECONDS: float = 30.0  # Delay before re-queueing a removal that raised, doubled per attempt
+    
+    # Dashboard counters
+    STATS_RECONCILE_SECONDS: int = 3600  # How often the leader recounts stats_counters from the tables
+    
+    # Admin panel
+    WEB_SESSION_BACKEND: str = "database"  # "database" (shared by all web workers) or "memory" (single worker)
+    WEB_SESSION_DATABASE_URL: str = ""  # Separate database for sessions (e.g. sqlite:///sessions.db); default DATABASE_URL
+    WEB_SESSION_TTL_SECONDS: int = 43200  # Idle time after which an admin is logged out
+    WEB_SESSION_TOUCH_SECONDS: int = 300  # Min interval between expiry updates of a database session
+    WEB_SESSION_MAX: int = 1000  # Max sessions kept by the memory backend (least recently used evicted)
+    WEB_BOT_CONNECTION_LIMIT: int = 100  # Max open Bot API connections per web process
+    
+    # Caching
+    PLAN_CATALOG_POLL_SECONDS: int = 10  # How often the bot checks for plan changes made by the web admin
+    SUBSCRIPTION_CACHE_SIZE: int = 50000  # Max users kept in the subscription status cache
+    SUBSCRIPTION_CACHE_TTL_SECONDS: int = 300  # Max age of a cached active subscription
+    SUBSCRIPTION_CACHE_NEGATIVE_TTL_SECONDS: int = 30  # Max age of a cached "no subscription" entry
+    SUBSCRIPTION_CACHE_POLL_SECONDS: int = 5  # How often each process checks for subscription writes by others
+    
     @property
     def admin_ids_list(self) -> List[int]:
         """Parse admin user IDs from comma-separated string"""
         if not self.ADMIN_USER_IDS:
             return []
         return [int(uid.strip()) for uid in self.ADMIN_USER_IDS.split(",") if uid.strip()]
-    
+
+    @property
+    def async_database_url(self) -> str:
+        """Database URL for the async engine (asyncpg driver)"""
+        if self.ASYNC_DATABASE_URL:
+            return self.ASYNC_DATABASE_URL
+        url = self.DATABASE_URL
+        for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+            if url.startswith(prefix):
+                return "postgresql+asyncpg://" + url[len(prefix):]
+        if url.startswith("sqlite://"):
+            return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+        return url
+
     model_config = ConfigDict(
         env_file=".env",
         case_sensitive=True,
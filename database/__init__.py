@@ -1,4 +1,4 @@
-from .base import Base, get_session, init_db
+from .base import Base, get_session, get_async_session, init_db
 from .models import (
     User,
     Plan,
@@ -6,11 +6,17 @@ from .models import (
     Payment,
     Referral,
     ReferralPoint,
+    CacheVersion,
+    JobLease,
+    StatsCounter,
+    AdminSession,
+    PaymentAmountSlot,
 )
 
 __all__ = [
     "Base",
     "get_session",
+    "get_async_session",
     "init_db",
     "User",
     "Plan",
@@ -18,5 +24,10 @@ __all__ = [
     "Payment",
     "Referral",
     "ReferralPoint",
+    "CacheVersion",
+    "JobLease",
+    "StatsCounter",
+    "AdminSession",
+    "PaymentAmountSlot",
 ]
 
@@ -0,0 +1,156 @@
+"""
+Statement instrumentation
+
+Cursor events on both engines (installed by database/base.py) time every
+statement and attribute it to the query scope of the running unit of work:
+the aiogram handler, the FastAPI route or a background job. Scopes are
+opened with query_scope() by the dispatcher middlewares, the web request
+middleware and the jobs, and renamed once the handler or route is known.
+
+Per scope the instrumentation
+
+  * counts statements and their time (db_queries_total{scope} and the
+    per-update / per-request histograms in utils/metrics.py)
+  * warns once when the same statement text runs DB_REPEATED_QUERY_THRESHOLD
+    times, the signature of a lazy load in a loop (N+1)
+  * logs statements slower than DB_SLOW_QUERY_MS with their parameters
+    redacted
+
+Tests can cap the statements of a block with query_budget(), which raises
+QueryBudgetExceeded listing what ran:
+
+    with query_budget(4):
+        await dp.feed_update(bot, update)
+"""
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config.settings import settings
+from utils.metrics import DB_QUERIES, DB_QUERY_SECONDS
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Statement text is cut to this length in log messages
+MAX_LOGGED_STATEMENT = 500
+UNSCOPED = "unscoped"
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A block ran more statements than its budget"""
+
+
+class QueryScope:
+    """Statements run by one handler, route or job (nested scopes also count toward their parents)"""
+
+    def __init__(self, name: str, parent: Optional["QueryScope"] = None, repeat_threshold: int = 0):
+        self.name = name
+        self.parent = parent
+        self.repeat_threshold = repeat_threshold
+        self.count = 0  # including nested scopes
+        self.own_count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement: str, elapsed: float):
+        self.own_count += 1
+        scope = self
+        while scope is not None:
+            scope.count += 1
+            scope.seconds += elapsed
+            scope.statements[statement] += 1
+            scope = scope.parent
+
+        if self.repeat_threshold and self.statements[statement] == self.repeat_threshold:
+            logger.warning(f"Statement repeated {self.repeat_threshold} times in {self.name} "
+                           f"(possible N+1): {_shorten(statement)}")
+
+    def most_common(self, limit: int = 5) -> str:
+        return "\n".join(f"  {count}x {_shorten(statement)}" for statement, count in self.statements.most_common(limit))
+
+
+_current_scope: ContextVar[Optional[QueryScope]] = ContextVar("query_scope", default=None)
+
+
+def current_scope() -> Optional[QueryScope]:
+    """Scope of the running handler, route or job, if any"""
+    return _current_scope.get()
+
+
+@contextmanager
+def query_scope(name: str) -> Iterator[QueryScope]:
+    """Attribute the statements of the current task (and the threads it hands work to) to ``name``"""
+    scope = QueryScope(name, parent=_current_scope.get(), repeat_threshold=settings.DB_REPEATED_QUERY_THRESHOLD)
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+        if scope.own_count:
+            DB_QUERIES.labels(scope.name).inc(scope.own_count)
+
+
+@contextmanager
+def query_budget(max_queries: int, name: str = "query budget") -> Iterator[QueryScope]:
+    """Fail with QueryBudgetExceeded if the block runs more than ``max_queries`` statements"""
+    scope = QueryScope(name, parent=_current_scope.get())
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+    if scope.count > max_queries:
+        raise QueryBudgetExceeded(
+            f"{name}: {scope.count} statements, budget {max_queries}. Most frequent:\n{scope.most_common()}"
+        )
+
+
+def redact_parameters(parameters) -> str:
+    """Parameter shape without the values (they may hold personal data or secrets)"""
+    if not parameters:
+        return ""
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}=?" for key in parameters) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if isinstance(parameters[0], (dict, list, tuple)):
+            return f"[{len(parameters)} parameter sets]"
+        return "(" + ", ".join("?" for _ in parameters) + ")"
+    return "?"
+
+
+def _shorten(statement: str) -> str:
+    statement = " ".join(statement.split())
+    if len(statement) > MAX_LOGGED_STATEMENT:
+        return statement[:MAX_LOGGED_STATEMENT] + "..."
+    return statement
+
+
+def instrument_engine(engine: Engine, name: str):
+    """Time and attribute every statement of an engine (pass ``async_engine.sync_engine`` for async engines)"""
+    histogram = DB_QUERY_SECONDS.labels(name)
+    slow_seconds = settings.DB_SLOW_QUERY_MS / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        histogram.observe(elapsed)
+        scope = _current_scope.get()
+        if scope is not None:
+            scope.record(statement, elapsed)
+        if slow_seconds and elapsed >= slow_seconds:
+            logger.warning(f"Slow statement ({elapsed * 1000:.0f} ms) in {scope.name if scope else UNSCOPED}: "
+                           f"{_shorten(statement)} {redact_parameters(parameters)}")
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
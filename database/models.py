@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, ForeignKey, Numeric, Text, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, ForeignKey, Numeric, Text, Enum, Index, JSON
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from datetime import datetime, timedelta
 import enum
 from .base import Base
@@ -28,6 +28,10 @@ class PlanDuration(str, enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Keyset pagination in the admin panel
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     telegram_id = Column(BigInteger, unique=True, nullable=False, index=True)
@@ -37,6 +41,8 @@ class User(Base):
     language_code = Column(String(10), default="ar")
     referral_code = Column(String(20), unique=True, nullable=False, index=True)
     free_trial_used = Column(Boolean, default=False)
+    # Sum of referral_points.points, maintained in the same transaction as each ledger insert
+    points_balance = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -58,7 +64,7 @@ class Plan(Base):
     duration_days = Column(Integer, nullable=False)  # Number of days
     price = Column(Numeric(10, 2), nullable=False)
     currency = Column(String(10), default="USDT")
-    is_active = Column(Boolean, default=True)
+    is_active = Column(Boolean, default=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
@@ -67,14 +73,32 @@ class Plan(Base):
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        # Active/trial subscription of a user (also serves user_id lookups)
+        Index("ix_subscriptions_user_id_status", "user_id", "status"),
+        # Deadline lookups by the expiry scheduler, live subscriptions only
+        Index(
+            "ix_subscriptions_live_end_date", "end_date", "id",
+            postgresql_where=text("status IN ('ACTIVE', 'TRIAL')"),
+        ),
+        # Status counts and recently changed subscriptions
+        Index("ix_subscriptions_status_updated_at", "status", "updated_at"),
+        # Keyset pagination in the admin panel, unfiltered and by status
+        Index("ix_subscriptions_created_at_id", "created_at", "id"),
+        Index("ix_subscriptions_status_created_at_id", "status", "created_at", "id"),
+        # Channel removals still to do after expiry
+        Index("ix_subscriptions_removal_pending", "id", postgresql_where=text("removal_pending")),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     plan_id = Column(Integer, ForeignKey("plans.id"), nullable=False)
     status = Column(Enum(SubscriptionStatus), default=SubscriptionStatus.ACTIVE)
     start_date = Column(DateTime(timezone=True), nullable=False)
     end_date = Column(DateTime(timezone=True), nullable=False)
     is_trial = Column(Boolean, default=False)
+    # Expired and the member not yet removed from the channel (cleared by the channel workers)
+    removal_pending = Column(Boolean, nullable=False, default=False, server_default="false")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -86,17 +110,22 @@ class Subscription(Base):
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        # Pending payments of a user (also serves user_id lookups)
+        Index("ix_payments_user_id_status", "user_id", "status"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     subscription_id = Column(Integer, ForeignKey("subscriptions.id"), nullable=True)
     plan_id = Column(Integer, ForeignKey("plans.id"), nullable=False)
     amount = Column(Numeric(10, 2), nullable=False)
     currency = Column(String(10), nullable=False)
     network = Column(String(20), nullable=True)  # TRC20, BSC, etc.
-    status = Column(Enum(PaymentStatus), default=PaymentStatus.PENDING)
+    status = Column(Enum(PaymentStatus), default=PaymentStatus.PENDING, index=True)
     provider = Column(String(50), default="manual")
     transaction_id = Column(String(255), nullable=True, unique=True, index=True)
+    idempotency_key = Column(String(255), nullable=True, unique=True)  # Key of the request that confirmed it
     wallet_address = Column(String(255), nullable=True)
     payment_proof = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -109,9 +138,13 @@ class Payment(Base):
 
 class Referral(Base):
     __tablename__ = "referrals"
+    __table_args__ = (
+        # Duplicate-referral check (also serves referrer_id lookups)
+        Index("ix_referrals_referrer_id_referred_id", "referrer_id", "referred_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    referrer_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    referrer_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     referred_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     points_awarded = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -135,3 +168,52 @@ class ReferralPoint(Base):
     user = relationship("User", back_populates="referral_points")
     referral = relationship("Referral")
 
+
+
+class CacheVersion(Base):
+    """Version counters used to invalidate in-process caches across containers"""
+    __tablename__ = "cache_versions"
+    
+    name = Column(String(50), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class JobLease(Base):
+    """Lease that makes one bot replica the owner of the background jobs"""
+    __tablename__ = "job_leases"
+    
+    name = Column(String(50), primary_key=True)
+    holder = Column(String(100), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    acquired_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class StatsCounter(Base):
+    """Dashboard counter maintained by the services (see services/stats_service.py)"""
+    __tablename__ = "stats_counters"
+    
+    name = Column(String(50), primary_key=True)
+    value = Column(Numeric(20, 2), nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class AdminSession(Base):
+    """Web admin login session (shared by every web worker, see web/session_store.py)"""
+    __tablename__ = "admin_sessions"
+    
+    session_key = Column(String(64), primary_key=True)  # sha256 of the cookie value
+    data = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class PaymentAmountSlot(Base):
+    """Unique amount held by an open on-chain payment (see services/amount_slots.py)"""
+    __tablename__ = "payment_amount_slots"
+    
+    network = Column(String(20), primary_key=True)
+    amount = Column(Numeric(10, 2), primary_key=True)
+    payment_id = Column(Integer, ForeignKey("payments.id", ondelete="CASCADE"), nullable=True, unique=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
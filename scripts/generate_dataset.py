@@ -0,0 +1,311 @@
+"""
+Script to fill a database with synthetic data for scale testing
+
+Generates users with a referral graph (a few heavy referrers, many with
+none), referral point ledgers with credits and redemptions, trial and paid
+subscription histories and the TRC20/BSC payments behind them. Sign-ups
+grow over --days, subscriptions renew or lapse, so end dates spread from
+long expired to a year ahead the way a live bot's do.
+
+Rows are streamed with COPY in batches of --batch-size users, one
+transaction per batch, ids drawn from the tables' sequences. Afterwards
+points balances and dashboard counters are rebuilt and the tables analyzed.
+Synthetic users get Telegram IDs from --telegram-id-start up, continuing
+after the previous run, so the script can be run again to grow a dataset.
+The same --seed on an empty database gives the same data.
+
+Run it against a scratch database with the plans initialized
+(scripts/init_plans.py); it never deletes anything.
+
+Usage:
+    python scripts/generate_dataset.py --users 100000
+    python scripts/generate_dataset.py --rows 5000000 --seed 7
+"""
+import sys
+import os
+import argparse
+import asyncio
+import csv
+import io
+import math
+import random
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from config.settings import settings
+from database.base import engine
+from scripts.reconcile_points import reconcile_points
+from services.referral_service import REFERRAL_POINTS
+from services.stats_service import StatsService
+from utils.referral_code import referral_code_for
+
+# Real Telegram IDs are well below this; derived referral codes stay unique
+DEFAULT_TELEGRAM_ID_START = 900_000_000_000
+
+COLUMNS = {
+    "users": ("id", "telegram_id", "username", "first_name", "last_name", "language_code",
+              "referral_code", "free_trial_used", "points_balance", "created_at", "updated_at"),
+    "referrals": ("id", "referrer_id", "referred_id", "points_awarded", "created_at"),
+    "referral_points": ("id", "user_id", "points", "description", "referral_id", "created_at"),
+    "subscriptions": ("id", "user_id", "plan_id", "status", "start_date", "end_date", "is_trial",
+                      "created_at", "updated_at"),
+    "payments": ("id", "user_id", "subscription_id", "plan_id", "amount", "currency", "network", "status",
+                 "provider", "transaction_id", "wallet_address", "created_at", "updated_at"),
+}
+
+FIRST_NAMES = ["Ahmed", "Mohammed", "Omar", "Ali", "Youssef", "Khaled", "Sara", "Fatima", "Layla", "Nour",
+               "أحمد", "محمد", "عمر", "علي", "يوسف", "سارة", "فاطمة", "ليلى", "John", "Maria"]
+LAST_NAMES = ["Hassan", "Ibrahim", "Saleh", "Mansour", "Haddad", "Khalil", "الحسن", "إبراهيم", "Smith"]
+
+NETWORKS = [("TRC20", 65), ("BSC", 35)]
+
+
+class DatasetGenerator:
+    """Builds the rows of each batch of users, keeping the referral graph across batches"""
+
+    def __init__(self, rng: random.Random, plans: list, total_users: int, telegram_id_start: int, args):
+        self.rng = rng
+        self.plans = plans
+        # Shorter plans sell more
+        self.plan_weights = [1 / math.sqrt(plan["duration_days"]) for plan in plans]
+        self.total_users = total_users
+        self.telegram_id_start = telegram_id_start
+        self.args = args
+        self.now = datetime.now(timezone.utc)
+        self.first_signup = self.now - timedelta(days=args.days)
+        self.user_ids = array("q")  # ids of the users generated so far, by position
+        self.referrers = array("q")  # one entry per referral made: picks favour busy referrers
+        self.wallets = {"TRC20": settings.USDT_TRC20_ADDRESS or None, "BSC": settings.USDT_BSC_ADDRESS or None}
+
+    def signup_time(self, position: int) -> datetime:
+        # Cumulative sign-ups grow quadratically: most users joined recently
+        share = math.sqrt((position + self.rng.random()) / self.total_users)
+        return self.first_signup + (self.now - self.first_signup) * min(share, 1.0)
+
+    def batch(self, count: int, ids: dict) -> dict:
+        """Rows for the next ``count`` users, with ids taken from ``ids`` (table -> iterator)"""
+        rows = {table: [] for table in COLUMNS}
+        for _ in range(count):
+            self._user(rows, ids)
+        return rows
+
+    def _user(self, rows: dict, ids: dict):
+        rng, args = self.rng, self.args
+        position = len(self.user_ids)
+        user_id = next(ids["users"])
+        telegram_id = self.telegram_id_start + position
+        created_at = self.signup_time(position)
+        trial = rng.random() < args.trial_share
+
+        rows["users"].append((
+            user_id, telegram_id,
+            f"user{telegram_id}" if rng.random() < 0.6 else None,
+            rng.choice(FIRST_NAMES),
+            rng.choice(LAST_NAMES) if rng.random() < 0.4 else None,
+            "ar" if rng.random() < 0.7 else "en",
+            referral_code_for(telegram_id), trial, 0, created_at, None,
+        ))
+
+        if position and rng.random() < args.referred_share:
+            self._referral(rows, ids, user_id, created_at)
+        self.user_ids.append(user_id)
+
+        started = created_at + timedelta(minutes=rng.expovariate(1 / 30))
+        if trial:
+            started = self._subscription(rows, ids, user_id, None, started, is_trial=True)
+        if rng.random() < args.subscriber_share:
+            self._paid_history(rows, ids, user_id, started + timedelta(days=rng.expovariate(1 / 5)))
+        if rng.random() < args.abandoned_share:
+            self._payment(rows, ids, user_id, None, rng.choices(self.plans, self.plan_weights)[0],
+                          created_at + timedelta(hours=rng.expovariate(1 / 48)), completed=False)
+
+    def _referral(self, rows: dict, ids: dict, user_id: int, created_at: datetime):
+        rng = self.rng
+        if self.referrers and rng.random() < 0.5:
+            referrer_id = rng.choice(self.referrers)
+        else:
+            referrer_id = self.user_ids[rng.randrange(len(self.user_ids))]
+        self.referrers.append(referrer_id)
+
+        referral_id = next(ids["referrals"])
+        rows["referrals"].append((referral_id, referrer_id, user_id, REFERRAL_POINTS, created_at))
+        rows["referral_points"].append((
+            next(ids["referral_points"]), referrer_id, REFERRAL_POINTS,
+            f"Referral bonus for user {user_id}", referral_id, created_at,
+        ))
+        if rng.random() < self.args.redeem_share:
+            # Spending the points just earned keeps every balance non-negative
+            redeemed_at = min(created_at + timedelta(days=rng.expovariate(1 / 14)), self.now)
+            rows["referral_points"].append((
+                next(ids["referral_points"]), referrer_id, -REFERRAL_POINTS,
+                f"Points redemption: {REFERRAL_POINTS} points", None, redeemed_at,
+            ))
+
+    def _paid_history(self, rows: dict, ids: dict, user_id: int, start: datetime):
+        """Consecutive paid subscriptions until the user churns or reaches today"""
+        rng = self.rng
+        while start < self.now:
+            plan = rng.choices(self.plans, self.plan_weights)[0]
+            subscription_id = next(ids["subscriptions"])
+            self._payment(rows, ids, user_id, subscription_id, plan,
+                          start - timedelta(minutes=rng.uniform(1, 30)), completed=True)
+            end = self._subscription(rows, ids, user_id, plan, start, subscription_id=subscription_id)
+            if rng.random() >= self.args.renew_share:
+                break
+            # Most renewals are on time, the rest come back after a gap
+            start = end if rng.random() < 0.6 else end + timedelta(days=rng.expovariate(1 / 20))
+
+    def _subscription(self, rows: dict, ids: dict, user_id: int, plan, start: datetime,
+                      is_trial: bool = False, subscription_id: int = None) -> datetime:
+        if is_trial:
+            plan = self.plans[0]
+            end = start + timedelta(days=settings.FREE_TRIAL_DAYS)
+        else:
+            end = start + timedelta(days=plan["duration_days"])
+        if end > self.now:
+            status = "TRIAL" if is_trial else "ACTIVE"
+            updated_at = None
+        else:
+            status = "CANCELLED" if self.rng.random() < 0.05 else "EXPIRED"
+            updated_at = end
+        rows["subscriptions"].append((
+            subscription_id or next(ids["subscriptions"]), user_id, plan["id"], status,
+            start, end, is_trial, start, updated_at,
+        ))
+        return end
+
+    def _payment(self, rows: dict, ids: dict, user_id: int, subscription_id, plan, created_at: datetime,
+                 completed: bool):
+        rng = self.rng
+        network = rng.choices([name for name, _ in NETWORKS], [weight for _, weight in NETWORKS])[0]
+        created_at = min(created_at, self.now)
+        if completed:
+            # Unique cent suffix, as handed out by services/amount_slots.py
+            amount = plan["price"] + rng.randint(1, settings.PAYMENT_AMOUNT_SLOTS or 99) / 100
+            tx_hash = f"{rng.getrandbits(256):064x}"
+            transaction_id = f"0x{tx_hash}" if network == "BSC" else tx_hash
+            status, updated_at = "COMPLETED", created_at + timedelta(minutes=rng.uniform(1, 20))
+        else:
+            amount, transaction_id = plan["price"], None
+            status, updated_at = "FAILED", min(created_at + timedelta(days=1), self.now)
+        rows["payments"].append((
+            next(ids["payments"]), user_id, subscription_id, plan["id"], f"{amount:.2f}", "USDT", network,
+            status, settings.CRYPTO_PROVIDER, transaction_id, self.wallets[network], created_at, updated_at,
+        ))
+
+
+class SequenceIds:
+    """Ids drawn from a table's sequence a block at a time (row counts are only known once generated)"""
+
+    BLOCK = 10000
+
+    def __init__(self, cursor, table: str):
+        self.cursor = cursor
+        self.table = table
+        self._ids = iter(())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> int:
+        value = next(self._ids, None)
+        if value is None:
+            self._ids = allocate_ids(self.cursor, self.table, self.BLOCK)
+            value = next(self._ids)
+        return value
+
+
+def rows_per_user(plans: list, args) -> float:
+    """Average rows written per user, measured on a throwaway sample"""
+    sample = 2000
+    generator = DatasetGenerator(random.Random(args.seed), plans, sample, DEFAULT_TELEGRAM_ID_START, args)
+    counter = iter(range(1, 1 << 62))
+    rows = generator.batch(sample, {table: counter for table in COLUMNS})
+    return sum(len(table_rows) for table_rows in rows.values()) / sample
+
+
+def allocate_ids(cursor, table: str, count: int):
+    """Reserve ``count`` ids from a table's sequence"""
+    cursor.execute(f"SELECT nextval(pg_get_serial_sequence('{table}', 'id')) FROM generate_series(1, %s)", (count,))
+    return iter([row[0] for row in cursor.fetchall()])
+
+
+def copy_rows(cursor, table: str, rows: list):
+    buffer = io.StringIO()
+    # Empty unquoted CSV fields load as NULL
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(COLUMNS[table])}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def generate_dataset(args):
+    with engine.connect() as conn:
+        plans = [dict(row._mapping) for row in conn.execute(text(
+            "SELECT id, price, duration_days FROM plans WHERE is_active ORDER BY duration_days, id"
+        ))]
+        telegram_id_start = conn.scalar(
+            text("SELECT COALESCE(MAX(telegram_id) + 1, :start) FROM users WHERE telegram_id >= :start"),
+            {"start": args.telegram_id_start},
+        )
+    if not plans:
+        sys.exit("No active plans: run scripts/init_plans.py first")
+    for plan in plans:
+        plan["price"] = float(plan["price"])
+
+    users = args.users
+    if args.rows:
+        per_user = rows_per_user(plans, args)
+        users = math.ceil(args.rows / per_user)
+        print(f"~{per_user:.2f} rows per user: generating {users} users for {args.rows} rows")
+
+    generator = DatasetGenerator(random.Random(args.seed), plans, users, telegram_id_start, args)
+    totals = {table: 0 for table in COLUMNS}
+    started = time.perf_counter()
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        ids = {table: SequenceIds(cursor, table) for table in COLUMNS}
+        done = 0
+        while done < users:
+            count = min(args.batch_size, users - done)
+            rows = generator.batch(count, ids)
+            for table in COLUMNS:
+                copy_rows(cursor, table, rows[table])
+                totals[table] += len(rows[table])
+            raw.commit()
+            done += count
+            elapsed = time.perf_counter() - started
+            print(f"{done}/{users} users, {sum(totals.values())} rows, {sum(totals.values()) / elapsed:.0f} rows/s")
+    finally:
+        raw.close()
+
+    print(f"Inserted {totals} in {time.perf_counter() - started:.1f}s")
+    reconcile_points()
+    corrections = asyncio.run(StatsService.reconcile_async())
+    print(f"Dashboard counters updated: {corrections}")
+    with engine.connect() as conn:
+        conn.execute(text(f"ANALYZE {', '.join(COLUMNS)}"))
+        conn.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the database with synthetic data for scale testing")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--users", type=int, default=100000, help="users to generate")
+    size.add_argument("--rows", type=int, help="total rows to generate across all tables (sets --users)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=10000, help="users per COPY batch and transaction")
+    parser.add_argument("--days", type=int, default=730, help="sign-ups spread over this many days")
+    parser.add_argument("--referred-share", type=float, default=0.35, help="users who came through a referral")
+    parser.add_argument("--redeem-share", type=float, default=0.2, help="referral bonuses spent again")
+    parser.add_argument("--trial-share", type=float, default=0.5, help="users who took the free trial")
+    parser.add_argument("--subscriber-share", type=float, default=0.3, help="users who paid at least once")
+    parser.add_argument("--renew-share", type=float, default=0.55, help="paid subscriptions that get renewed")
+    parser.add_argument("--abandoned-share", type=float, default=0.15, help="users with a failed payment")
+    parser.add_argument("--telegram-id-start", type=int, default=DEFAULT_TELEGRAM_ID_START)
+    generate_dataset(parser.parse_args())
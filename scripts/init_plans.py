@@ -10,6 +10,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database.base import get_session, init_db
 from database.models import Plan, PlanDuration
+from services.cache_versions import bump_cache_version
+from services.plan_service import PLAN_CATALOG_CACHE
 
 def init_plans():
     """Initialize default plans"""
@@ -68,6 +70,8 @@ def init_plans():
         for plan in plans:
             session.add(plan)
         
+        # Running bots reload their plan catalog when the version changes
+        session.execute(bump_cache_version(PLAN_CATALOG_CACHE))
         session.commit()
         print(f"Initialized {len(plans)} plans successfully!")
 
@@ -0,0 +1,71 @@
+"""
+Script to rebuild users.points_balance from the referral_points ledger
+
+Balances are maintained incrementally by ReferralService. Run this whenever
+balances are suspected to have drifted. Drifted users are found without
+locking anything, then each one is rebuilt in its own short transaction:
+the user row is locked first and the ledger summed after, the order
+ReferralService writes them in, so a concurrent credit or redemption for
+that user waits for the rebuild (or the rebuild for it) and nothing is lost
+or deadlocks. Other users are never blocked.
+
+Usage:
+    python scripts/reconcile_points.py            # rebuild balances
+    python scripts/reconcile_points.py --dry-run  # only report drift
+"""
+import sys
+import os
+import argparse
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database.base import engine
+
+DRIFTED_USERS_SQL = """
+SELECT u.id, ABS(u.points_balance - COALESCE(l.total, 0))
+FROM users u
+LEFT JOIN (
+    SELECT user_id, SUM(points) AS total
+    FROM referral_points
+    GROUP BY user_id
+) l ON l.user_id = u.id
+WHERE u.points_balance <> COALESCE(l.total, 0)
+ORDER BY u.id
+"""
+
+LOCK_USER_SQL = "SELECT id FROM users WHERE id = :user_id FOR UPDATE"
+
+REBUILD_USER_SQL = """
+UPDATE users
+SET points_balance = (SELECT COALESCE(SUM(points), 0) FROM referral_points WHERE user_id = :user_id)
+WHERE id = :user_id
+  AND points_balance <> (SELECT COALESCE(SUM(points), 0) FROM referral_points WHERE user_id = :user_id)
+"""
+
+
+def reconcile_points(dry_run: bool = False):
+    """Rebuild the balance of every drifted user from the ledger, one user per transaction"""
+    with engine.connect() as conn:
+        drifted = conn.execute(text(DRIFTED_USERS_SQL)).all()
+        conn.rollback()
+        print(f"{len(drifted)} users with a drifted balance ({sum(off for _, off in drifted)} points off in total)")
+        if dry_run:
+            return
+
+        updated = 0
+        for user_id, _ in drifted:
+            # The ledger is summed by a statement run after the lock, so it sees every
+            # entry committed with a balance update for this user
+            conn.execute(text(LOCK_USER_SQL), {"user_id": user_id})
+            updated += conn.execute(text(REBUILD_USER_SQL), {"user_id": user_id}).rowcount
+            conn.commit()
+        print(f"Rebuilt {updated} balances from the ledger")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild users.points_balance from referral_points")
+    parser.add_argument("--dry-run", action="store_true", help="only report drift")
+    args = parser.parse_args()
+    reconcile_points(dry_run=args.dry_run)
@@ -0,0 +1,129 @@
+"""
+Unique payment amounts
+
+Every open on-chain payment pays the plan price plus a cent suffix that no
+other open payment on the same network uses (30.00 -> 30.01 .. 30.99), so
+an incoming transfer identifies its payment by (network, amount) alone.
+
+The suffixes are slots in ``payment_amount_slots``, shared by every replica.
+A slot is claimed with one upsert that picks a random free suffix and takes
+over expired ones, and is released when its payment is confirmed or when the
+same user opens a new payment on that network. When every suffix of a price
+is taken the payment falls back to the plain price (manual confirmation).
+"""
+from datetime import timedelta
+from decimal import Decimal
+from typing import Optional
+from sqlalchemy import delete, exists, func, literal, select, update, Numeric, String, Integer
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database.models import PaymentAmountSlot
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUFFIX_STEP = Decimal("0.01")
+# Concurrent claims can pick the same suffix; the loser retries with another
+CLAIM_ATTEMPTS = 3
+
+
+def _claim_slot_stmt(network: str, base_amount: Decimal, user_id: int, slots: int, ttl_seconds: int):
+    """Upsert claiming a random free suffix of base_amount, RETURNING the amount (no row if none is free)"""
+    suffixes = func.generate_series(1, slots).table_valued("k").render_derived()
+    candidate = literal(base_amount, Numeric(10, 2)) + suffixes.c.k * SUFFIX_STEP
+    taken = exists().where(
+        PaymentAmountSlot.network == network,
+        PaymentAmountSlot.amount == candidate,
+        PaymentAmountSlot.expires_at > func.now(),
+    )
+    choice = (
+        select(
+            literal(network, String),
+            candidate,
+            literal(user_id, Integer),
+            func.now() + timedelta(seconds=ttl_seconds),
+        )
+        .select_from(suffixes)
+        .where(~taken)
+        .order_by(func.random())
+        .limit(1)
+    )
+    stmt = insert(PaymentAmountSlot).from_select(["network", "amount", "user_id", "expires_at"], choice)
+    return stmt.on_conflict_do_update(
+        index_elements=[PaymentAmountSlot.network, PaymentAmountSlot.amount],
+        set_={"payment_id": None, "user_id": stmt.excluded.user_id, "expires_at": stmt.excluded.expires_at},
+        # Only take over an expired slot; a live one means another claim won the race
+        where=PaymentAmountSlot.expires_at <= func.now(),
+    ).returning(PaymentAmountSlot.amount)
+
+
+def _release_user_slots_stmt(network: str, user_id: int):
+    """A new payment supersedes the user's open ones on the same network"""
+    return delete(PaymentAmountSlot).where(
+        PaymentAmountSlot.network == network,
+        PaymentAmountSlot.user_id == user_id,
+    )
+
+
+def _assign_slot_stmt(network: str, amount: Decimal, payment_id: int):
+    return update(PaymentAmountSlot).where(
+        PaymentAmountSlot.network == network,
+        PaymentAmountSlot.amount == amount,
+    ).values(payment_id=payment_id)
+
+
+def _release_payment_slot_stmt(payment_id: int):
+    return delete(PaymentAmountSlot).where(PaymentAmountSlot.payment_id == payment_id)
+
+
+class AmountSlots:
+    """Claim and release unique payment amounts in the caller's transaction"""
+
+    @staticmethod
+    def claim(session: Session, network: str, base_amount: Decimal, user_id: int) -> Optional[Decimal]:
+        """Reserve a unique amount for a new payment, or None if every suffix is taken"""
+        session.execute(_release_user_slots_stmt(network, user_id))
+        for _ in range(CLAIM_ATTEMPTS):
+            amount = session.scalar(_claim_slot_stmt(
+                network, base_amount, user_id, settings.PAYMENT_AMOUNT_SLOTS, settings.PAYMENT_AMOUNT_TTL_SECONDS
+            ))
+            if amount is not None:
+                return amount
+        logger.warning(f"No free amount suffix for {base_amount} on {network}")
+        return None
+
+    @staticmethod
+    async def claim_async(session: AsyncSession, network: str, base_amount: Decimal,
+                          user_id: int) -> Optional[Decimal]:
+        """Reserve a unique amount for a new payment, or None if every suffix is taken (async)"""
+        await session.execute(_release_user_slots_stmt(network, user_id))
+        for _ in range(CLAIM_ATTEMPTS):
+            amount = await session.scalar(_claim_slot_stmt(
+                network, base_amount, user_id, settings.PAYMENT_AMOUNT_SLOTS, settings.PAYMENT_AMOUNT_TTL_SECONDS
+            ))
+            if amount is not None:
+                return amount
+        logger.warning(f"No free amount suffix for {base_amount} on {network}")
+        return None
+
+    @staticmethod
+    def assign(session: Session, network: str, amount: Decimal, payment_id: int):
+        """Link a claimed amount to the payment created with it"""
+        session.execute(_assign_slot_stmt(network, amount, payment_id))
+
+    @staticmethod
+    async def assign_async(session: AsyncSession, network: str, amount: Decimal, payment_id: int):
+        """Link a claimed amount to the payment created with it (async)"""
+        await session.execute(_assign_slot_stmt(network, amount, payment_id))
+
+    @staticmethod
+    def release(session: Session, payment_id: int):
+        """Free the amount of a settled payment"""
+        session.execute(_release_payment_slot_stmt(payment_id))
+
+    @staticmethod
+    async def release_async(session: AsyncSession, payment_id: int):
+        """Free the amount of a settled payment (async)"""
+        await session.execute(_release_payment_slot_stmt(payment_id))
@@ -0,0 +1,18 @@
+"""
+Shared cache_versions counters
+
+A writer bumps a named row in the same transaction as the write; processes
+caching the data poll the row and reload when its version changes.
+"""
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from database.models import CacheVersion
+
+
+def bump_cache_version(name: str):
+    """Upsert that increments the ``name`` cache version (execute it in the writing transaction)"""
+    stmt = insert(CacheVersion).values(name=name, version=1)
+    return stmt.on_conflict_do_update(
+        index_elements=[CacheVersion.name],
+        set_={"version": CacheVersion.version + 1, "updated_at": func.now()},
+    )
@@ -0,0 +1,158 @@
+"""
+Deadline-driven subscription expiry
+
+Instead of scanning every live subscription once an hour, the scheduler keeps
+the next upcoming end_date deadlines in a min-heap, loaded in keyset batches
+over the (status, end_date) index. It sleeps until the earliest deadline, runs
+the set-based expiry (SubscriptionService.check_and_expire_subscriptions_async)
+and hands the newly expired members to a callback.
+
+Subscriptions created or activated in this process are pushed into the heap
+through schedule(). Changes made by other processes (the web admin) are picked
+up by a periodic sweep that expires anything overdue and reloads the heap.
+"""
+import asyncio
+import heapq
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Tuple
+from config.settings import settings
+from database.instrumentation import query_scope
+from utils.metrics import EXPIRY_RUN_SECONDS
+from utils.timeutils import utc_timestamp
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fire slightly after the deadline so the database clock (now()) agrees it has passed
+FIRE_DELAY_SECONDS = 1.0
+
+
+class ExpiryScheduler:
+    """Min-heap of upcoming subscription deadlines"""
+
+    def __init__(self, batch_size: int, sweep_interval: float):
+        self.batch_size = batch_size
+        self.sweep_interval = sweep_interval
+        self._heap: List[Tuple[float, int]] = []
+        self._cursor: Optional[Tuple[datetime, int]] = None  # last loaded (end_date, id)
+        self._horizon = 0.0  # deadlines up to this timestamp are all in the heap
+        self._exhausted = False  # every live deadline is in the heap
+        self._running = False
+        self._wakeup = asyncio.Event()
+        self.fired = 0
+        self.sweeps = 0
+
+    def schedule(self, subscription_id: int, end_date: datetime):
+        """Track a new or extended deadline (no-op unless the scheduler runs in this process)"""
+        if not self._running:
+            return
+
+        deadline = utc_timestamp(end_date)
+        if not self._exhausted and deadline > self._horizon:
+            # Beyond the loaded window: the next batch load will pick it up
+            return
+
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (deadline, subscription_id))
+        if earliest is None or deadline < earliest:
+            self._wakeup.set()
+
+    async def run(self, on_expired: Callable[[list], Awaitable[None]]):
+        """Expire subscriptions at their deadlines forever (run as a background task)"""
+        self._running = True
+        try:
+            await self._run_loop(on_expired)
+        finally:
+            # Stopped (e.g. leadership moved to another replica): stop tracking deadlines
+            self._running = False
+            self._reset()
+
+    async def _run_loop(self, on_expired):
+        next_sweep = 0.0  # start with a sweep to catch up on anything already overdue
+        while True:
+            try:
+                sweep_due = time.monotonic() >= next_sweep
+                if sweep_due:
+                    self._reset()
+
+                if not self._heap and not self._exhausted:
+                    await self._load_batch()
+
+                due = self._pop_due(time.time() - FIRE_DELAY_SECONDS)
+                if due or sweep_due:
+                    await self._expire(on_expired)
+
+                if sweep_due:
+                    self.sweeps += 1
+                    next_sweep = time.monotonic() + self.sweep_interval
+                    logger.debug(f"Expiry sweep done: {self.stats()}")
+
+                await self._sleep_until(next_sweep)
+            except Exception as e:
+                logger.error(f"Error in expiry scheduler: {e}", exc_info=True)
+                await asyncio.sleep(self.sweep_interval)
+
+    def stats(self) -> dict:
+        """Scheduler counters"""
+        return {
+            "pending_deadlines": len(self._heap),
+            "next_deadline": self._heap[0][0] if self._heap else None,
+            "fired": self.fired,
+            "sweeps": self.sweeps,
+        }
+
+    def _reset(self):
+        self._heap.clear()
+        self._cursor = None
+        self._horizon = 0.0
+        self._exhausted = False
+
+    async def _load_batch(self):
+        from services.subscription_service import SubscriptionService
+
+        rows = await SubscriptionService.get_upcoming_deadlines_async(self._cursor, self.batch_size)
+        for end_date, subscription_id in rows:
+            heapq.heappush(self._heap, (utc_timestamp(end_date), subscription_id))
+
+        if rows:
+            self._cursor = rows[-1]
+            self._horizon = utc_timestamp(rows[-1][0])
+        self._exhausted = len(rows) < self.batch_size
+
+    def _pop_due(self, now: float) -> List[int]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[1])
+        return due
+
+    async def _expire(self, on_expired):
+        from services.subscription_service import SubscriptionService
+
+        with EXPIRY_RUN_SECONDS.time(), query_scope("job:expiry"):
+            expired = await SubscriptionService.check_and_expire_subscriptions_async()
+            if expired:
+                self.fired += len(expired)
+                logger.info(f"Expired {len(expired)} subscriptions")
+                await on_expired(expired)
+
+    async def _sleep_until(self, next_sweep: float):
+        timeout = next_sweep - time.monotonic()
+        if self._heap:
+            timeout = min(timeout, self._heap[0][0] + FIRE_DELAY_SECONDS - time.time())
+        elif not self._exhausted:
+            timeout = 0  # load the next batch right away
+        if timeout <= 0:
+            return
+
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+expiry_scheduler = ExpiryScheduler(
+    batch_size=settings.EXPIRY_SCHEDULER_BATCH_SIZE,
+    sweep_interval=settings.EXPIRY_SWEEP_SECONDS,
+)
@@ -0,0 +1,144 @@
+"""
+Leader election for background jobs
+
+Every bot replica (container or webhook worker process) competes for the
+same row in ``job_leases``. The replica named in the row owns the background
+jobs while ``expires_at`` lies in the future and keeps the lease by renewing
+it every ``renew_interval`` seconds. Acquiring and renewing are one
+conditional upsert evaluated on the database clock, so the row only changes
+hands once the previous holder's lease has expired.
+
+A standby takes over within lease_seconds + renew_interval after the leader
+dies. A leader that cannot renew steps down before its lease can run out, so
+two replicas never run the jobs at the same time: a failed attempt can take
+renew_interval (the claim timeout) and be followed by a renew_interval sleep,
+so the leader checks at least every 2 * renew_interval and gives up once
+lease_seconds - 2 * renew_interval have passed since its last successful
+claim started. lease_seconds should therefore exceed 3 * renew_interval, or a
+single failed renewal demotes the leader.
+"""
+import asyncio
+import os
+import socket
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable
+from sqlalchemy import case, delete, func, or_
+from sqlalchemy.dialects.postgresql import insert
+from database.base import get_async_session
+from database.models import JobLease
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_JOBS_LEASE = "background_jobs"
+
+
+def _claim_lease_stmt(name: str, holder: str, lease_seconds: float):
+    """Upsert that takes a free or expired lease, or extends our own"""
+    stmt = insert(JobLease).values(
+        name=name,
+        holder=holder,
+        expires_at=func.now() + timedelta(seconds=lease_seconds),
+        acquired_at=func.now(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[JobLease.name],
+        set_={
+            "holder": stmt.excluded.holder,
+            "expires_at": stmt.excluded.expires_at,
+            "acquired_at": case(
+                (JobLease.holder == stmt.excluded.holder, JobLease.acquired_at),
+                else_=func.now(),
+            ),
+        },
+        where=or_(JobLease.holder == stmt.excluded.holder, JobLease.expires_at < func.now()),
+    )
+    return stmt.returning(JobLease.holder)
+
+
+def default_instance_id() -> str:
+    """Identify this process (INSTANCE_ID or hostname, plus the pid so webhook workers differ)"""
+    return f"{settings.INSTANCE_ID or socket.gethostname()}:{os.getpid()}"
+
+
+class LeaderElection:
+    """Lease-based leader election on a job_leases row"""
+
+    def __init__(self, name: str, holder: str, lease_seconds: float, renew_interval: float):
+        self.name = name
+        self.holder = holder
+        self.lease_seconds = lease_seconds
+        self.renew_interval = renew_interval
+        self.is_leader = False
+        self.elections = 0
+        self._renewed_at = 0.0  # monotonic start time of the last successful claim
+
+    async def try_acquire(self) -> bool:
+        """Take or renew the lease; True if this replica holds it"""
+        async with get_async_session() as session:
+            holder = await session.scalar(_claim_lease_stmt(self.name, self.holder, self.lease_seconds))
+        return holder == self.holder
+
+    async def release(self):
+        """Give the lease up so a standby can take over immediately"""
+        async with get_async_session() as session:
+            await session.execute(
+                delete(JobLease).where(JobLease.name == self.name, JobLease.holder == self.holder)
+            )
+
+    async def run(self, on_elected: Callable[[], Awaitable[None]], on_demoted: Callable[[], Awaitable[None]]):
+        """Campaign for the lease forever, starting and stopping the jobs (run as a background task)"""
+        logger.info(f"Replica {self.holder} campaigning for lease '{self.name}'")
+        try:
+            while True:
+                # The lease runs from when the claim ran, at the latest from when it was sent
+                started = time.monotonic()
+                try:
+                    acquired = await asyncio.wait_for(self.try_acquire(), self.renew_interval)
+                except Exception as e:
+                    logger.error(f"Error renewing lease '{self.name}': {e}")
+                    acquired = None  # unknown, keep going until the lease may run out
+
+                if acquired:
+                    self._renewed_at = started
+                    if not self.is_leader:
+                        self.is_leader = True
+                        self.elections += 1
+                        logger.info(f"Replica {self.holder} became leader for '{self.name}'")
+                        await on_elected()
+                elif self.is_leader and (
+                    acquired is False
+                    or time.monotonic() - self._renewed_at >= self.lease_seconds - 2 * self.renew_interval
+                ):
+                    logger.warning(f"Replica {self.holder} lost lease '{self.name}', stopping jobs")
+                    self.is_leader = False
+                    await on_demoted()
+
+                await asyncio.sleep(self.renew_interval)
+        finally:
+            if self.is_leader:
+                self.is_leader = False
+                await on_demoted()
+                try:
+                    await self.release()
+                except Exception as e:
+                    logger.error(f"Error releasing lease '{self.name}': {e}")
+
+    def stats(self) -> dict:
+        """Election state"""
+        return {
+            "lease": self.name,
+            "holder": self.holder,
+            "is_leader": self.is_leader,
+            "elections": self.elections,
+        }
+
+
+leader_election = LeaderElection(
+    BACKGROUND_JOBS_LEASE,
+    holder=default_instance_id(),
+    lease_seconds=settings.LEADER_LEASE_SECONDS,
+    renew_interval=settings.LEADER_RENEW_SECONDS,
+)
@@ -1,13 +1,107 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session, joinedload
-from typing import Optional
-from database.models import Payment, PaymentStatus, Plan
-from database.base import get_session
+from datetime import datetime
+from decimal import Decimal
+from typing import List, NamedTuple, Optional
+from database.models import Payment, PaymentAmountSlot, PaymentStatus, Plan, Subscription, SubscriptionStatus, User
+from database.base import get_session, get_async_session
+from services.amount_slots import AmountSlots
+from services.subscription_cache import subscription_cache, ACTIVATED_VERSION
+from services.expiry_scheduler import expiry_scheduler
 from services.subscription_service import SubscriptionService
+from services.stats_service import StatsService, REVENUE, payment_counter, status_change, subscription_counter
+from config.settings import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class PaymentConfirmation(NamedTuple):
+    """Outcome of PaymentService.confirm_payment"""
+    subscription: Subscription
+    confirmed: bool  # False if the payment had already been confirmed (nothing was changed)
+
+
+def _lock_payment_stmt(payment_id: int):
+    """Payment with its plan, locking the payment and its user until commit"""
+    # Locking the user serializes confirmations of different payments of the
+    # same user, so they cannot both create a subscription
+    return (
+        select(Payment, Plan)
+        .join(Plan, Plan.id == Payment.plan_id)
+        .join(User, User.id == Payment.user_id)
+        .where(Payment.id == payment_id)
+        .with_for_update(of=[Payment.__table__, User.__table__])
+    )
+
+
+def _payment_by_key_stmt(idempotency_key: str):
+    return select(Payment).where(Payment.idempotency_key == idempotency_key)
+
+
+def _active_subscription_stmt(user_id: int):
+    return select(Subscription).where(
+        Subscription.user_id == user_id,
+        Subscription.status == SubscriptionStatus.ACTIVE
+    ).limit(1)
+
+
+class PendingTransferPayment(NamedTuple):
+    """Pending payment holding a unique amount (see services/payment_watcher.py)"""
+    payment_id: int
+    user_id: int
+    telegram_id: int
+    network: str
+    amount: Decimal
+    created_at: datetime
+    expires_at: datetime  # when the amount may go to another payment
+
+
+def _pending_transfer_payments_stmt(expires_after: datetime, created_after: Optional[datetime]):
+    """Pending payments whose amount slot is live at a time, created after another, oldest first"""
+    stmt = (
+        select(
+            Payment.id, Payment.user_id, User.telegram_id, Payment.network, Payment.amount,
+            Payment.created_at, PaymentAmountSlot.expires_at,
+        )
+        .join(PaymentAmountSlot, PaymentAmountSlot.payment_id == Payment.id)
+        .join(User, User.id == Payment.user_id)
+        .where(
+            Payment.status == PaymentStatus.PENDING,
+            PaymentAmountSlot.expires_at > expires_after,
+        )
+        .order_by(Payment.created_at, Payment.id)
+    )
+    if created_after is not None:
+        stmt = stmt.where(Payment.created_at > created_after)
+    return stmt
+
+
+def _confirmation_deltas(payment: Payment, old_subscription_status: Optional[SubscriptionStatus]) -> dict:
+    """Counter deltas of one confirmation, applied in a single statement"""
+    deltas = {
+        **status_change(payment_counter, payment.status, PaymentStatus.COMPLETED),
+        REVENUE: payment.amount,
+    }
+    deltas.update(status_change(subscription_counter, old_subscription_status, SubscriptionStatus.ACTIVE))
+    return deltas
+
+
+def _replay(payment_id: int, payment: Payment, subscription: Subscription) -> PaymentConfirmation:
+    """Result for an idempotency key that was already used"""
+    if payment.id != payment_id:
+        raise ValueError(f"Idempotency key already used to confirm payment {payment.id}")
+    logger.info(f"Payment {payment_id} confirmation replayed for its idempotency key")
+    return PaymentConfirmation(subscription, False)
+
+
+def _after_confirmation(payment: Payment, subscription: Subscription):
+    """Update the per-process caches once the confirmation has committed"""
+    subscription_cache.set(subscription.user_id, subscription)
+    expiry_scheduler.schedule(subscription.id, subscription.end_date)
+    logger.info(f"Confirmed payment {payment.id}, activated subscription {subscription.id}")
+
+
 class PaymentService:
     @staticmethod
     def create_payment(user_id: int, plan_id: int, amount: float, currency: str = "USDT",
@@ -18,6 +112,13 @@ class PaymentService:
             if not plan:
                 raise ValueError(f"Plan with id {plan_id} not found")
             
+            amount_slot = None
+            if network and settings.PAYMENT_AMOUNT_SLOTS:
+                # Unique amount, so the payment watcher can tell whose transfer it is
+                amount_slot = AmountSlots.claim(session, network, Decimal(str(amount)), user_id)
+                if amount_slot is not None:
+                    amount = amount_slot
+            
             payment = Payment(
                 user_id=user_id,
                 plan_id=plan_id,
@@ -29,6 +130,10 @@ class PaymentService:
                 wallet_address=wallet_address,
             )
             session.add(payment)
+            StatsService.bump(session, status_change(payment_counter, None, PaymentStatus.PENDING))
+            if amount_slot is not None:
+                session.flush()
+                AmountSlots.assign(session, network, amount_slot, payment.id)
             session.commit()
             session.refresh(payment)
             
@@ -37,40 +142,139 @@ class PaymentService:
             return payment
     
     @staticmethod
-    def confirm_payment(payment_id: int, transaction_id: str = None) -> bool:
-        """Confirm a payment and activate subscription"""
+    async def create_payment_async(user_id: int, plan_id: int, amount: float, currency: str = "USDT",
+                                   provider: str = "manual", wallet_address: str = None,
+                                   network: str = None) -> Payment:
+        """Create a new payment record (async)"""
+        async with get_async_session() as session:
+            plan = await session.get(Plan, plan_id)
+            if not plan:
+                raise ValueError(f"Plan with id {plan_id} not found")
+            
+            amount_slot = None
+            if network and settings.PAYMENT_AMOUNT_SLOTS:
+                # Unique amount, so the payment watcher can tell whose transfer it is
+                amount_slot = await AmountSlots.claim_async(session, network, Decimal(str(amount)), user_id)
+                if amount_slot is not None:
+                    amount = amount_slot
+            
+            payment = Payment(
+                user_id=user_id,
+                plan_id=plan_id,
+                amount=amount,
+                currency=currency,
+                network=network,
+                status=PaymentStatus.PENDING,
+                provider=provider,
+                wallet_address=wallet_address,
+            )
+            session.add(payment)
+            await StatsService.bump_async(session, status_change(payment_counter, None, PaymentStatus.PENDING))
+            if amount_slot is not None:
+                await session.flush()
+                await AmountSlots.assign_async(session, network, amount_slot, payment.id)
+            await session.commit()
+            await session.refresh(payment)
+            
+            network_info = f" on {network}" if network else ""
+            logger.info(f"Created payment {payment.id} for user {user_id}, amount: {amount} {currency}{network_info}")
+            return payment
+    
+    @staticmethod
+    def confirm_payment(payment_id: int, transaction_id: str = None,
+                        idempotency_key: str = None) -> Optional[PaymentConfirmation]:
+        """
+        Confirm a payment and activate its subscription in one transaction
+        
+        The payment and its user are locked, so concurrent confirmations of the
+        same payment (or of two payments of one user) run one after another and
+        the later ones see the first result. A repeated idempotency_key returns
+        the result of the confirmation that used it.
+        
+        Returns:
+            The confirmation, or None if the payment does not exist
+        """
         with get_session() as session:
-            payment = session.query(Payment).filter(Payment.id == payment_id).first()
-            if not payment:
+            if idempotency_key:
+                replayed = session.scalar(_payment_by_key_stmt(idempotency_key))
+                if replayed is not None:
+                    return _replay(payment_id, replayed, session.get(Subscription, replayed.subscription_id))
+            
+            row = session.execute(_lock_payment_stmt(payment_id)).one_or_none()
+            if row is None:
                 logger.error(f"Payment {payment_id} not found")
-                return False
+                return None
+            payment, plan = row
             
             if payment.status == PaymentStatus.COMPLETED:
                 logger.warning(f"Payment {payment_id} already completed")
-                return False
+                return PaymentConfirmation(session.get(Subscription, payment.subscription_id), False)
+            
+            subscription = session.scalar(_active_subscription_stmt(payment.user_id))
+            old_status = subscription.status if subscription else None
+            if subscription is None:
+                subscription = SubscriptionService._build_subscription(plan, payment.user_id, is_trial=False)
+                session.add(subscription)
+            else:
+                subscription.status = SubscriptionStatus.ACTIVE
+                subscription.is_trial = False
             
-            # Update payment status
+            StatsService.bump(session, _confirmation_deltas(payment, old_status))
+            subscription_cache.bump(session, ACTIVATED_VERSION)
+            AmountSlots.release(session, payment.id)
             payment.status = PaymentStatus.COMPLETED
+            payment.subscription = subscription
             if transaction_id:
                 payment.transaction_id = transaction_id
+            if idempotency_key:
+                payment.idempotency_key = idempotency_key
             session.commit()
+        
+        _after_confirmation(payment, subscription)
+        return PaymentConfirmation(subscription, True)
+    
+    @staticmethod
+    async def confirm_payment_async(payment_id: int, transaction_id: str = None,
+                                    idempotency_key: str = None) -> Optional[PaymentConfirmation]:
+        """Confirm a payment and activate its subscription in one transaction (async)"""
+        async with get_async_session() as session:
+            if idempotency_key:
+                replayed = await session.scalar(_payment_by_key_stmt(idempotency_key))
+                if replayed is not None:
+                    return _replay(payment_id, replayed, await session.get(Subscription, replayed.subscription_id))
             
-            # Create or activate subscription
-            subscription = SubscriptionService.get_active_subscription(payment.user_id)
-            if not subscription:
-                subscription = SubscriptionService.create_subscription(
-                    payment.user_id,
-                    payment.plan_id,
-                    is_trial=False
-                )
-            else:
-                SubscriptionService.activate_subscription(subscription.id)
+            row = (await session.execute(_lock_payment_stmt(payment_id))).one_or_none()
+            if row is None:
+                logger.error(f"Payment {payment_id} not found")
+                return None
+            payment, plan = row
             
-            payment.subscription_id = subscription.id
-            session.commit()
+            if payment.status == PaymentStatus.COMPLETED:
+                logger.warning(f"Payment {payment_id} already completed")
+                return PaymentConfirmation(await session.get(Subscription, payment.subscription_id), False)
             
-            logger.info(f"Confirmed payment {payment_id}, activated subscription {subscription.id}")
-            return True
+            subscription = await session.scalar(_active_subscription_stmt(payment.user_id))
+            old_status = subscription.status if subscription else None
+            if subscription is None:
+                subscription = SubscriptionService._build_subscription(plan, payment.user_id, is_trial=False)
+                session.add(subscription)
+            else:
+                subscription.status = SubscriptionStatus.ACTIVE
+                subscription.is_trial = False
+            
+            await StatsService.bump_async(session, _confirmation_deltas(payment, old_status))
+            await subscription_cache.bump_async(session, ACTIVATED_VERSION)
+            await AmountSlots.release_async(session, payment.id)
+            payment.status = PaymentStatus.COMPLETED
+            payment.subscription = subscription
+            if transaction_id:
+                payment.transaction_id = transaction_id
+            if idempotency_key:
+                payment.idempotency_key = idempotency_key
+            await session.commit()
+        
+        _after_confirmation(payment, subscription)
+        return PaymentConfirmation(subscription, True)
     
     @staticmethod
     def get_payment(payment_id: int) -> Optional[Payment]:
@@ -80,6 +284,12 @@ class PaymentService:
                 joinedload(Payment.user)
             ).filter(Payment.id == payment_id).first()
     
+    @staticmethod
+    async def get_payment_async(payment_id: int) -> Optional[Payment]:
+        """Get payment by ID (async, the user is not loaded)"""
+        async with get_async_session() as session:
+            return await session.scalar(select(Payment).where(Payment.id == payment_id))
+    
     @staticmethod
     def get_user_payments(user_id: int) -> list:
         """Get all payments for a user"""
@@ -88,6 +298,14 @@ class PaymentService:
                 Payment.user_id == user_id
             ).order_by(Payment.created_at.desc()).all()
     
+    @staticmethod
+    async def get_user_payments_async(user_id: int) -> list:
+        """Get all payments for a user (async)"""
+        async with get_async_session() as session:
+            return (await session.scalars(select(Payment).where(
+                Payment.user_id == user_id
+            ).order_by(Payment.created_at.desc()))).all()
+    
     @staticmethod
     def get_pending_payments(user_id: int) -> list:
         """Get pending payments for a user"""
@@ -96,4 +314,20 @@ class PaymentService:
                 Payment.user_id == user_id,
                 Payment.status == PaymentStatus.PENDING
             ).all()
-
+    
+    @staticmethod
+    async def get_pending_payments_async(user_id: int) -> list:
+        """Get pending payments for a user (async)"""
+        async with get_async_session() as session:
+            return (await session.scalars(select(Payment).where(
+                Payment.user_id == user_id,
+                Payment.status == PaymentStatus.PENDING
+            ))).all()
+    
+    @staticmethod
+    async def get_pending_transfer_payments_async(expires_after: datetime, created_after: Optional[datetime] = None
+                                                  ) -> List[PendingTransferPayment]:
+        """Pending payments with a unique amount held past expires_after, created after created_after (async)"""
+        async with get_async_session() as session:
+            result = await session.execute(_pending_transfer_payments_stmt(expires_after, created_after))
+            return [PendingTransferPayment(*row) for row in result]
@@ -0,0 +1,288 @@
+"""
+On-chain payment watcher
+
+Polls the transfer feeds (services/transfer_feeds.py) for USDT sent to our
+wallets and confirms the pending payment each transfer pays for, without
+anyone clicking confirm.
+
+Payments that will be matched hold a unique amount (services/amount_slots.py),
+so the watcher keeps a hash index from (network, exact amount) to the
+payment and settles each transfer with one lookup, however many payments
+are open. A transfer only counts if it was made while the payment held its
+amount (give or take some clock skew). The index is topped up with newly
+created payments before each poll and rebuilt periodically to drop payments
+settled elsewhere. Each top-up re-reads the last INDEX_OVERLAP_SECONDS of
+payments, since a payment can commit after a later one (created_at is the
+start of its transaction) and would be skipped by a plain high-water mark.
+
+Fetched transfers stay unsettled until they confirm a payment or are known
+to be used; unmatched ones (their payment may not be indexed yet) and ones
+whose confirmation failed are retried on every poll until no open payment
+can match them any more. Unmatched transfers are logged for manual review.
+
+Confirmation goes through PaymentService.confirm_payment_async with the
+transaction hash as transaction_id and idempotency key, so a transfer can
+never pay for two payments and a re-delivered transfer is a no-op.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from config.settings import settings
+from database.instrumentation import query_scope
+from services.payment_service import PaymentService, PendingTransferPayment
+from services.transfer_feeds import Transfer, TransferFeed, create_transfer_feeds
+from utils.timeutils import utc_timestamp
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Transfers may carry a block time slightly before the payment row's created_at
+CLOCK_SKEW_SECONDS = 120
+# Payments re-read below the newest indexed created_at, covering late commits
+INDEX_OVERLAP_SECONDS = 300
+# Pages fetched per feed and poll, so one busy feed cannot stall the others
+MAX_PAGES_PER_POLL = 10
+# Hashes of settled transactions remembered to skip transfers the feeds return again
+SEEN_TRANSFERS_SIZE = 10000
+
+
+class PendingPaymentIndex:
+    """Open payments by (network, amount)"""
+
+    def __init__(self):
+        self._by_key: Dict[Tuple[str, Decimal], PendingTransferPayment] = {}
+        self._keys: Dict[int, Tuple[str, Decimal]] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def add(self, payment: PendingTransferPayment):
+        if payment.payment_id in self._keys:
+            return
+        key = (payment.network, payment.amount)
+        previous = self._by_key.get(key)
+        if previous is not None:
+            if previous.created_at >= payment.created_at:
+                return
+            # The amount expired and was claimed again: only the newer payment holds it
+            del self._keys[previous.payment_id]
+        self._by_key[key] = payment
+        self._keys[payment.payment_id] = key
+
+    def remove(self, payment_id: int):
+        key = self._keys.pop(payment_id, None)
+        if key is not None:
+            del self._by_key[key]
+
+    def clear(self):
+        self._by_key.clear()
+        self._keys.clear()
+
+    def match(self, network: str, amount: Decimal, sent_at: float) -> Optional[PendingTransferPayment]:
+        """Payment holding an amount at the time a transfer was sent"""
+        payment = self._by_key.get((network, amount))
+        if payment is None:
+            return None
+        if not (utc_timestamp(payment.created_at) - CLOCK_SKEW_SECONDS
+                <= sent_at <= utc_timestamp(payment.expires_at) + CLOCK_SKEW_SECONDS):
+            return None
+        return payment
+
+    def prune(self, expired_before: float):
+        """Forget payments whose amount expired before a timestamp"""
+        for payment in [p for p in self._by_key.values() if utc_timestamp(p.expires_at) < expired_before]:
+            self.remove(payment.payment_id)
+
+
+class PaymentWatcher:
+    """Match incoming transfers to pending payments and confirm them"""
+
+    def __init__(self, feeds: List[TransferFeed], poll_interval: float, batch_size: int,
+                 amount_ttl: float, reload_interval: float):
+        self.feeds = feeds
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.amount_ttl = amount_ttl
+        self.reload_interval = reload_interval
+        self.index = PendingPaymentIndex()
+        self._cursors: Dict[str, Any] = {}
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._unsettled: "OrderedDict[str, Transfer]" = OrderedDict()
+        self._newest_created_at: Optional[datetime] = None
+        self._next_reload = 0.0
+        self.polls = 0
+        self.transfers = 0
+        self.confirmed = 0
+        self.unmatched = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.feeds)
+
+    async def run(self, on_confirmed: Callable[[PendingTransferPayment], Awaitable[None]]):
+        """Poll the feeds forever (run as a background task)"""
+        try:
+            while True:
+                try:
+                    with query_scope("job:payment_watcher"):
+                        await self.poll(on_confirmed)
+                except Exception as e:
+                    logger.error(f"Error in payment watcher: {e}", exc_info=True)
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            # Stopped (e.g. leadership moved): the next leader starts from the window again
+            self._reset()
+            for feed in self.feeds:
+                await feed.close()
+
+    async def poll(self, on_confirmed: Callable[[PendingTransferPayment], Awaitable[None]]) -> int:
+        """One pass over every feed, returning the number of payments confirmed"""
+        self.polls += 1
+        await self._refresh_index()
+        new = set()
+        for feed in self.feeds:
+            try:
+                new.update(transfer.tx_id for transfer in await self._fetch_new(feed))
+            except Exception as e:
+                logger.warning(f"Could not poll {feed.network} transfers: {e}")
+
+        confirmed = 0
+        window_start = self._window_start().timestamp()
+        for transfer in list(self._unsettled.values()):
+            if await self._settle(transfer, on_confirmed, first_attempt=transfer.tx_id in new):
+                confirmed += 1
+            elif transfer.tx_id in self._unsettled and transfer.timestamp.timestamp() < window_start:
+                # Too old for any open payment
+                del self._unsettled[transfer.tx_id]
+        return confirmed
+
+    def stats(self) -> dict:
+        """Watcher counters"""
+        return {
+            "pending_payments": len(self.index),
+            "unsettled_transfers": len(self._unsettled),
+            "polls": self.polls,
+            "transfers": self.transfers,
+            "confirmed": self.confirmed,
+            "unmatched": self.unmatched,
+        }
+
+    def _reset(self):
+        self.index.clear()
+        self._cursors.clear()
+        self._seen.clear()
+        self._unsettled.clear()
+        self._newest_created_at = None
+        self._next_reload = 0.0
+
+    def _window_start(self) -> datetime:
+        """Earliest time a transfer can still pay for an open payment"""
+        return datetime.now(timezone.utc) - timedelta(seconds=self.amount_ttl + CLOCK_SKEW_SECONDS)
+
+    async def _refresh_index(self):
+        """Add payments created since the last refresh, rebuilding the index now and then"""
+        if time.monotonic() >= self._next_reload:
+            self.index.clear()
+            self._newest_created_at = None
+            self._next_reload = time.monotonic() + self.reload_interval
+
+        expired_before = datetime.now(timezone.utc) - timedelta(seconds=CLOCK_SKEW_SECONDS)
+        self.index.prune(expired_before.timestamp())
+        created_after = None
+        if self._newest_created_at is not None:
+            created_after = self._newest_created_at - timedelta(seconds=INDEX_OVERLAP_SECONDS)
+        for payment in await PaymentService.get_pending_transfer_payments_async(expired_before, created_after):
+            # Payments in the overlap are already indexed (add() skips them)
+            self.index.add(payment)
+            if self._newest_created_at is None or payment.created_at > self._newest_created_at:
+                self._newest_created_at = payment.created_at
+
+    async def _fetch_new(self, feed: TransferFeed) -> List[Transfer]:
+        """Add the feed's new transfers to the unsettled ones, paging until its cursor stops moving"""
+        cursor = self._cursors.get(feed.network)
+        if cursor is None:
+            cursor = await feed.initial_cursor(self._window_start())
+
+        new = []
+        for _ in range(MAX_PAGES_PER_POLL):
+            transfers, next_cursor = await feed.fetch(cursor, self.batch_size)
+            for transfer in transfers:
+                if transfer.tx_id not in self._seen and transfer.tx_id not in self._unsettled:
+                    self._unsettled[transfer.tx_id] = transfer
+                    new.append(transfer)
+            advanced = next_cursor != cursor
+            # The fetched transfers are held in _unsettled, so the cursor can move past them
+            self._cursors[feed.network] = cursor = next_cursor
+            if not advanced:
+                break
+        self.transfers += len(new)
+        return new
+
+    def _remember(self, tx_id: str):
+        """The transfer is settled: stop retrying it and skip it when fetched again"""
+        self._unsettled.pop(tx_id, None)
+        self._seen[tx_id] = None
+        if len(self._seen) > SEEN_TRANSFERS_SIZE:
+            self._seen.popitem(last=False)
+
+    async def _settle(self, transfer: Transfer, on_confirmed: Callable[[PendingTransferPayment], Awaitable[None]],
+                      first_attempt: bool = True) -> bool:
+        """Confirm the payment a transfer pays for (unmatched or failed transfers stay unsettled)"""
+        payment = self.index.match(transfer.network, transfer.amount, transfer.timestamp.timestamp())
+        if payment is None:
+            if first_attempt:
+                self.unmatched += 1
+                logger.info(f"Unmatched {transfer.network} transfer {transfer.tx_id}: {transfer.amount} "
+                            f"from {transfer.from_address}")
+            return False
+
+        try:
+            confirmation = await PaymentService.confirm_payment_async(
+                payment.payment_id,
+                transaction_id=transfer.tx_id,
+                idempotency_key=f"{transfer.network}:{transfer.tx_id}",
+            )
+        except ValueError as e:
+            # The transaction was already used to confirm another payment, which stays open
+            logger.error(f"Could not confirm payment {payment.payment_id} with {transfer.tx_id}: {e}")
+            self._remember(transfer.tx_id)
+            return False
+        except Exception as e:
+            # e.g. the database is unreachable: both stay in place for the next poll
+            logger.warning(f"Could not confirm payment {payment.payment_id} with {transfer.tx_id}, "
+                           f"retrying next poll: {e}")
+            return False
+        self._remember(transfer.tx_id)
+        self.index.remove(payment.payment_id)
+        if confirmation is None or not confirmation.confirmed:
+            # The payment was deleted or completed meanwhile, so nothing was paid by this transfer
+            self.unmatched += 1
+            logger.warning(f"Unmatched {transfer.network} transfer {transfer.tx_id}: {transfer.amount} "
+                           f"from {transfer.from_address}, payment {payment.payment_id} was no longer pending")
+            return False
+
+        self.confirmed += 1
+        logger.info(f"Payment {payment.payment_id} paid by {transfer.network} transfer {transfer.tx_id}")
+        try:
+            await on_confirmed(payment)
+        except Exception as e:
+            logger.error(f"Error notifying confirmed payment {payment.payment_id}: {e}", exc_info=True)
+        return True
+
+
+def create_payment_watcher() -> PaymentWatcher:
+    """Watcher over the configured wallets (disabled without PAYMENT_WATCHER_ENABLED)"""
+    return PaymentWatcher(
+        create_transfer_feeds() if settings.PAYMENT_WATCHER_ENABLED else [],
+        poll_interval=settings.PAYMENT_WATCHER_POLL_SECONDS,
+        batch_size=settings.PAYMENT_WATCHER_BATCH_SIZE,
+        amount_ttl=settings.PAYMENT_AMOUNT_TTL_SECONDS,
+        reload_interval=settings.PAYMENT_WATCHER_RELOAD_SECONDS,
+    )
+
+
+# Global instance (run by the leader replica's background jobs)
+payment_watcher = create_payment_watcher()
@@ -1,28 +1,73 @@
 """
 Plan management service
 """
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from database.models import Plan
-from database.base import get_session
+from database.models import Plan, CacheVersion
+from database.base import get_session, get_async_session
+from services.cache_versions import bump_cache_version
 import logging
 
 logger = logging.getLogger(__name__)
 
+# cache_versions row bumped on every plan write (polled by the bot's plan catalog)
+PLAN_CATALOG_CACHE = "plans"
+
 
 class PlanService:
+    @staticmethod
+    def get_catalog_version() -> int:
+        """Get the current plan catalog version"""
+        with get_session() as session:
+            return session.scalar(
+                select(CacheVersion.version).where(CacheVersion.name == PLAN_CATALOG_CACHE)
+            ) or 0
+    
+    @staticmethod
+    async def get_catalog_version_async() -> int:
+        """Get the current plan catalog version (async)"""
+        async with get_async_session() as session:
+            return await session.scalar(
+                select(CacheVersion.version).where(CacheVersion.name == PLAN_CATALOG_CACHE)
+            ) or 0
+    
     @staticmethod
     def get_all_plans() -> List[Plan]:
         """Get all plans"""
         with get_session() as session:
             return session.query(Plan).order_by(Plan.id).all()
     
+    @staticmethod
+    async def get_all_plans_async() -> List[Plan]:
+        """Get all plans (async)"""
+        async with get_async_session() as session:
+            return (await session.scalars(select(Plan).order_by(Plan.id))).all()
+    
+    @staticmethod
+    def get_active_plans() -> List[Plan]:
+        """Get active plans"""
+        with get_session() as session:
+            return session.query(Plan).filter(Plan.is_active == True).all()
+    
+    @staticmethod
+    async def get_active_plans_async() -> List[Plan]:
+        """Get active plans (async)"""
+        async with get_async_session() as session:
+            return (await session.scalars(select(Plan).where(Plan.is_active == True))).all()
+    
     @staticmethod
     def get_plan(plan_id: int) -> Optional[Plan]:
         """Get plan by ID"""
         with get_session() as session:
             return session.query(Plan).filter(Plan.id == plan_id).first()
     
+    @staticmethod
+    async def get_plan_async(plan_id: int) -> Optional[Plan]:
+        """Get plan by ID (async)"""
+        async with get_async_session() as session:
+            return await session.get(Plan, plan_id)
+    
     @staticmethod
     def create_plan(name: str, name_ar: str, duration: str, duration_days: int,
                    price: float, currency: str = "USDT", is_active: bool = True) -> Plan:
@@ -40,6 +85,7 @@ class PlanService:
                 is_active=is_active
             )
             session.add(plan)
+            session.execute(bump_cache_version(PLAN_CATALOG_CACHE))
             session.commit()
             session.refresh(plan)
             logger.info(f"Created plan {plan.id}: {name}")
@@ -57,6 +103,7 @@ class PlanService:
                 if hasattr(plan, key):
                     setattr(plan, key, value)
             
+            session.execute(bump_cache_version(PLAN_CATALOG_CACHE))
             session.commit()
             logger.info(f"Updated plan {plan_id}")
             return True
@@ -70,7 +117,61 @@ class PlanService:
                 return False
             
             session.delete(plan)
+            session.execute(bump_cache_version(PLAN_CATALOG_CACHE))
             session.commit()
             logger.info(f"Deleted plan {plan_id}")
             return True
-
+    
+    @staticmethod
+    async def create_plan_async(name: str, name_ar: str, duration: str, duration_days: int,
+                                price: float, currency: str = "USDT", is_active: bool = True) -> Plan:
+        """Create a new plan (async)"""
+        from database.models import PlanDuration
+        
+        async with get_async_session() as session:
+            plan = Plan(
+                name=name,
+                name_ar=name_ar,
+                duration=PlanDuration(duration),
+                duration_days=duration_days,
+                price=price,
+                currency=currency,
+                is_active=is_active
+            )
+            session.add(plan)
+            await session.execute(bump_cache_version(PLAN_CATALOG_CACHE))
+            await session.commit()
+            await session.refresh(plan)
+            logger.info(f"Created plan {plan.id}: {name}")
+            return plan
+    
+    @staticmethod
+    async def update_plan_async(plan_id: int, **kwargs) -> bool:
+        """Update plan (async)"""
+        async with get_async_session() as session:
+            plan = await session.get(Plan, plan_id)
+            if not plan:
+                return False
+            
+            for key, value in kwargs.items():
+                if hasattr(plan, key):
+                    setattr(plan, key, value)
+            
+            await session.execute(bump_cache_version(PLAN_CATALOG_CACHE))
+            await session.commit()
+            logger.info(f"Updated plan {plan_id}")
+            return True
+    
+    @staticmethod
+    async def delete_plan_async(plan_id: int) -> bool:
+        """Delete plan (async)"""
+        async with get_async_session() as session:
+            plan = await session.get(Plan, plan_id)
+            if not plan:
+                return False
+            
+            await session.delete(plan)
+            await session.execute(bump_cache_version(PLAN_CATALOG_CACHE))
+            await session.commit()
+            logger.info(f"Deleted plan {plan_id}")
+            return True
@@ -1,8 +1,8 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select, update
 from typing import Optional
 from database.models import Referral, ReferralPoint, User
-from database.base import get_session
+from database.base import get_session, get_async_session
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,6 +11,23 @@ logger = logging.getLogger(__name__)
 REFERRAL_POINTS = 10
 
 
+def _credit_points_stmt(user_id: int, points: int):
+    """Add points to a user's materialized balance"""
+    return update(User).where(User.id == user_id).values(
+        points_balance=User.points_balance + points
+    )
+
+
+def _debit_points_stmt(user_id: int, points: int):
+    """Take points from a user's balance only if it covers them (returns the new balance)"""
+    return update(User).where(
+        User.id == user_id,
+        User.points_balance >= points,
+    ).values(
+        points_balance=User.points_balance - points
+    ).returning(User.points_balance)
+
+
 class ReferralService:
     @staticmethod
     def process_referral(referrer_id: int, referred_id: int) -> Optional[Referral]:
@@ -38,8 +55,11 @@ class ReferralService:
                 points_awarded=REFERRAL_POINTS,
             )
             session.add(referral)
+            session.flush()  # assign referral.id for the ledger entry
             
-            # Award points to referrer
+            # Award points to referrer (balance first, then the ledger: the
+            # order deduct_points and scripts/reconcile_points.py lock in)
+            session.execute(_credit_points_stmt(referrer_id, REFERRAL_POINTS))
             point = ReferralPoint(
                 user_id=referrer_id,
                 points=REFERRAL_POINTS,
@@ -53,13 +73,62 @@ class ReferralService:
             logger.info(f"Processed referral: {referrer_id} -> {referred_id}, awarded {REFERRAL_POINTS} points")
             return referral
     
+    @staticmethod
+    async def process_referral_async(referrer_id: int, referred_id: int) -> Optional[Referral]:
+        """Process a referral when a new user signs up (async)"""
+        # Prevent self-referral
+        if referrer_id == referred_id:
+            logger.warning(f"Self-referral attempted: user {referrer_id}")
+            return None
+        
+        async with get_async_session() as session:
+            # Check if referral already exists
+            existing = await session.scalar(select(Referral).where(
+                Referral.referrer_id == referrer_id,
+                Referral.referred_id == referred_id
+            ).limit(1))
+            
+            if existing:
+                logger.warning(f"Referral already exists: {referrer_id} -> {referred_id}")
+                return existing
+            
+            # Create referral record
+            referral = Referral(
+                referrer_id=referrer_id,
+                referred_id=referred_id,
+                points_awarded=REFERRAL_POINTS,
+            )
+            session.add(referral)
+            await session.flush()  # assign referral.id for the ledger entry
+            
+            # Award points to referrer (balance first, then the ledger: the
+            # order deduct_points and scripts/reconcile_points.py lock in)
+            await session.execute(_credit_points_stmt(referrer_id, REFERRAL_POINTS))
+            point = ReferralPoint(
+                user_id=referrer_id,
+                points=REFERRAL_POINTS,
+                description=f"Referral bonus for user {referred_id}",
+                referral_id=referral.id,
+            )
+            session.add(point)
+            await session.commit()
+            await session.refresh(referral)
+            
+            logger.info(f"Processed referral: {referrer_id} -> {referred_id}, awarded {REFERRAL_POINTS} points")
+            return referral
+    
     @staticmethod
     def get_user_total_points(user_id: int) -> int:
         """Get total points for a user"""
         with get_session() as session:
-            result = session.query(
-                func.sum(ReferralPoint.points)
-            ).filter(ReferralPoint.user_id == user_id).scalar()
+            result = session.scalar(select(User.points_balance).where(User.id == user_id))
+            return int(result) if result else 0
+    
+    @staticmethod
+    async def get_user_total_points_async(user_id: int) -> int:
+        """Get total points for a user (async)"""
+        async with get_async_session() as session:
+            result = await session.scalar(select(User.points_balance).where(User.id == user_id))
             return int(result) if result else 0
     
     @staticmethod
@@ -70,16 +139,24 @@ class ReferralService:
                 ReferralPoint.user_id == user_id
             ).order_by(ReferralPoint.created_at.desc()).all()
     
+    @staticmethod
+    async def get_user_points_history_async(user_id: int) -> list:
+        """Get points history for a user (async)"""
+        async with get_async_session() as session:
+            return (await session.scalars(select(ReferralPoint).where(
+                ReferralPoint.user_id == user_id
+            ).order_by(ReferralPoint.created_at.desc()))).all()
+    
     @staticmethod
     def deduct_points(user_id: int, points: int, description: str = None) -> bool:
         """Deduct points from user (for redemption)"""
-        total_points = ReferralService.get_user_total_points(user_id)
-        
-        if total_points < points:
-            logger.warning(f"Insufficient points for user {user_id}: {total_points} < {points}")
-            return False
-        
         with get_session() as session:
+            balance = session.scalar(_debit_points_stmt(user_id, points))
+            if balance is None:
+                session.rollback()
+                logger.warning(f"Insufficient points for user {user_id}: need {points}")
+                return False
+            
             point = ReferralPoint(
                 user_id=user_id,
                 points=-points,  # Negative for deduction
@@ -88,21 +165,62 @@ class ReferralService:
             session.add(point)
             session.commit()
             
-            logger.info(f"Deducted {points} points from user {user_id}")
+            logger.info(f"Deducted {points} points from user {user_id} (balance {balance})")
             return True
     
     @staticmethod
-    def get_referral_stats(user_id: int) -> dict:
-        """Get referral statistics for a user"""
+    async def deduct_points_async(user_id: int, points: int, description: str = None) -> bool:
+        """Deduct points from user (for redemption, async)"""
+        async with get_async_session() as session:
+            balance = await session.scalar(_debit_points_stmt(user_id, points))
+            if balance is None:
+                await session.rollback()
+                logger.warning(f"Insufficient points for user {user_id}: need {points}")
+                return False
+            
+            point = ReferralPoint(
+                user_id=user_id,
+                points=-points,  # Negative for deduction
+                description=description or f"Points redemption: {points} points",
+            )
+            session.add(point)
+            await session.commit()
+            
+            logger.info(f"Deducted {points} points from user {user_id} (balance {balance})")
+            return True
+    
+    @staticmethod
+    def get_referral_stats(user_id: int, user: Optional[User] = None) -> dict:
+        """Get referral statistics for a user (pass the loaded user to skip the balance lookup)"""
         with get_session() as session:
             total_referrals = session.query(Referral).filter(
                 Referral.referrer_id == user_id
             ).count()
             
-            total_points = ReferralService.get_user_total_points(user_id)
+            if user is not None:
+                total_points = user.points_balance
+            else:
+                total_points = ReferralService.get_user_total_points(user_id)
+            
+            return {
+                "total_referrals": total_referrals,
+                "total_points": total_points,
+            }
+    
+    @staticmethod
+    async def get_referral_stats_async(user_id: int, user: Optional[User] = None) -> dict:
+        """Get referral statistics for a user (async, pass the loaded user to skip the balance lookup)"""
+        async with get_async_session() as session:
+            total_referrals = await session.scalar(select(func.count(Referral.id)).where(
+                Referral.referrer_id == user_id
+            ))
+            
+            if user is not None:
+                total_points = user.points_balance
+            else:
+                total_points = await ReferralService.get_user_total_points_async(user_id)
             
             return {
                 "total_referrals": total_referrals,
                 "total_points": total_points,
             }
-
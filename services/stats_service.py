@@ -0,0 +1,126 @@
+"""
+Dashboard counters
+
+The admin dashboard reads its totals from the small ``stats_counters`` table
+instead of aggregating users, subscriptions and payments on every page load.
+Services add deltas in the same transaction as the change they count
+(StatsService.bump), and the leader replica periodically recounts the source
+tables to correct drift from changes made outside the services.
+"""
+from decimal import Decimal
+from typing import Dict
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database.models import StatsCounter, User, Subscription, SubscriptionStatus, Payment, PaymentStatus
+from database.base import get_session, get_async_session
+import logging
+
+logger = logging.getLogger(__name__)
+
+USERS = "users"
+REVENUE = "payments.revenue"  # sum of completed payment amounts
+
+
+def subscription_counter(status: SubscriptionStatus) -> str:
+    return f"subscriptions.{status.value}"
+
+
+def payment_counter(status: PaymentStatus) -> str:
+    return f"payments.{status.value}"
+
+
+ALL_COUNTERS = (
+    [USERS, REVENUE]
+    + [subscription_counter(status) for status in SubscriptionStatus]
+    + [payment_counter(status) for status in PaymentStatus]
+)
+
+
+def status_change(counter, old, new) -> Dict[str, int]:
+    """Deltas for a row moving between statuses (old is None for a new row)"""
+    if old == new:
+        return {}
+    deltas = {counter(new): 1}
+    if old is not None:
+        deltas[counter(old)] = -1
+    return deltas
+
+
+def _bump_stmt(deltas: Dict[str, Decimal]):
+    """Upsert adding each delta to its counter"""
+    # Rows are locked in name order, so concurrent bumps cannot deadlock
+    stmt = insert(StatsCounter).values([{"name": name, "value": deltas[name]} for name in sorted(deltas)])
+    return stmt.on_conflict_do_update(
+        index_elements=[StatsCounter.name],
+        set_={"value": StatsCounter.value + stmt.excluded.value, "updated_at": func.now()},
+    )
+
+
+class StatsService:
+    @staticmethod
+    def bump(session: Session, deltas: Dict[str, Decimal]):
+        """Apply counter deltas in the caller's transaction"""
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if deltas:
+            session.execute(_bump_stmt(deltas))
+
+    @staticmethod
+    async def bump_async(session: AsyncSession, deltas: Dict[str, Decimal]):
+        """Apply counter deltas in the caller's transaction (async)"""
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if deltas:
+            await session.execute(_bump_stmt(deltas))
+
+    @staticmethod
+    def get_counters() -> Dict[str, Decimal]:
+        """All counters by name"""
+        with get_session() as session:
+            return dict(session.execute(select(StatsCounter.name, StatsCounter.value)).all())
+
+    @staticmethod
+    async def get_counters_async() -> Dict[str, Decimal]:
+        """All counters by name (async)"""
+        async with get_async_session() as session:
+            return dict((await session.execute(select(StatsCounter.name, StatsCounter.value))).all())
+
+    @staticmethod
+    async def reconcile_async() -> Dict[str, Decimal]:
+        """Recount every counter from the source tables, returning the corrections made"""
+        async with get_async_session() as session:
+            # One snapshot for the counters and the recount: a bump commits with the
+            # change it counts, so both reflect exactly the same writes
+            await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+            current = dict((await session.execute(select(StatsCounter.name, StatsCounter.value))).all())
+
+            actual: Dict[str, Decimal] = {name: Decimal(0) for name in ALL_COUNTERS}
+            actual[USERS] = Decimal(await session.scalar(select(func.count(User.id))))
+            for status, count in await session.execute(
+                select(Subscription.status, func.count(Subscription.id)).group_by(Subscription.status)
+            ):
+                if status is not None:
+                    actual[subscription_counter(status)] = Decimal(count)
+            for status, count, amount in await session.execute(
+                select(Payment.status, func.count(Payment.id), func.coalesce(func.sum(Payment.amount), 0))
+                .group_by(Payment.status)
+            ):
+                if status is None:
+                    continue
+                actual[payment_counter(status)] = Decimal(count)
+                if status == PaymentStatus.COMPLETED:
+                    actual[REVENUE] = Decimal(amount)
+
+        corrections = {
+            name: value - current.get(name, 0)
+            for name, value in actual.items()
+            if value != current.get(name, 0)
+        }
+        # Applied as increments, so bumps committed since the snapshot are kept; the
+        # upsert locks the drifted rows only, in name order like every other bump
+        async with get_async_session() as session:
+            await StatsService.bump_async(session, corrections)
+
+        if corrections:
+            logger.warning(f"Stats counters drifted, corrected: {corrections}")
+        return corrections
@@ -0,0 +1,162 @@
+"""
+Per-user active subscription cache
+
+Bounded LRU keyed by user id. Each entry holds the user's active subscription
+(or None when the user has none) and expires at the subscription's end_date,
+capped by a maximum TTL. SubscriptionService keeps entries up to date when it
+creates, activates or expires subscriptions in this process.
+
+Other processes (webhook workers, the web admin) learn about those writes
+through two cache_versions rows, bumped in the writing transaction and polled
+by watch():
+
+  * ``subscriptions.activated`` - a subscription became active, so cached
+    "no subscription" entries are dropped
+  * ``subscriptions.ended`` - an active subscription ended before its
+    end_date (manual expiry), so every entry is dropped
+
+Expiry at end_date needs no bump since entries never outlive it. A change
+made elsewhere is therefore seen within SUBSCRIPTION_CACHE_POLL_SECONDS.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database.base import get_async_session
+from database.models import CacheVersion, Subscription
+from services.cache_versions import bump_cache_version
+from config.settings import settings
+from utils.timeutils import utc_timestamp
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Returned by SubscriptionCache.get() when the user is not cached
+MISSING = object()
+
+# cache_versions rows bumped by subscription writes other processes must see
+ACTIVATED_VERSION = "subscriptions.activated"
+ENDED_VERSION = "subscriptions.ended"
+
+
+def _versions_stmt():
+    return select(CacheVersion.name, CacheVersion.version).where(
+        CacheVersion.name.in_((ACTIVATED_VERSION, ENDED_VERSION))
+    )
+
+
+class SubscriptionCache:
+    """Bounded LRU cache of each user's active subscription"""
+
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._versions: Optional[Dict[str, int]] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int):
+        """Get the cached active subscription (None if the user has none, MISSING if not cached)"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, user_id: int, subscription: Optional[Subscription]):
+        """Cache the user's active subscription (or None)"""
+        now = time.time()
+        if subscription is None:
+            expires_at = now + self.negative_ttl
+        else:
+            expires_at = min(now + self.ttl, utc_timestamp(subscription.end_date))
+
+        with self._lock:
+            self._entries[user_id] = (subscription, expires_at)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: int):
+        """Drop the cached entry for a user"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def drop_negative(self):
+        """Drop the cached "no subscription" entries"""
+        with self._lock:
+            for user_id in [user_id for user_id, entry in self._entries.items() if entry[0] is None]:
+                del self._entries[user_id]
+
+    @staticmethod
+    def bump(session: Session, name: str):
+        """Tell other processes about a subscription write, in the caller's transaction"""
+        session.execute(bump_cache_version(name))
+
+    @staticmethod
+    async def bump_async(session: AsyncSession, name: str):
+        """Tell other processes about a subscription write, in the caller's transaction (async)"""
+        await session.execute(bump_cache_version(name))
+
+    async def refresh_if_changed(self) -> bool:
+        """Drop the entries made stale by writes of other processes since the last poll"""
+        async with get_async_session() as session:
+            versions = dict((await session.execute(_versions_stmt())).all())
+
+        previous, self._versions = self._versions, versions
+        if previous is None or previous.get(ENDED_VERSION) != versions.get(ENDED_VERSION):
+            # First poll: entries cached so far may predate any version we could compare
+            self.clear()
+            return True
+        if previous.get(ACTIVATED_VERSION) != versions.get(ACTIVATED_VERSION):
+            self.drop_negative()
+            return True
+        return False
+
+    async def watch(self, interval: float):
+        """Periodically poll the subscription cache versions (run as a background task)"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_if_changed()
+            except Exception as e:
+                logger.error(f"Error polling subscription cache versions: {e}")
+
+    def stats(self) -> dict:
+        """Hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+subscription_cache = SubscriptionCache(
+    max_entries=settings.SUBSCRIPTION_CACHE_SIZE,
+    ttl=settings.SUBSCRIPTION_CACHE_TTL_SECONDS,
+    negative_ttl=settings.SUBSCRIPTION_CACHE_NEGATIVE_TTL_SECONDS,
+)
@@ -1,15 +1,154 @@
+from sqlalchemy import select, update, exists, func, tuple_
 from sqlalchemy.orm import Session, joinedload
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Optional, List, NamedTuple, Tuple
 from database.models import Subscription, SubscriptionStatus, Plan, User
-from database.base import get_session
+from database.base import get_session, get_async_session
+from services.subscription_cache import subscription_cache, MISSING, ACTIVATED_VERSION, ENDED_VERSION
+from services.expiry_scheduler import expiry_scheduler
+from services.stats_service import StatsService, status_change, subscription_counter
 from config.settings import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+LIVE_STATUSES = (SubscriptionStatus.ACTIVE, SubscriptionStatus.TRIAL)
+
+
+class ExpiredSubscription(NamedTuple):
+    """Row returned for each subscription flipped to expired"""
+    subscription_id: int
+    user_id: int
+    telegram_id: int
+    still_subscribed: bool  # user has another live subscription, keep channel access
+    previous_status: SubscriptionStatus
+
+
+class PendingRemoval(NamedTuple):
+    """Expired subscription whose member has not been removed from the channel yet"""
+    subscription_id: int
+    telegram_id: int
+    still_subscribed: bool  # renewed since, the removal is no longer wanted
+
+
+def _other_live_subscription(subscriptions):
+    """EXISTS clause: the subscription's user has another live subscription"""
+    other = Subscription.__table__.alias("other")
+    return exists().where(
+        other.c.user_id == subscriptions.c.user_id,
+        other.c.id != subscriptions.c.id,
+        other.c.status.in_(LIVE_STATUSES),
+        other.c.end_date >= func.now(),
+    )
+
+
+def _expire_due_subscriptions_stmt():
+    """UPDATE ... RETURNING that expires every overdue subscription in one statement"""
+    subscriptions = Subscription.__table__
+    users = User.__table__
+    # Self-join to return the status from before the update
+    previous = subscriptions.alias("previous")
+    still_subscribed = _other_live_subscription(subscriptions)
+    return (
+        update(subscriptions)
+        .where(
+            subscriptions.c.user_id == users.c.id,
+            previous.c.id == subscriptions.c.id,
+            subscriptions.c.status.in_(LIVE_STATUSES),
+            subscriptions.c.end_date < func.now(),
+        )
+        .values(status=SubscriptionStatus.EXPIRED, removal_pending=~still_subscribed, updated_at=func.now())
+        .returning(subscriptions.c.id, subscriptions.c.user_id, users.c.telegram_id, still_subscribed,
+                   previous.c.status)
+    )
+
+
+def _pending_removals_stmt():
+    """Subscriptions still flagged for channel removal, with whether their user renewed since"""
+    subscriptions = Subscription.__table__
+    users = User.__table__
+    return (
+        select(subscriptions.c.id, users.c.telegram_id, _other_live_subscription(subscriptions))
+        .join(users, users.c.id == subscriptions.c.user_id)
+        .where(subscriptions.c.removal_pending)
+        .order_by(subscriptions.c.id)
+    )
+
+
+def _removal_wanted_stmt(subscription_id: int):
+    """Whether a flagged subscription's member should still leave the channel (no renewal since)"""
+    subscriptions = Subscription.__table__
+    return select(subscriptions.c.removal_pending & ~_other_live_subscription(subscriptions)).where(
+        subscriptions.c.id == subscription_id
+    )
+
+
+def _clear_removal_pending_stmt(subscription_ids: List[int]):
+    return (
+        update(Subscription)
+        .where(Subscription.id.in_(subscription_ids), Subscription.removal_pending)
+        .values(removal_pending=False)
+    )
+
+
+def _list_subscriptions_stmt(status: Optional[SubscriptionStatus], plan_id: Optional[int],
+                             is_trial: Optional[bool], created_from: Optional[datetime],
+                             created_to: Optional[datetime], after: Optional[Tuple[datetime, int]],
+                             limit: int):
+    """Newest-first page of subscriptions with user and plan columns, after a (created_at, id) cursor"""
+    stmt = (
+        select(
+            Subscription.id, Subscription.status, Subscription.is_trial, Subscription.start_date,
+            Subscription.end_date, Subscription.created_at, Subscription.user_id, Subscription.plan_id,
+            User.telegram_id, User.username, User.first_name,
+            Plan.name.label("plan_name"), Plan.name_ar.label("plan_name_ar"),
+        )
+        .join(User, User.id == Subscription.user_id)
+        .join(Plan, Plan.id == Subscription.plan_id)
+    )
+    if status is not None:
+        stmt = stmt.where(Subscription.status == status)
+    if plan_id is not None:
+        stmt = stmt.where(Subscription.plan_id == plan_id)
+    if is_trial is not None:
+        stmt = stmt.where(Subscription.is_trial == is_trial)
+    if created_from is not None:
+        stmt = stmt.where(Subscription.created_at >= created_from)
+    if created_to is not None:
+        stmt = stmt.where(Subscription.created_at < created_to)
+    if after is not None:
+        stmt = stmt.where(tuple_(Subscription.created_at, Subscription.id) < tuple_(*after))
+    return stmt.order_by(Subscription.created_at.desc(), Subscription.id.desc()).limit(limit)
+
+
+def _expired_deltas(expired: List[ExpiredSubscription]) -> dict:
+    """Counter deltas for a batch of subscriptions flipped to expired"""
+    deltas = {subscription_counter(SubscriptionStatus.EXPIRED): len(expired)}
+    for row in expired:
+        counter = subscription_counter(row.previous_status)
+        deltas[counter] = deltas.get(counter, 0) - 1
+    return deltas
+
 
 class SubscriptionService:
+    @staticmethod
+    def _build_subscription(plan: Plan, user_id: int, is_trial: bool) -> Subscription:
+        """Build a new subscription for a plan (not yet added to a session)"""
+        start_date = datetime.utcnow()
+        if is_trial:
+            end_date = start_date + timedelta(days=settings.FREE_TRIAL_DAYS)
+        else:
+            end_date = start_date + timedelta(days=plan.duration_days)
+        
+        return Subscription(
+            user_id=user_id,
+            plan_id=plan.id,
+            status=SubscriptionStatus.TRIAL if is_trial else SubscriptionStatus.ACTIVE,
+            start_date=start_date,
+            end_date=end_date,
+            is_trial=is_trial,
+        )
+    
     @staticmethod
     def create_subscription(user_id: int, plan_id: int, is_trial: bool = False) -> Subscription:
         """Create a new subscription"""
@@ -18,35 +157,75 @@ class SubscriptionService:
             if not plan:
                 raise ValueError(f"Plan with id {plan_id} not found")
             
-            start_date = datetime.utcnow()
-            if is_trial:
-                end_date = start_date + timedelta(days=settings.FREE_TRIAL_DAYS)
-            else:
-                end_date = start_date + timedelta(days=plan.duration_days)
-            
-            subscription = Subscription(
-                user_id=user_id,
-                plan_id=plan_id,
-                status=SubscriptionStatus.TRIAL if is_trial else SubscriptionStatus.ACTIVE,
-                start_date=start_date,
-                end_date=end_date,
-                is_trial=is_trial,
-            )
+            subscription = SubscriptionService._build_subscription(plan, user_id, is_trial)
             session.add(subscription)
+            StatsService.bump(session, status_change(subscription_counter, None, subscription.status))
+            if subscription.status == SubscriptionStatus.ACTIVE:
+                subscription_cache.bump(session, ACTIVATED_VERSION)
             session.commit()
             session.refresh(subscription)
             
+            if subscription.status == SubscriptionStatus.ACTIVE:
+                subscription_cache.set(user_id, subscription)
+            expiry_scheduler.schedule(subscription.id, subscription.end_date)
+            
+            logger.info(f"Created subscription {subscription.id} for user {user_id}, trial: {is_trial}")
+            return subscription
+    
+    @staticmethod
+    async def create_subscription_async(user_id: int, plan_id: int, is_trial: bool = False) -> Subscription:
+        """Create a new subscription (async)"""
+        async with get_async_session() as session:
+            plan = await session.get(Plan, plan_id)
+            if not plan:
+                raise ValueError(f"Plan with id {plan_id} not found")
+            
+            subscription = SubscriptionService._build_subscription(plan, user_id, is_trial)
+            session.add(subscription)
+            await StatsService.bump_async(session, status_change(subscription_counter, None, subscription.status))
+            if subscription.status == SubscriptionStatus.ACTIVE:
+                await subscription_cache.bump_async(session, ACTIVATED_VERSION)
+            await session.commit()
+            await session.refresh(subscription)
+            
+            if subscription.status == SubscriptionStatus.ACTIVE:
+                subscription_cache.set(user_id, subscription)
+            expiry_scheduler.schedule(subscription.id, subscription.end_date)
+            
             logger.info(f"Created subscription {subscription.id} for user {user_id}, trial: {is_trial}")
             return subscription
     
     @staticmethod
     def get_active_subscription(user_id: int) -> Optional[Subscription]:
         """Get active subscription for user"""
+        cached = subscription_cache.get(user_id)
+        if cached is not MISSING:
+            return cached
+        
         with get_session() as session:
-            return session.query(Subscription).filter(
+            subscription = session.query(Subscription).filter(
                 Subscription.user_id == user_id,
                 Subscription.status == SubscriptionStatus.ACTIVE
             ).first()
+        
+        subscription_cache.set(user_id, subscription)
+        return subscription
+    
+    @staticmethod
+    async def get_active_subscription_async(user_id: int) -> Optional[Subscription]:
+        """Get active subscription for user (async)"""
+        cached = subscription_cache.get(user_id)
+        if cached is not MISSING:
+            return cached
+        
+        async with get_async_session() as session:
+            subscription = await session.scalar(select(Subscription).where(
+                Subscription.user_id == user_id,
+                Subscription.status == SubscriptionStatus.ACTIVE
+            ).limit(1))
+        
+        subscription_cache.set(user_id, subscription)
+        return subscription
     
     @staticmethod
     def get_trial_subscription(user_id: int) -> Optional[Subscription]:
@@ -57,6 +236,15 @@ class SubscriptionService:
                 Subscription.status == SubscriptionStatus.TRIAL
             ).first()
     
+    @staticmethod
+    async def get_trial_subscription_async(user_id: int) -> Optional[Subscription]:
+        """Get trial subscription for user (async)"""
+        async with get_async_session() as session:
+            return await session.scalar(select(Subscription).where(
+                Subscription.user_id == user_id,
+                Subscription.status == SubscriptionStatus.TRIAL
+            ).limit(1))
+    
     @staticmethod
     def expire_subscription(subscription_id: int):
         """Expire a subscription"""
@@ -65,26 +253,90 @@ class SubscriptionService:
                 Subscription.id == subscription_id
             ).first()
             if subscription:
+                StatsService.bump(session, status_change(
+                    subscription_counter, subscription.status, SubscriptionStatus.EXPIRED
+                ))
+                if subscription.status == SubscriptionStatus.ACTIVE:
+                    subscription_cache.bump(session, ENDED_VERSION)
                 subscription.status = SubscriptionStatus.EXPIRED
                 session.commit()
+                subscription_cache.invalidate(subscription.user_id)
                 logger.info(f"Expired subscription {subscription_id}")
     
     @staticmethod
-    def check_and_expire_subscriptions():
-        """Check and expire subscriptions that have passed their end date"""
-        with get_session() as session:
-            now = datetime.utcnow()
-            expired = session.query(Subscription).filter(
-                Subscription.status.in_([SubscriptionStatus.ACTIVE, SubscriptionStatus.TRIAL]),
-                Subscription.end_date < now
-            ).all()
-            
-            for subscription in expired:
+    async def expire_subscription_async(subscription_id: int):
+        """Expire a subscription (async)"""
+        async with get_async_session() as session:
+            subscription = await session.get(Subscription, subscription_id)
+            if subscription:
+                await StatsService.bump_async(session, status_change(
+                    subscription_counter, subscription.status, SubscriptionStatus.EXPIRED
+                ))
+                if subscription.status == SubscriptionStatus.ACTIVE:
+                    await subscription_cache.bump_async(session, ENDED_VERSION)
                 subscription.status = SubscriptionStatus.EXPIRED
-                logger.info(f"Auto-expired subscription {subscription.id} for user {subscription.user_id}")
-            
-            session.commit()
-            return len(expired)
+                await session.commit()
+                subscription_cache.invalidate(subscription.user_id)
+                logger.info(f"Expired subscription {subscription_id}")
+    
+    @staticmethod
+    def check_and_expire_subscriptions() -> List[ExpiredSubscription]:
+        """Expire subscriptions that have passed their end date and return the newly expired ones"""
+        with get_session() as session:
+            expired = [ExpiredSubscription(*row) for row in session.execute(_expire_due_subscriptions_stmt())]
+            StatsService.bump(session, _expired_deltas(expired))
+        
+        for row in expired:
+            subscription_cache.invalidate(row.user_id)
+            logger.info(f"Auto-expired subscription {row.subscription_id} for user {row.user_id}")
+        return expired
+    
+    @staticmethod
+    async def check_and_expire_subscriptions_async() -> List[ExpiredSubscription]:
+        """Expire subscriptions that have passed their end date and return the newly expired ones (async)"""
+        async with get_async_session() as session:
+            result = await session.execute(_expire_due_subscriptions_stmt())
+            expired = [ExpiredSubscription(*row) for row in result]
+            await StatsService.bump_async(session, _expired_deltas(expired))
+        
+        for row in expired:
+            subscription_cache.invalidate(row.user_id)
+            logger.info(f"Auto-expired subscription {row.subscription_id} for user {row.user_id}")
+        return expired
+    
+    @staticmethod
+    async def get_upcoming_deadlines_async(after: Optional[Tuple[datetime, int]] = None,
+                                           limit: int = 1000) -> List[Tuple[datetime, int]]:
+        """Get the next (end_date, id) deadlines of live subscriptions, ordered, after a keyset cursor"""
+        stmt = select(Subscription.end_date, Subscription.id).where(
+            Subscription.status.in_(LIVE_STATUSES)
+        )
+        if after is not None:
+            stmt = stmt.where(tuple_(Subscription.end_date, Subscription.id) > tuple_(*after))
+        stmt = stmt.order_by(Subscription.end_date, Subscription.id).limit(limit)
+        
+        async with get_async_session() as session:
+            return [tuple(row) for row in await session.execute(stmt)]
+    
+    @staticmethod
+    async def get_pending_removals_async() -> List[PendingRemoval]:
+        """Expired subscriptions whose channel removal has not been done yet"""
+        async with get_async_session() as session:
+            return [PendingRemoval(*row) for row in await session.execute(_pending_removals_stmt())]
+    
+    @staticmethod
+    async def is_removal_wanted_async(subscription_id: int) -> bool:
+        """Whether the member of a flagged subscription still has to be removed (not renewed meanwhile)"""
+        async with get_async_session() as session:
+            return bool(await session.scalar(_removal_wanted_stmt(subscription_id)))
+    
+    @staticmethod
+    async def clear_removal_pending_async(subscription_ids: List[int]):
+        """Mark channel removals as done (or no longer wanted)"""
+        if not subscription_ids:
+            return
+        async with get_async_session() as session:
+            await session.execute(_clear_removal_pending_stmt(subscription_ids))
     
     @staticmethod
     def get_user_subscriptions(user_id: int) -> List[Subscription]:
@@ -96,12 +348,48 @@ class SubscriptionService:
                 Subscription.user_id == user_id
             ).order_by(Subscription.created_at.desc()).all()
     
+    @staticmethod
+    async def get_user_subscriptions_async(user_id: int) -> List[Subscription]:
+        """Get all subscriptions for a user (async)"""
+        async with get_async_session() as session:
+            return (await session.scalars(select(Subscription).options(
+                joinedload(Subscription.plan)
+            ).where(
+                Subscription.user_id == user_id
+            ).order_by(Subscription.created_at.desc()))).all()
+    
+    @staticmethod
+    def list_subscriptions(status: Optional[SubscriptionStatus] = None, plan_id: Optional[int] = None,
+                           is_trial: Optional[bool] = None, created_from: Optional[datetime] = None,
+                           created_to: Optional[datetime] = None,
+                           after: Optional[Tuple[datetime, int]] = None, limit: int = 50) -> list:
+        """List subscriptions newest first, filtered, after a keyset cursor (admin panel)"""
+        stmt = _list_subscriptions_stmt(status, plan_id, is_trial, created_from, created_to, after, limit)
+        with get_session() as session:
+            return session.execute(stmt).all()
+    
+    @staticmethod
+    async def list_subscriptions_async(status: Optional[SubscriptionStatus] = None, plan_id: Optional[int] = None,
+                                       is_trial: Optional[bool] = None, created_from: Optional[datetime] = None,
+                                       created_to: Optional[datetime] = None,
+                                       after: Optional[Tuple[datetime, int]] = None, limit: int = 50) -> list:
+        """List subscriptions newest first, filtered, after a keyset cursor (async)"""
+        stmt = _list_subscriptions_stmt(status, plan_id, is_trial, created_from, created_to, after, limit)
+        async with get_async_session() as session:
+            return (await session.execute(stmt)).all()
+    
     @staticmethod
     def has_active_subscription(user_id: int) -> bool:
         """Check if user has active subscription"""
         subscription = SubscriptionService.get_active_subscription(user_id)
         return subscription is not None
     
+    @staticmethod
+    async def has_active_subscription_async(user_id: int) -> bool:
+        """Check if user has active subscription (async)"""
+        subscription = await SubscriptionService.get_active_subscription_async(user_id)
+        return subscription is not None
+    
     @staticmethod
     def activate_subscription(subscription_id: int):
         """Activate a subscription (e.g., after payment confirmation)"""
@@ -110,8 +398,30 @@ class SubscriptionService:
                 Subscription.id == subscription_id
             ).first()
             if subscription:
+                StatsService.bump(session, status_change(
+                    subscription_counter, subscription.status, SubscriptionStatus.ACTIVE
+                ))
+                subscription_cache.bump(session, ACTIVATED_VERSION)
                 subscription.status = SubscriptionStatus.ACTIVE
                 subscription.is_trial = False
                 session.commit()
+                subscription_cache.set(subscription.user_id, subscription)
+                expiry_scheduler.schedule(subscription.id, subscription.end_date)
+                logger.info(f"Activated subscription {subscription_id}")
+    
+    @staticmethod
+    async def activate_subscription_async(subscription_id: int):
+        """Activate a subscription (async)"""
+        async with get_async_session() as session:
+            subscription = await session.get(Subscription, subscription_id)
+            if subscription:
+                await StatsService.bump_async(session, status_change(
+                    subscription_counter, subscription.status, SubscriptionStatus.ACTIVE
+                ))
+                await subscription_cache.bump_async(session, ACTIVATED_VERSION)
+                subscription.status = SubscriptionStatus.ACTIVE
+                subscription.is_trial = False
+                await session.commit()
+                subscription_cache.set(subscription.user_id, subscription)
+                expiry_scheduler.schedule(subscription.id, subscription.end_date)
                 logger.info(f"Activated subscription {subscription_id}")
-
@@ -0,0 +1,226 @@
+"""
+USDT transfer feeds for the payment watcher
+
+Each feed polls one network's explorer API for incoming USDT transfers to
+the configured wallet, oldest first, in batches. fetch() takes an opaque
+cursor and returns the transfers from it on plus the cursor to continue
+from, which stays put once the feed is exhausted. Transfers at a cursor
+boundary may be returned again, so callers dedupe by tx_id.
+
+  * TronGridFeed - TRC20 transfers from the TronGrid v1 API (confirmed only)
+  * BscScanFeed  - BEP20 transfers from the BscScan / Etherscan v2 API
+                   (chainid 56), once they have enough confirmations
+
+Base URLs are settings, so the watcher can run against a local stand-in
+(benchmarks/fake_transfer_feed.py) fully offline.
+"""
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, List, NamedTuple, Optional, Tuple
+import aiohttp
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRC20 = "TRC20"
+BSC = "BSC"
+
+BSC_CHAIN_ID = 56
+
+
+class Transfer(NamedTuple):
+    """Incoming token transfer to one of our wallets"""
+    network: str
+    tx_id: str
+    amount: Decimal
+    timestamp: datetime  # block time, UTC
+    from_address: str
+    to_address: str
+
+
+class TransferFeedError(Exception):
+    """The explorer API returned an error"""
+
+
+class TransferFeed:
+    """Interface of the transfer feeds"""
+
+    network: str = ""
+
+    def __init__(self, address: str, timeout: float = 10.0):
+        self.address = address
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def initial_cursor(self, since: datetime) -> Any:
+        """Cursor positioned at transfers made from ``since`` on"""
+        raise NotImplementedError
+
+    async def fetch(self, cursor: Any, limit: int) -> Tuple[List[Transfer], Any]:
+        """Up to ``limit`` transfers from the cursor on, oldest first, and the next cursor"""
+        raise NotImplementedError
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get_json(self, url: str, params: dict, headers: dict = None) -> dict:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        async with self._session.get(url, params=params, headers=headers) as response:
+            if response.status != 200:
+                raise TransferFeedError(f"{self.network} feed returned HTTP {response.status}")
+            return await response.json(content_type=None)
+
+
+def _token_amount(value: str, decimals: int) -> Decimal:
+    """Token amount from its integer on-chain value"""
+    return Decimal(value).scaleb(-decimals)
+
+
+class TronGridFeed(TransferFeed):
+    """TRC20 USDT transfers to an address (cursor: block timestamp in ms and page fingerprint)"""
+
+    network = TRC20
+
+    def __init__(self, address: str, api_url: str, api_key: str = "", contract: str = "", timeout: float = 10.0):
+        super().__init__(address, timeout)
+        self.api_url = api_url.rstrip("/")
+        self.api_key = api_key
+        self.contract = contract
+
+    async def initial_cursor(self, since: datetime) -> Tuple[int, Optional[str]]:
+        return int(since.timestamp() * 1000), None
+
+    async def fetch(self, cursor: Tuple[int, Optional[str]], limit: int) -> Tuple[List[Transfer], Tuple[int, Optional[str]]]:
+        min_timestamp, fingerprint = cursor
+        params = {
+            "only_to": "true",
+            "only_confirmed": "true",
+            "limit": limit,
+            "min_timestamp": min_timestamp,
+            "order_by": "block_timestamp,asc",
+        }
+        if fingerprint:
+            # Next page of the same query (pages may share one timestamp)
+            params["fingerprint"] = fingerprint
+        if self.contract:
+            params["contract_address"] = self.contract
+        headers = {"TRON-PRO-API-KEY": self.api_key} if self.api_key else None
+
+        body = await self._get_json(f"{self.api_url}/v1/accounts/{self.address}/transactions/trc20", params, headers)
+        if not body.get("success", False):
+            raise TransferFeedError(f"TronGrid error: {body.get('error', body)}")
+
+        transfers = []
+        latest = 0
+        for item in body.get("data", []):
+            latest = max(latest, item["block_timestamp"])
+            if item.get("type", "Transfer") != "Transfer" or item["to"] != self.address:
+                continue
+            transfers.append(Transfer(
+                network=self.network,
+                tx_id=item["transaction_id"],
+                amount=_token_amount(item["value"], int(item["token_info"]["decimals"])),
+                timestamp=datetime.fromtimestamp(item["block_timestamp"] / 1000, timezone.utc),
+                from_address=item["from"],
+                to_address=item["to"],
+            ))
+
+        next_fingerprint = body.get("meta", {}).get("fingerprint")
+        if next_fingerprint:
+            return transfers, (min_timestamp, next_fingerprint)
+        # Last page: confirmed blocks are final, so later polls start after the newest one
+        return transfers, (max(min_timestamp, latest + 1), None)
+
+
+class BscScanFeed(TransferFeed):
+    """BEP20 USDT transfers to an address (cursor: block number)"""
+
+    network = BSC
+
+    def __init__(self, address: str, api_url: str, api_key: str = "", contract: str = "",
+                 min_confirmations: int = 15, timeout: float = 10.0):
+        super().__init__(address, timeout)
+        self.api_url = api_url
+        self.api_key = api_key
+        self.contract = contract
+        self.min_confirmations = min_confirmations
+
+    async def _call(self, params: dict):
+        params = {"chainid": BSC_CHAIN_ID, **params}
+        if self.api_key:
+            params["apikey"] = self.api_key
+        body = await self._get_json(self.api_url, params)
+        # "No transactions found" comes back as status 0 with an empty result list
+        if body.get("status") != "1" and not isinstance(body.get("result"), list):
+            raise TransferFeedError(f"BscScan error: {body.get('message')}: {body.get('result')}")
+        return body["result"]
+
+    async def initial_cursor(self, since: datetime) -> int:
+        result = await self._call({
+            "module": "block",
+            "action": "getblocknobytime",
+            "timestamp": int(since.timestamp()),
+            "closest": "after",
+        })
+        return int(result)
+
+    async def fetch(self, cursor: int, limit: int) -> Tuple[List[Transfer], int]:
+        params = {
+            "module": "account",
+            "action": "tokentx",
+            "address": self.address,
+            "startblock": cursor,
+            "sort": "asc",
+            "page": 1,
+            "offset": limit,
+        }
+        if self.contract:
+            params["contractaddress"] = self.contract
+
+        items = await self._call(params)
+        transfers = []
+        for item in items:
+            block = int(item["blockNumber"])
+            if int(item.get("confirmations", 0)) < self.min_confirmations:
+                # Ascending order: everything from this block on is newer still
+                return transfers, max(cursor, block)
+            cursor = max(cursor, block)
+            if item["to"].lower() != self.address.lower():
+                continue
+            transfers.append(Transfer(
+                network=self.network,
+                tx_id=item["hash"],
+                amount=_token_amount(item["value"], int(item["tokenDecimal"])),
+                timestamp=datetime.fromtimestamp(int(item["timeStamp"]), timezone.utc),
+                from_address=item["from"],
+                to_address=item["to"],
+            ))
+        if items and len(items) < limit:
+            # The newest block was read in full
+            cursor += 1
+        return transfers, cursor
+
+
+def create_transfer_feeds() -> List[TransferFeed]:
+    """Feeds for every network with a configured wallet address"""
+    feeds: List[TransferFeed] = []
+    if settings.USDT_TRC20_ADDRESS:
+        feeds.append(TronGridFeed(
+            settings.USDT_TRC20_ADDRESS,
+            api_url=settings.TRONGRID_API_URL,
+            api_key=settings.TRONGRID_API_KEY,
+            contract=settings.USDT_TRC20_CONTRACT,
+        ))
+    if settings.USDT_BSC_ADDRESS:
+        feeds.append(BscScanFeed(
+            settings.USDT_BSC_ADDRESS,
+            api_url=settings.BSCSCAN_API_URL,
+            api_key=settings.BSCSCAN_API_KEY,
+            contract=settings.USDT_BSC_CONTRACT,
+            min_confirmations=settings.BSC_MIN_CONFIRMATIONS,
+        ))
+    return feeds
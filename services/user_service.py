@@ -1,43 +1,147 @@
+from sqlalchemy import exists, false, func, literal_column, or_, select, tuple_, union_all, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from database.models import User
-from database.base import get_session
-from utils.referral_code import generate_referral_code
-from typing import Optional
+from database.base import get_session, get_async_session
+from services.stats_service import StatsService, USERS
+from utils.referral_code import generate_referral_code, referral_code_for
+from datetime import datetime
+from typing import Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Profile fields refreshed from Telegram on every /start
+PROFILE_FIELDS = ("username", "first_name", "last_name")
+
+
+def _upsert_user_stmt(telegram_id: int, username: str, first_name: str, last_name: str,
+                      language_code: str, referral_code: str):
+    """Insert a user, or refresh an existing user's profile only if it changed
+
+    Returns (user, inserted) for new and changed users, no row otherwise.
+    """
+    stmt = insert(User).values(
+        telegram_id=telegram_id,
+        username=username,
+        first_name=first_name,
+        last_name=last_name,
+        language_code=language_code,
+        referral_code=referral_code,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={**{field: stmt.excluded[field] for field in PROFILE_FIELDS}, "updated_at": func.now()},
+        # Unchanged profiles are not rewritten (and return no row)
+        where=or_(*(getattr(User, field).is_distinct_from(stmt.excluded[field]) for field in PROFILE_FIELDS)),
+    )
+    # xmax is 0 only for a freshly inserted row version
+    return stmt.returning(User, literal_column("xmax = 0").label("inserted"))
+
+
+def _get_or_create_user_stmt(telegram_id: int, username: str, first_name: str, last_name: str,
+                             language_code: str, referral_code: str):
+    """The upsert, plus the stored row when it returns none (unchanged profile)
+
+    Returns (user, inserted) in one round trip. No row only when another
+    transaction inserted the user concurrently, after this statement's snapshot.
+    """
+    upsert = _upsert_user_stmt(telegram_id, username, first_name, last_name,
+                               language_code, referral_code).cte("upsert")
+    unchanged = select(User.__table__, false().label("inserted")).where(
+        User.telegram_id == telegram_id, ~exists(select(upsert.c.id))
+    )
+    return (
+        select(User, literal_column("inserted"))
+        .from_statement(union_all(select(upsert), unchanged))
+        .execution_options(populate_existing=True)
+    )
+
+
+def _list_users_stmt(free_trial_used: Optional[bool], created_from: Optional[datetime],
+                     created_to: Optional[datetime], after: Optional[Tuple[datetime, int]], limit: int):
+    """Newest-first page of users, after a (created_at, id) cursor"""
+    stmt = select(
+        User.id, User.telegram_id, User.username, User.first_name, User.last_name,
+        User.referral_code, User.free_trial_used, User.points_balance, User.created_at,
+    )
+    if free_trial_used is not None:
+        stmt = stmt.where(User.free_trial_used == free_trial_used)
+    if created_from is not None:
+        stmt = stmt.where(User.created_at >= created_from)
+    if created_to is not None:
+        stmt = stmt.where(User.created_at < created_to)
+    if after is not None:
+        stmt = stmt.where(tuple_(User.created_at, User.id) < tuple_(*after))
+    return stmt.order_by(User.created_at.desc(), User.id.desc()).limit(limit)
 
 
 class UserService:
+    @staticmethod
+    def profile_changed(user: User, username: str = None, first_name: str = None, last_name: str = None) -> bool:
+        """Whether the Telegram profile differs from the stored one"""
+        return (username, first_name, last_name) != (user.username, user.first_name, user.last_name)
+    
     @staticmethod
     def get_or_create_user(telegram_id: int, username: str = None, first_name: str = None, 
                           last_name: str = None, language_code: str = "ar") -> User:
-        """Get existing user or create new one"""
+        """Get existing user or create new one (one statement)"""
         with get_session() as session:
-            user = session.query(User).filter(User.telegram_id == telegram_id).first()
-            
-            if not user:
+            # The code is derived from the Telegram ID, so no uniqueness lookup is needed
+            stmt = _get_or_create_user_stmt(telegram_id, username, first_name, last_name,
+                                            language_code, referral_code_for(telegram_id))
+            try:
+                row = session.execute(stmt).one_or_none()
+            except IntegrityError:
+                # The derived code is held by a legacy random code
+                session.rollback()
                 referral_code = generate_referral_code()
-                # Ensure unique referral code
                 while session.query(User).filter(User.referral_code == referral_code).first():
                     referral_code = generate_referral_code()
-                
-                user = User(
-                    telegram_id=telegram_id,
-                    username=username,
-                    first_name=first_name,
-                    last_name=last_name,
-                    language_code=language_code,
-                    referral_code=referral_code,
-                )
-                session.add(user)
-                session.commit()
-                session.refresh(user)
+                logger.warning(f"Derived referral code taken, using {referral_code} for user {telegram_id}")
+                row = session.execute(_get_or_create_user_stmt(telegram_id, username, first_name, last_name,
+                                                               language_code, referral_code)).one_or_none()
+            
+            if row is None:
+                # Inserted concurrently by another update from the same user
+                user = session.query(User).filter(User.telegram_id == telegram_id).first()
             else:
-                # Update user info if changed
-                if username != user.username or first_name != user.first_name or last_name != user.last_name:
-                    user.username = username
-                    user.first_name = first_name
-                    user.last_name = last_name
-                    session.commit()
+                user, inserted = row
+                if inserted:
+                    StatsService.bump(session, {USERS: 1})
+            session.commit()
+            return user
+    
+    @staticmethod
+    async def get_or_create_user_async(telegram_id: int, username: str = None, first_name: str = None,
+                                       last_name: str = None, language_code: str = "ar") -> User:
+        """Get existing user or create new one (one statement, async)"""
+        async with get_async_session() as session:
+            # The code is derived from the Telegram ID, so no uniqueness lookup is needed
+            stmt = _get_or_create_user_stmt(telegram_id, username, first_name, last_name,
+                                            language_code, referral_code_for(telegram_id))
+            try:
+                row = (await session.execute(stmt)).one_or_none()
+            except IntegrityError:
+                # The derived code is held by a legacy random code
+                await session.rollback()
+                referral_code = generate_referral_code()
+                while await session.scalar(select(User.id).where(User.referral_code == referral_code)):
+                    referral_code = generate_referral_code()
+                logger.warning(f"Derived referral code taken, using {referral_code} for user {telegram_id}")
+                row = (await session.execute(_get_or_create_user_stmt(
+                    telegram_id, username, first_name, last_name, language_code, referral_code
+                ))).one_or_none()
             
+            if row is None:
+                # Inserted concurrently by another update from the same user
+                user = await session.scalar(select(User).where(User.telegram_id == telegram_id))
+            else:
+                user, inserted = row
+                if inserted:
+                    await StatsService.bump_async(session, {USERS: 1})
+            await session.commit()
             return user
     
     @staticmethod
@@ -46,6 +150,12 @@ class UserService:
         with get_session() as session:
             return session.query(User).filter(User.telegram_id == telegram_id).first()
     
+    @staticmethod
+    async def get_user_by_telegram_id_async(telegram_id: int) -> Optional[User]:
+        """Get user by Telegram ID (async)"""
+        async with get_async_session() as session:
+            return await session.scalar(select(User).where(User.telegram_id == telegram_id))
+    
     @staticmethod
     def get_user_by_referral_code(referral_code: str) -> Optional[User]:
         """Get user by referral code"""
@@ -53,17 +163,54 @@ class UserService:
             return session.query(User).filter(User.referral_code == referral_code).first()
     
     @staticmethod
-    def can_use_free_trial(telegram_id: int) -> bool:
-        """Check if user can use free trial"""
-        user = UserService.get_user_by_telegram_id(telegram_id)
+    async def get_user_by_referral_code_async(referral_code: str) -> Optional[User]:
+        """Get user by referral code (async)"""
+        async with get_async_session() as session:
+            return await session.scalar(select(User).where(User.referral_code == referral_code))
+    
+    @staticmethod
+    def list_users(free_trial_used: Optional[bool] = None, created_from: Optional[datetime] = None,
+                   created_to: Optional[datetime] = None, after: Optional[Tuple[datetime, int]] = None,
+                   limit: int = 50) -> list:
+        """List users newest first, filtered, after a keyset cursor (admin panel)"""
+        with get_session() as session:
+            return session.execute(_list_users_stmt(free_trial_used, created_from, created_to, after, limit)).all()
+    
+    @staticmethod
+    async def list_users_async(free_trial_used: Optional[bool] = None, created_from: Optional[datetime] = None,
+                               created_to: Optional[datetime] = None,
+                               after: Optional[Tuple[datetime, int]] = None, limit: int = 50) -> list:
+        """List users newest first, filtered, after a keyset cursor (async)"""
+        async with get_async_session() as session:
+            stmt = _list_users_stmt(free_trial_used, created_from, created_to, after, limit)
+            return (await session.execute(stmt)).all()
+    
+    @staticmethod
+    def can_use_free_trial(telegram_id: int, user: Optional[User] = None) -> bool:
+        """Check if user can use free trial (pass an already-loaded user to skip the lookup)"""
+        if user is None:
+            user = UserService.get_user_by_telegram_id(telegram_id)
+        return user is not None and not user.free_trial_used
+    
+    @staticmethod
+    async def can_use_free_trial_async(telegram_id: int, user: Optional[User] = None) -> bool:
+        """Check if user can use free trial (async, pass an already-loaded user to skip the lookup)"""
+        if user is None:
+            user = await UserService.get_user_by_telegram_id_async(telegram_id)
         return user is not None and not user.free_trial_used
     
     @staticmethod
     def mark_free_trial_used(telegram_id: int):
         """Mark free trial as used for user"""
         with get_session() as session:
-            user = session.query(User).filter(User.telegram_id == telegram_id).first()
-            if user:
-                user.free_trial_used = True
-                session.commit()
-
+            session.execute(
+                update(User).where(User.telegram_id == telegram_id).values(free_trial_used=True)
+            )
+    
+    @staticmethod
+    async def mark_free_trial_used_async(telegram_id: int):
+        """Mark free trial as used for user (async)"""
+        async with get_async_session() as session:
+            await session.execute(
+                update(User).where(User.telegram_id == telegram_id).values(free_trial_used=True)
+            )
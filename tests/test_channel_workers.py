@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from bot.channel_workers import ChannelWorkerPool
+from services.subscription_service import SubscriptionService
+from tests.conftest import run
+
+
+class FakeChannelManager:
+    """Channel whose bans raise for the first ``failures`` calls"""
+
+    channel_id = -100
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.banned = []
+
+    async def remove_user(self, telegram_id: int) -> bool:
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Bot API unreachable")
+        self.banned.append(telegram_id)
+        return True
+
+
+class FakeBot:
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, chat_id, text):
+        self.messages.append(chat_id)
+
+
+@pytest.fixture
+def flags(monkeypatch):
+    """removal_pending flags by subscription id, with the renewed subscriptions"""
+    state = {"pending": set(), "renewed": set()}
+
+    async def is_removal_wanted(subscription_id):
+        return subscription_id in state["pending"] and subscription_id not in state["renewed"]
+
+    async def clear_removal_pending(subscription_ids):
+        state["pending"].difference_update(subscription_ids)
+
+    monkeypatch.setattr(SubscriptionService, "is_removal_wanted_async", is_removal_wanted)
+    monkeypatch.setattr(SubscriptionService, "clear_removal_pending_async", clear_removal_pending)
+    return state
+
+
+def make_pool(channel_manager, attempts: int = 3) -> ChannelWorkerPool:
+    return ChannelWorkerPool(FakeBot(), channel_manager, limiter=None, workers=2, queue_size=100, max_retries=1,
+                             progress_every=0, removal_attempts=attempts, retry_backoff=0.01)
+
+
+async def drain(pool: ChannelWorkerPool, *removals):
+    pool.start()
+    for telegram_id, subscription_id in removals:
+        await pool.submit_removal(telegram_id, subscription_id)
+    # Re-queued removals come back after their backoff
+    await pool.join()
+    while pool._retry_tasks:
+        await asyncio.sleep(0.01)
+        await pool.join()
+    stats = pool.stats()
+    await pool.stop()
+    return stats
+
+
+def test_failed_removal_is_retried_and_its_flag_cleared(flags):
+    flags["pending"].add(10)
+    channel = FakeChannelManager(failures=2)
+
+    stats = run(drain(make_pool(channel), (501, 10)))
+
+    assert channel.banned == [501]
+    assert stats["requeued"] == 2
+    assert stats["removed"] == 1
+    assert flags["pending"] == set()
+
+
+def test_removal_out_of_attempts_keeps_its_flag(flags):
+    flags["pending"].add(10)
+    channel = FakeChannelManager(failures=5)
+
+    stats = run(drain(make_pool(channel, attempts=2), (501, 10)))
+
+    assert channel.banned == []
+    assert stats["failed"] == 1
+    # Left for the next leader's resume_pending_removals
+    assert flags["pending"] == {10}
+
+
+def test_user_renewed_while_queued_is_not_removed(flags):
+    flags["pending"].update({10, 11})
+    flags["renewed"].add(11)
+    channel = FakeChannelManager()
+
+    stats = run(drain(make_pool(channel), (501, 10), (502, 11)))
+
+    assert channel.banned == [501]
+    assert stats["skipped"] == 1
+    assert flags["pending"] == set()
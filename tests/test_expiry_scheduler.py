@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services.expiry_scheduler import ExpiryScheduler
+from services.subscription_service import SubscriptionService
+from tests.conftest import run
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+@pytest.fixture
+def deadlines(monkeypatch):
+    """Live (end_date, id) deadlines served in keyset batches, like the (status, end_date) index"""
+    rows = []
+    calls = []
+
+    async def get_upcoming(after, limit):
+        calls.append(after)
+        ordered = sorted(rows)
+        if after is not None:
+            ordered = [row for row in ordered if row > after]
+        return ordered[:limit]
+
+    monkeypatch.setattr(SubscriptionService, "get_upcoming_deadlines_async", get_upcoming)
+    return rows, calls
+
+
+def running_scheduler(batch_size: int = 2) -> ExpiryScheduler:
+    scheduler = ExpiryScheduler(batch_size=batch_size, sweep_interval=3600)
+    scheduler._running = True
+    return scheduler
+
+
+def test_batches_continue_from_the_last_loaded_deadline(deadlines):
+    rows, calls = deadlines
+    rows.extend((NOW + timedelta(hours=hours), 10 + hours) for hours in (3, 1, 2))
+    scheduler = running_scheduler()
+
+    run(scheduler._load_batch())
+    assert sorted(subscription_id for _, subscription_id in scheduler._heap) == [11, 12]
+    assert not scheduler._exhausted
+
+    scheduler._heap.clear()
+    run(scheduler._load_batch())
+    assert calls[-1] == (NOW + timedelta(hours=2), 12)
+    assert [subscription_id for _, subscription_id in scheduler._heap] == [13]
+    assert scheduler._exhausted
+
+
+def test_due_deadlines_pop_in_order():
+    scheduler = running_scheduler()
+    scheduler._exhausted = True
+    for subscription_id, minutes in ((1, 5), (2, -5), (3, -10), (4, 0)):
+        scheduler.schedule(subscription_id, NOW + timedelta(minutes=minutes))
+
+    assert scheduler._pop_due(NOW.timestamp()) == [3, 2, 4]
+    assert scheduler.stats()["pending_deadlines"] == 1
+
+
+def test_deadline_beyond_the_loaded_window_waits_for_its_batch(deadlines):
+    rows, _ = deadlines
+    rows.extend([(NOW + timedelta(hours=1), 1), (NOW + timedelta(hours=2), 2)])
+    scheduler = running_scheduler()
+    run(scheduler._load_batch())
+
+    scheduler.schedule(3, NOW + timedelta(hours=5))
+    assert len(scheduler._heap) == 2
+
+    # An earlier deadline is tracked and wakes the sleeping loop
+    scheduler._wakeup.clear()
+    scheduler.schedule(4, NOW + timedelta(minutes=30))
+    assert scheduler._heap[0] == ((NOW + timedelta(minutes=30)).timestamp(), 4)
+    assert scheduler._wakeup.is_set()
+
+
+def test_schedule_is_ignored_when_not_running():
+    scheduler = ExpiryScheduler(batch_size=2, sweep_interval=3600)
+    scheduler.schedule(1, NOW)
+    assert scheduler.stats()["pending_deadlines"] == 0
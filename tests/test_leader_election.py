@@ -0,0 +1,111 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services import leader_election as leader_module
+from services.leader_election import LeaderElection
+from tests.conftest import run
+
+LEASE = 30.0
+RENEW = 5.0
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(leader_module, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def scripted_election(monkeypatch, clock, claims):
+    """Election whose claims follow ``claims``: (result, seconds taken), result None = error
+
+    Once the script runs out the next sleep cancels the loop.
+    """
+    election = LeaderElection("test", "replica-a", LEASE, RENEW)
+    script = list(claims)
+    events = []
+
+    async def try_acquire():
+        result, took = script.pop(0)
+        clock.now += took
+        if result is None:
+            raise ConnectionError("database unreachable")
+        return result
+
+    async def wait_for(awaitable, timeout):
+        return await awaitable
+
+    async def sleep(seconds):
+        if not script:
+            raise asyncio.CancelledError
+        clock.now += seconds
+
+    async def release():
+        events.append(("released", clock.now))
+
+    async def on_elected():
+        events.append(("elected", clock.now))
+
+    async def on_demoted():
+        events.append(("demoted", clock.now))
+
+    election.try_acquire = try_acquire
+    election.release = release
+    monkeypatch.setattr(leader_module, "asyncio", SimpleNamespace(wait_for=wait_for, sleep=sleep))
+
+    async def campaign():
+        with pytest.raises(asyncio.CancelledError):
+            await election.run(on_elected, on_demoted)
+
+    return election, events, campaign
+
+
+def test_leader_steps_down_before_its_lease_runs_out(monkeypatch, clock):
+    # Renewed at t=0, then every claim times out after the full renew interval
+    election, events, campaign = scripted_election(
+        monkeypatch, clock, [(True, 0.0)] + [(None, RENEW)] * 6,
+    )
+    start = clock.now
+
+    run(campaign())
+
+    assert events[0] == ("elected", start)
+    kind, demoted_at = events[1]
+    assert kind == "demoted"
+    # The lease claimed at t=0 lasts until t=LEASE on the database clock
+    assert demoted_at - start < LEASE
+    assert demoted_at - start >= LEASE - 2 * RENEW
+    assert not election.is_leader
+
+
+def test_leader_survives_a_failed_renewal(monkeypatch, clock):
+    election, events, campaign = scripted_election(
+        monkeypatch, clock, [(True, 0.0), (None, 0.1), (True, 0.0), (None, RENEW), (True, 0.0)],
+    )
+
+    run(campaign())
+
+    # Only demoted by the shutdown, which also releases the lease
+    assert [kind for kind, _ in events] == ["elected", "demoted", "released"]
+    assert election.elections == 1
+
+
+def test_lease_taken_by_another_replica_demotes_at_once(monkeypatch, clock):
+    election, events, campaign = scripted_election(
+        monkeypatch, clock, [(True, 0.0), (False, 0.0), (False, 0.0)],
+    )
+
+    run(campaign())
+
+    assert [kind for kind, _ in events] == ["elected", "demoted"]
+    assert not election.is_leader
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import delete
+
+from database.base import get_session
+from database.models import User
+from services.user_service import UserService
+from utils.pagination import decode_cursor, encode_cursor
+
+# Outside any real signup date, so the listing only sees the scratch users
+CREATED_AT = datetime(2001, 1, 1, tzinfo=timezone.utc)
+TELEGRAM_IDS = range(7410, 7415)
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 10, 18, 12, 30, 5, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor(created_at, 42)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, 42)
+    assert decode_cursor(None) is None
+    assert decode_cursor("") is None
+
+
+def test_invalid_cursor_is_a_value_error():
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+@pytest.fixture
+def users_sharing_a_timestamp(database):
+    with get_session() as session:
+        # Two rows share each created_at, so the id decides their order
+        session.add_all(
+            User(telegram_id=telegram_id, referral_code=f"PAGE{telegram_id}",
+                 created_at=CREATED_AT + timedelta(seconds=index // 2))
+            for index, telegram_id in enumerate(TELEGRAM_IDS)
+        )
+    yield
+    with get_session() as session:
+        session.execute(delete(User).where(User.telegram_id.in_(TELEGRAM_IDS)))
+
+
+def test_keyset_pages_cover_every_row_once(users_sharing_a_timestamp):
+    window = {"created_from": CREATED_AT, "created_to": CREATED_AT + timedelta(days=1)}
+    seen = []
+    after = None
+    while True:
+        page = UserService.list_users(after=after, limit=2, **window)
+        if not page:
+            break
+        seen.extend(page)
+        after = decode_cursor(encode_cursor(page[-1].created_at, page[-1].id))
+
+    positions = [(row.created_at, row.id) for row in seen]
+    assert sorted(row.telegram_id for row in seen) == list(TELEGRAM_IDS)
+    assert positions == sorted(positions, reverse=True)
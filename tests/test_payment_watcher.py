@@ -0,0 +1,184 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+from services.payment_service import PaymentConfirmation, PaymentService, PendingTransferPayment
+from services.payment_watcher import CLOCK_SKEW_SECONDS, PaymentWatcher, PendingPaymentIndex
+from services.transfer_feeds import Transfer, TransferFeed
+from tests.conftest import run
+
+NOW = datetime.now(timezone.utc)
+
+
+def pending(payment_id: int, amount: str, created_at: datetime = NOW, network: str = "TRC20"):
+    return PendingTransferPayment(
+        payment_id=payment_id, user_id=payment_id, telegram_id=1000 + payment_id, network=network,
+        amount=Decimal(amount), created_at=created_at, expires_at=created_at + timedelta(hours=6),
+    )
+
+
+def transfer(tx_id: str, amount: str, sent_at: datetime = NOW, network: str = "TRC20"):
+    return Transfer(network, tx_id, Decimal(amount), sent_at, "sender", "wallet")
+
+
+class FakeFeed(TransferFeed):
+    """Feed returning a fixed list of transfers, cursor = offset"""
+
+    network = "TRC20"
+
+    def __init__(self, transfers):
+        super().__init__("wallet")
+        self.transfers = transfers
+
+    async def initial_cursor(self, since):
+        return 0
+
+    async def fetch(self, cursor, limit):
+        page = self.transfers[cursor:cursor + limit]
+        return page, cursor + len(page)
+
+
+@pytest.fixture
+def payments(monkeypatch):
+    """Pending payments served to the watcher's index refresh"""
+    rows = []
+
+    async def get_pending(expires_after, created_after=None):
+        return [row for row in rows if created_after is None or row.created_at > created_after]
+
+    monkeypatch.setattr(PaymentService, "get_pending_transfer_payments_async", get_pending)
+    return rows
+
+
+@pytest.fixture
+def confirmations(monkeypatch):
+    """Record confirm_payment_async calls; ``failures`` exceptions are raised first"""
+    calls = []
+    failures = []
+
+    async def confirm(payment_id, transaction_id=None, idempotency_key=None):
+        calls.append((payment_id, transaction_id))
+        if failures:
+            raise failures.pop(0)
+        return PaymentConfirmation(subscription=None, confirmed=True)
+
+    monkeypatch.setattr(PaymentService, "confirm_payment_async", confirm)
+    return calls, failures
+
+
+def make_watcher(transfers):
+    return PaymentWatcher([FakeFeed(transfers)], poll_interval=1, batch_size=50, amount_ttl=6 * 3600,
+                          reload_interval=3600)
+
+
+async def notify(payment):
+    pass
+
+
+def test_index_matches_amount_within_its_window():
+    index = PendingPaymentIndex()
+    index.add(pending(1, "30.01"))
+
+    assert index.match("TRC20", Decimal("30.01"), NOW.timestamp()).payment_id == 1
+    assert index.match("TRC20", Decimal("30.02"), NOW.timestamp()) is None
+    assert index.match("BEP20", Decimal("30.01"), NOW.timestamp()) is None
+    # Before the payment existed (beyond the clock skew) and after its amount expired
+    assert index.match("TRC20", Decimal("30.01"), NOW.timestamp() - CLOCK_SKEW_SECONDS - 1) is None
+    assert index.match("TRC20", Decimal("30.01"), (NOW + timedelta(hours=7)).timestamp()) is None
+
+
+def test_index_keeps_the_newer_payment_of_a_reused_amount():
+    index = PendingPaymentIndex()
+    index.add(pending(2, "30.01", created_at=NOW))
+    index.add(pending(1, "30.01", created_at=NOW - timedelta(hours=7)))
+
+    assert len(index) == 1
+    assert index.match("TRC20", Decimal("30.01"), NOW.timestamp()).payment_id == 2
+    index.remove(2)
+    assert index.match("TRC20", Decimal("30.01"), NOW.timestamp()) is None
+
+
+def test_transfer_seen_before_its_payment_is_indexed(payments, confirmations):
+    calls, _ = confirmations
+    watcher = make_watcher([transfer("tx1", "30.01")])
+
+    assert run(watcher.poll(notify)) == 0
+    assert watcher.stats()["unsettled_transfers"] == 1
+
+    # The payment commits after the transfer was fetched: the next poll settles it
+    payments.append(pending(1, "30.01"))
+    watcher._next_reload = 0.0
+    assert run(watcher.poll(notify)) == 1
+    assert calls == [(1, "tx1")]
+    assert watcher.stats()["unsettled_transfers"] == 0
+
+    # Fetched again by a later poll, the transfer is skipped
+    watcher._cursors.clear()
+    assert run(watcher.poll(notify)) == 0
+    assert calls == [(1, "tx1")]
+
+
+def test_confirm_raises_once_then_succeeds(payments, confirmations):
+    calls, failures = confirmations
+    failures.append(ConnectionError("database unreachable"))
+    payments.append(pending(1, "30.01"))
+    watcher = make_watcher([transfer("tx1", "30.01")])
+
+    assert run(watcher.poll(notify)) == 0
+    # Neither the transfer nor the payment is dropped by a transient error
+    assert watcher.stats()["unsettled_transfers"] == 1
+    assert len(watcher.index) == 1
+
+    assert run(watcher.poll(notify)) == 1
+    assert calls == [(1, "tx1"), (1, "tx1")]
+    assert watcher.stats()["unsettled_transfers"] == 0
+    assert len(watcher.index) == 0
+
+
+def test_transfer_used_for_another_payment_is_not_retried(payments, confirmations):
+    calls, failures = confirmations
+    failures.append(ValueError("Idempotency key already used to confirm payment 7"))
+    payments.append(pending(1, "30.01"))
+    watcher = make_watcher([transfer("tx1", "30.01")])
+
+    assert run(watcher.poll(notify)) == 0
+    assert run(watcher.poll(notify)) == 0
+    assert len(calls) == 1
+    # The payment is still open for a transfer of its own
+    assert len(watcher.index) == 1
+
+
+def test_payment_completed_meanwhile_leaves_the_transfer_unmatched(payments, monkeypatch):
+    async def already_completed(payment_id, transaction_id=None, idempotency_key=None):
+        return PaymentConfirmation(subscription=None, confirmed=False)
+
+    monkeypatch.setattr(PaymentService, "confirm_payment_async", already_completed)
+    payments.append(pending(1, "30.01"))
+    watcher = make_watcher([transfer("tx1", "30.01")])
+
+    assert run(watcher.poll(notify)) == 0
+    stats = watcher.stats()
+    assert (stats["confirmed"], stats["unmatched"], stats["unsettled_transfers"]) == (0, 1, 0)
+    assert len(watcher.index) == 0
+
+
+def test_unmatched_transfer_is_dropped_once_its_window_closes(payments, confirmations):
+    old = NOW - timedelta(hours=6, seconds=CLOCK_SKEW_SECONDS + 60)
+    watcher = make_watcher([transfer("tx1", "30.01", sent_at=old), transfer("tx2", "30.02")])
+
+    run(watcher.poll(notify))
+    assert watcher.stats()["unsettled_transfers"] == 1
+    assert watcher.stats()["unmatched"] == 2
+
+
+def test_payment_committed_late_is_indexed(payments, confirmations):
+    watcher = make_watcher([])
+    payments.append(pending(2, "30.02", created_at=NOW))
+    run(watcher.poll(notify))
+
+    # Created (transaction start) before payment 2, committed after the last refresh
+    payments.append(pending(1, "30.01", created_at=NOW - timedelta(seconds=30)))
+    run(watcher.poll(notify))
+    assert watcher.index.match("TRC20", Decimal("30.01"), NOW.timestamp()).payment_id == 1
+    assert len(watcher.index) == 2
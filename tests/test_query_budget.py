@@ -0,0 +1,94 @@
+import pytest
+from aiogram.types import Update
+from sqlalchemy import create_engine, delete, text
+
+from config.settings import settings
+from database.base import get_session
+from database.instrumentation import QueryBudgetExceeded, instrument_engine, query_budget, query_scope
+from database.models import User
+from services.stats_service import StatsService, USERS
+from tests.conftest import run
+
+TELEGRAM_ID = 7420
+
+
+@pytest.fixture(scope="module")
+def sqlite_engine():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine, "test")
+    return engine
+
+
+def run_statements(engine, count: int, statement: str = "SELECT 1"):
+    with engine.connect() as conn:
+        for _ in range(count):
+            conn.execute(text(statement))
+
+
+def test_block_within_budget(sqlite_engine):
+    with query_budget(2) as scope:
+        run_statements(sqlite_engine, 2)
+    assert scope.count == 2
+
+
+def test_block_over_budget_lists_its_statements(sqlite_engine):
+    with pytest.raises(QueryBudgetExceeded, match=r"3 statements, budget 2(.|\n)*3x SELECT 1"):
+        with query_budget(2):
+            run_statements(sqlite_engine, 3)
+
+
+def test_nested_scopes_count_toward_the_budget(sqlite_engine):
+    with query_budget(10) as budget:
+        run_statements(sqlite_engine, 1)
+        with query_scope("handler") as handler:
+            run_statements(sqlite_engine, 2, "SELECT 2")
+    assert (budget.count, budget.own_count) == (3, 1)
+    assert (handler.count, handler.own_count) == (2, 2)
+
+
+@pytest.fixture
+def scratch_user(database):
+    yield TELEGRAM_ID
+    with get_session() as session:
+        if session.execute(delete(User).where(User.telegram_id == TELEGRAM_ID)).rowcount:
+            StatsService.bump(session, {USERS: -1})
+
+
+def test_handler_statement_budgets(scratch_user, monkeypatch):
+    """Drive the real dispatcher against the fake Bot API and count each update's statements"""
+    from benchmarks.fake_bot_api import FakeBotAPI
+
+    async def scenario():
+        from bot.main import create_bot, create_dispatcher
+        from bot.send_queue import send_queue
+        from database.base import async_engine
+
+        api = FakeBotAPI()
+        runner = await api.start("127.0.0.1", 0)
+        host, port = runner.addresses[0][:2]
+        monkeypatch.setattr(settings, "TELEGRAM_API_SERVER", f"http://{host}:{port}")
+        bot = create_bot()
+        dp = create_dispatcher()
+
+        async def feed(update: dict, budget: int):
+            with query_budget(budget, name=str(update)):
+                await dp.feed_update(bot, Update.model_validate(update, context={"bot": bot}))
+
+        try:
+            # New user: user lookup, upsert, users counter
+            await feed(api.message_update(scratch_user, "/start"), 3)
+            # Returning user with an unchanged profile: only the middleware's lookup
+            await feed(api.message_update(scratch_user, "/start"), 1)
+            # No subscription: the lookup and one subscription query with its plan joined
+            await feed(api.callback_update(scratch_user, "my_subscriptions"), 2)
+            await feed(api.callback_update(scratch_user, "referral"), 1)
+        finally:
+            await send_queue.close()
+            await bot.session.close()
+            await runner.cleanup()
+            await async_engine.dispose()
+        return api.calls
+
+    calls = run(scenario())
+    assert calls["sendMessage"] == 2
+    assert calls["editMessageText"] == 2
@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from tests.conftest import run
+from utils import rate_limit
+from utils.rate_limit import TelegramRateLimiter, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock of the buckets, advanced instantly by their sleeps"""
+    now = [1000.0]
+
+    async def sleep(delay):
+        now[0] += delay
+
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(rate_limit, "asyncio", SimpleNamespace(Lock=asyncio.Lock, sleep=sleep))
+    return now
+
+
+def test_bucket_allows_a_burst_then_the_rate(clock):
+    bucket = TokenBucket(rate=10, capacity=5)
+
+    async def take(count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    run(take(5))
+    assert clock[0] == 1000.0
+    run(take(10))
+    assert clock[0] == pytest.approx(1001.0)
+
+
+def test_bucket_refills_up_to_its_capacity(clock):
+    bucket = TokenBucket(rate=10, capacity=5)
+    run(bucket.acquire(5))
+    assert not bucket.is_full
+
+    clock[0] += 60
+    assert bucket.is_full
+    run(bucket.acquire(5))
+    assert clock[0] == 1060.0
+
+
+def test_default_capacity_is_one_second_of_rate():
+    assert TokenBucket(rate=30).capacity == 30
+    assert TokenBucket(rate=0.5).capacity == 1.0
+
+
+def test_limiter_uses_chat_overrides_and_drops_idle_chats(clock):
+    limiter = TelegramRateLimiter(global_rate=30, per_chat_rate=1, max_chats=2)
+    limiter.set_chat_rate(-100, rate=20)
+    assert limiter.chat_bucket(-100).rate == 20
+
+    run(limiter.acquire(1))
+    run(limiter.acquire(2))
+    clock[0] += 10  # both chats idle again
+    run(limiter.acquire(3))
+    # Chat 1 is the least recently used idle chat
+    assert set(limiter._chats) == {"2", "3"}
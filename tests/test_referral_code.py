@@ -0,0 +1,38 @@
+import pytest
+
+from utils.referral_code import (
+    REFERRAL_CODE_ALPHABET, REFERRAL_CODE_LENGTH, _CODE_SPACE, _MULTIPLIER, _OFFSET, encode_referral_code,
+    referral_code_for,
+)
+
+
+def decode(code: str) -> int:
+    """Inverse of encode_referral_code"""
+    value = 0
+    for char in code:
+        value = value * len(REFERRAL_CODE_ALPHABET) + REFERRAL_CODE_ALPHABET.index(char)
+    return (value - _OFFSET) * pow(_MULTIPLIER, -1, _CODE_SPACE) % _CODE_SPACE
+
+
+@pytest.mark.parametrize("telegram_id", [0, 1, 2, 777000, 123456789, 7_999_999_999, _CODE_SPACE - 1])
+def test_code_decodes_back_to_its_telegram_id(telegram_id):
+    code = referral_code_for(telegram_id)
+    assert len(code) == REFERRAL_CODE_LENGTH
+    assert set(code) <= set(REFERRAL_CODE_ALPHABET)
+    assert decode(code) == telegram_id
+
+
+def test_consecutive_ids_get_distinct_codes():
+    codes = {referral_code_for(telegram_id) for telegram_id in range(1_000_000, 1_050_000)}
+    assert len(codes) == 50_000
+
+
+def test_ids_outside_the_code_space():
+    with pytest.raises(ValueError):
+        encode_referral_code(_CODE_SPACE)
+    with pytest.raises(ValueError):
+        encode_referral_code(-1)
+    # New users beyond 36^8 still get a (random) code of the usual shape
+    code = referral_code_for(_CODE_SPACE + 5)
+    assert len(code) == REFERRAL_CODE_LENGTH
+    assert set(code) <= set(REFERRAL_CODE_ALPHABET)
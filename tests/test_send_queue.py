@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetMe, SendMessage
+
+from bot.send_queue import SendPriority, SendQueue, send_priority
+from tests.conftest import run
+
+
+class FreeBucket:
+    async def acquire(self, tokens: float = 1.0):
+        pass
+
+
+class GatedBucket:
+    """Global bucket handing out a token each time the test opens it"""
+
+    def __init__(self):
+        self.permits = asyncio.Semaphore(0)
+
+    async def acquire(self, tokens: float = 1.0):
+        await self.permits.acquire()
+
+
+class FakeLimiter:
+    def __init__(self, global_bucket=None):
+        self.global_bucket = global_bucket or FreeBucket()
+
+    def chat_bucket(self, chat_id):
+        return FreeBucket()
+
+
+def test_higher_priority_sends_overtake_queued_ones():
+    async def scenario():
+        gate = GatedBucket()
+        queue = SendQueue(FakeLimiter(gate), max_retries=0)
+        sent = []
+
+        async def make_request(bot, method):
+            sent.append(method.text)
+
+        async def send(text, priority):
+            with send_priority(priority):
+                await queue(make_request, None, SendMessage(chat_id=1, text=text))
+
+        tasks = []
+        for text, priority in (("low", SendPriority.LOW), ("normal", SendPriority.NORMAL),
+                               ("high", SendPriority.HIGH)):
+            tasks.append(asyncio.create_task(send(text, priority)))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert queue.stats()["depth"] == {"high": 1, "normal": 1, "low": 1}
+
+        for _ in tasks:
+            gate.permits.release()
+        await asyncio.gather(*tasks)
+        await queue.close()
+        return sent, queue.stats()
+
+    sent, stats = run(scenario())
+    # The first token was taken while only "low" was queued, then priority order applies
+    assert sent == ["high", "normal", "low"]
+    assert stats["sent"] == 3
+
+
+def test_flood_control_pauses_and_retries():
+    async def scenario():
+        queue = SendQueue(FakeLimiter(), max_retries=1)
+        method = SendMessage(chat_id=1, text="hello")
+        calls = []
+
+        async def make_request(bot, method):
+            calls.append(method)
+            if len(calls) == 1:
+                raise TelegramRetryAfter(method, "Flood control exceeded", retry_after=0)
+            return "ok"
+
+        result = await queue(make_request, None, method)
+        await queue.close()
+        return result, len(calls), queue.stats()
+
+    result, calls, stats = run(scenario())
+    assert (result, calls) == ("ok", 2)
+    assert (stats["sent"], stats["retries"], stats["pauses"], stats["failed"]) == (1, 1, 1, 0)
+
+
+def test_calls_without_a_chat_skip_the_queue():
+    limiter = SimpleNamespace(chat_bucket=None, global_bucket=None)  # any use would fail
+    queue = SendQueue(limiter, max_retries=0)
+
+    async def make_request(bot, method):
+        return "me"
+
+    assert run(queue(make_request, None, GetMe())) == "me"
+    assert queue.stats()["sent"] == 0
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select, update
+
+from database.models import AdminSession
+from web import session_store as store_module
+from web.session_store import DatabaseSessionStore, MemorySessionStore, create_session_store
+
+TTL = 3600
+TOUCH = 300
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(store_module, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_memory_sessions_slide_and_expire(clock):
+    store = MemorySessionStore(TTL, max_sessions=10)
+    session_id = store.create({"admin": True})
+
+    clock.now += TTL - 1
+    assert store.get(session_id) == {"admin": True}
+    # The use above pushed the expiry back
+    clock.now += TTL - 1
+    assert store.get(session_id) == {"admin": True}
+
+    clock.now += TTL
+    assert store.get(session_id) is None
+    assert store.get("unknown") is None
+
+
+def test_memory_store_evicts_the_least_recently_used(clock):
+    store = MemorySessionStore(TTL, max_sessions=2)
+    first = store.create({"n": 1})
+    second = store.create({"n": 2})
+    store.get(first)
+
+    store.create({"n": 3})
+    assert store.get(second) is None
+    assert store.get(first) == {"n": 1}
+
+    store.delete(first)
+    assert store.get(first) is None
+
+
+@pytest.fixture
+def database_store(tmp_path) -> DatabaseSessionStore:
+    return create_session_store("database", TTL, TOUCH, database_url=f"sqlite:///{tmp_path / 'sessions.db'}")
+
+
+def stored_expiry(store: DatabaseSessionStore, session_id: str) -> datetime:
+    with store.engine.connect() as conn:
+        expires_at = conn.scalar(
+            select(AdminSession.expires_at).where(AdminSession.session_key == store._key(session_id))
+        )
+    return expires_at.replace(tzinfo=timezone.utc)
+
+
+def set_expiry(store: DatabaseSessionStore, session_id: str, expires_at: datetime):
+    with store.engine.begin() as conn:
+        conn.execute(update(AdminSession).where(AdminSession.session_key == store._key(session_id))
+                     .values(expires_at=expires_at))
+
+
+def test_database_sessions_store_only_a_hash(database_store):
+    session_id = database_store.create({"admin": True})
+
+    assert database_store.get(session_id) == {"admin": True}
+    with database_store.engine.connect() as conn:
+        assert conn.scalar(select(AdminSession.session_key)) == database_store._key(session_id) != session_id
+
+    database_store.delete(session_id)
+    assert database_store.get(session_id) is None
+
+
+def test_database_expiry_is_written_once_per_touch_interval(database_store):
+    session_id = database_store.create({"admin": True})
+    now = datetime.now(timezone.utc)
+
+    # Touched less than TOUCH seconds ago: no write
+    recent = now + timedelta(seconds=TTL - TOUCH + 60)
+    set_expiry(database_store, session_id, recent)
+    database_store.get(session_id)
+    assert stored_expiry(database_store, session_id) == recent
+
+    # Older than that: the expiry slides to TTL from now
+    set_expiry(database_store, session_id, now + timedelta(seconds=60))
+    database_store.get(session_id)
+    assert stored_expiry(database_store, session_id) >= now + timedelta(seconds=TTL)
+
+    set_expiry(database_store, session_id, now - timedelta(seconds=1))
+    assert database_store.get(session_id) is None
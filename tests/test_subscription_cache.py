@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from database.models import Subscription
+from services import subscription_cache as cache_module
+from services.subscription_cache import MISSING, SubscriptionCache
+
+START = 1_800_000_000.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.time() of the cache module"""
+    now = [START]
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def subscription(ends_in: float) -> Subscription:
+    return Subscription(end_date=datetime.fromtimestamp(START + ends_in, timezone.utc))
+
+
+def test_active_entry_expires_after_ttl(clock):
+    cache = SubscriptionCache(max_entries=10, ttl=300, negative_ttl=30)
+    active = subscription(ends_in=timedelta(days=30).total_seconds())
+    cache.set(1, active)
+
+    clock[0] = START + 299
+    assert cache.get(1) is active
+    clock[0] = START + 300
+    assert cache.get(1) is MISSING
+
+
+def test_active_entry_never_outlives_its_end_date(clock):
+    cache = SubscriptionCache(max_entries=10, ttl=300, negative_ttl=30)
+    cache.set(1, subscription(ends_in=60))
+
+    clock[0] = START + 59
+    assert cache.get(1) is not MISSING
+    clock[0] = START + 60
+    assert cache.get(1) is MISSING
+
+
+def test_negative_entry_uses_negative_ttl(clock):
+    cache = SubscriptionCache(max_entries=10, ttl=300, negative_ttl=30)
+    cache.set(1, None)
+
+    clock[0] = START + 29
+    assert cache.get(1) is None
+    clock[0] = START + 30
+    assert cache.get(1) is MISSING
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = SubscriptionCache(max_entries=2, ttl=300, negative_ttl=30)
+    cache.set(1, None)
+    cache.set(2, None)
+    cache.get(1)  # 2 becomes the least recently used
+    cache.set(3, None)
+
+    assert cache.get(2) is MISSING
+    assert cache.get(1) is None
+    assert cache.get(3) is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_and_drop_negative(clock):
+    cache = SubscriptionCache(max_entries=10, ttl=300, negative_ttl=30)
+    active = subscription(ends_in=3600)
+    cache.set(1, active)
+    cache.set(2, None)
+    cache.set(3, None)
+
+    cache.invalidate(3)
+    assert cache.get(3) is MISSING
+    cache.drop_negative()
+    assert cache.get(2) is MISSING
+    assert cache.get(1) is active
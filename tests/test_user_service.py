@@ -0,0 +1,31 @@
+import pytest
+from sqlalchemy import delete
+
+from database.base import get_session
+from database.instrumentation import query_budget
+from database.models import User
+from services.stats_service import StatsService, USERS
+from services.user_service import UserService
+
+TELEGRAM_ID = 7397
+
+
+@pytest.fixture
+def scratch_user(database):
+    yield TELEGRAM_ID
+    with get_session() as session:
+        if session.execute(delete(User).where(User.telegram_id == TELEGRAM_ID)).rowcount:
+            StatsService.bump(session, {USERS: -1})
+
+
+def test_get_or_create_user_is_one_statement(scratch_user):
+    with query_budget(2):  # the upsert and the users counter
+        created = UserService.get_or_create_user(scratch_user, "old_name", "First")
+
+    with query_budget(1):
+        unchanged = UserService.get_or_create_user(scratch_user, "old_name", "First")
+    assert (unchanged.id, unchanged.username) == (created.id, "old_name")
+
+    with query_budget(1):
+        renamed = UserService.get_or_create_user(scratch_user, "new_name", "First")
+    assert (renamed.id, renamed.username) == (created.id, "new_name")
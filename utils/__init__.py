@@ -1,5 +1,5 @@
-from .referral_code import generate_referral_code
+from .referral_code import generate_referral_code, encode_referral_code, referral_code_for
 from .logging import setup_logging
 
-__all__ = ["generate_referral_code", "setup_logging"]
+__all__ = ["generate_referral_code", "encode_referral_code", "referral_code_for", "setup_logging"]
 
@@ -0,0 +1,120 @@
+"""
+Prometheus metrics shared by the bot and the web admin
+
+The bot serves them on METRICS_PORT (see serve_metrics, meant for the
+internal network), the web admin on /metrics behind METRICS_TOKEN or an
+admin session. Metric objects live here so every module records into the same
+registry:
+
+  * updates processed and handler latency per router handler
+    (bot/middlewares.py)
+  * database statements by scope, per update or request and their time
+    (database/instrumentation.py), pool checkout wait (the pool classes,
+    used by database/base.py)
+  * Telegram API call latency and outcome per method (bot/send_queue.py)
+  * expiry run duration and the channel removal backlog
+    (services/expiry_scheduler.py, bot/channel_workers.py)
+  * web request latency per route (web/main.py)
+
+For several web or webhook worker processes, set PROMETHEUS_MULTIPROC_DIR to
+an empty directory shared by the workers; the web /metrics endpoint then
+aggregates every worker (bot workers each serve their own port instead).
+"""
+import os
+import time
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest,
+    multiprocess, start_http_server,
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Database statements run in a few milliseconds; Bot API calls and handlers in tens to hundreds
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+UPDATES = Counter(
+    "bot_updates_total", "Telegram updates processed", ["type", "result"],
+)
+HANDLER_SECONDS = Histogram(
+    "bot_handler_duration_seconds", "Time spent in each router handler", ["handler"],
+)
+UPDATE_QUERIES = Histogram(
+    "bot_update_db_queries", "Database statements executed per update", buckets=QUERY_COUNT_BUCKETS,
+)
+UPDATE_QUERY_SECONDS = Histogram(
+    "bot_update_db_seconds", "Database time per update", buckets=FAST_BUCKETS,
+)
+DB_QUERIES = Counter(
+    "db_queries_total", "Database statements by handler, route or job", ["scope"],
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Database statement execution time", ["engine"], buckets=FAST_BUCKETS,
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Time waiting for a pooled database connection", ["engine"], buckets=FAST_BUCKETS,
+)
+TELEGRAM_API_SECONDS = Histogram(
+    "telegram_api_request_duration_seconds", "Bot API call latency (excluding send queue wait)", ["method"],
+)
+TELEGRAM_API_REQUESTS = Counter(
+    "telegram_api_requests_total", "Bot API calls by outcome (ok or error code)", ["method", "result"],
+)
+EXPIRY_RUN_SECONDS = Histogram(
+    "expiry_run_duration_seconds", "Duration of one expiry run, including queueing the removals",
+)
+CHANNEL_REMOVAL_BACKLOG = Gauge(
+    "channel_removal_backlog", "Expired members queued or being removed from the channel",
+    multiprocess_mode="livesum",
+)
+WEB_REQUEST_SECONDS = Histogram(
+    "web_request_duration_seconds", "Admin panel request latency", ["method", "route", "status"],
+)
+WEB_REQUEST_QUERIES = Histogram(
+    "web_request_db_queries", "Database statements executed per admin panel request", ["route"],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long each checkout waits (including pre-ping)"""
+
+    metrics_engine = "sync"
+
+    def connect(self):
+        started = time.perf_counter()
+        connection = super().connect()
+        DB_POOL_CHECKOUT_SECONDS.labels(self.metrics_engine).observe(time.perf_counter() - started)
+        return connection
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool recording how long each checkout waits (including pre-ping)"""
+
+    metrics_engine = "async"
+
+    def connect(self):
+        started = time.perf_counter()
+        connection = super().connect()
+        DB_POOL_CHECKOUT_SECONDS.labels(self.metrics_engine).observe(time.perf_counter() - started)
+        return connection
+
+
+def serve_metrics(host: str, port: int):
+    """Serve /metrics from a background thread (no-op when port is 0)"""
+    if not port:
+        return
+    start_http_server(port, addr=host)
+    logger.info(f"Metrics served on {host}:{port}")
+
+
+def render_metrics() -> bytes:
+    """Current metrics in the Prometheus text format"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
@@ -0,0 +1,87 @@
+"""
+Token bucket rate limiting for Telegram Bot API calls
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, bursts up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0):
+        """Wait until ``tokens`` are available and take them (waiters are served in order)"""
+        async with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                # Sleep once until the deficit has refilled; a clock that advanced a hair
+                # less leaves a tiny debt the next caller pays instead of another sleep
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+    @property
+    def is_full(self) -> bool:
+        self._refill()
+        return self._tokens >= self.capacity
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class TelegramRateLimiter:
+    """Global bucket plus one bucket per chat (bounded LRU of chats)"""
+
+    def __init__(self, global_rate: float, per_chat_rate: float, per_chat_burst: Optional[float] = None,
+                 max_chats: int = 10000):
+        # No global burst: a full bucket plus its refill would exceed the limit within one second
+        self.global_bucket = TokenBucket(global_rate, capacity=1.0)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._overrides = {}
+
+    def set_global_rate(self, rate: float):
+        """Change the global rate (e.g. to split the bot's budget across processes)"""
+        self.global_bucket.rate = rate
+
+    def set_chat_rate(self, chat_id, rate: float, capacity: Optional[float] = None):
+        """Use a different rate for one chat (e.g. admin actions in the channel)"""
+        self._overrides[str(chat_id)] = TokenBucket(rate, capacity)
+
+    async def acquire(self, chat_id):
+        """Wait for both the chat's and the global budget"""
+        # Take the chat token first so a slow chat does not hold global tokens
+        await self.chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
+
+    def chat_bucket(self, chat_id) -> TokenBucket:
+        """Bucket for one chat (created on first use)"""
+        key = str(chat_id)
+        bucket = self._overrides.get(key)
+        if bucket is not None:
+            return bucket
+
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                # Idle chats have full buckets, dropping them loses nothing
+                idle = [k for k, b in self._chats.items() if b.is_full]
+                for old_key in idle[:len(self._chats) - self.max_chats + 1]:
+                    del self._chats[old_key]
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self._chats[key] = bucket
+        else:
+            self._chats.move_to_end(key)
+        return bucket
@@ -1,9 +1,39 @@
 import random
 import string
 
+REFERRAL_CODE_LENGTH = 8
+REFERRAL_CODE_ALPHABET = string.digits + string.ascii_uppercase
 
-def generate_referral_code(length: int = 8) -> str:
+# Size of the code space (36^8). Codes are an affine permutation of it:
+# code = (id * MULTIPLIER + OFFSET) mod SPACE, a bijection because
+# MULTIPLIER is coprime to 36. Consecutive ids get unrelated-looking codes.
+_CODE_SPACE = len(REFERRAL_CODE_ALPHABET) ** REFERRAL_CODE_LENGTH
+_MULTIPLIER = 2_654_435_761
+_OFFSET = 1_357_913_579_135
+
+
+def generate_referral_code(length: int = REFERRAL_CODE_LENGTH) -> str:
     """Generate a random referral code"""
     characters = string.ascii_uppercase + string.digits
     return ''.join(random.choice(characters) for _ in range(length))
 
+
+def encode_referral_code(telegram_id: int) -> str:
+    """Derive the referral code of a Telegram ID (distinct IDs give distinct codes)"""
+    if not 0 <= telegram_id < _CODE_SPACE:
+        raise ValueError(f"Telegram ID {telegram_id} is outside the referral code space")
+
+    value = (telegram_id * _MULTIPLIER + _OFFSET) % _CODE_SPACE
+    chars = []
+    for _ in range(REFERRAL_CODE_LENGTH):
+        value, digit = divmod(value, len(REFERRAL_CODE_ALPHABET))
+        chars.append(REFERRAL_CODE_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def referral_code_for(telegram_id: int) -> str:
+    """Referral code for a new user, without any database lookup"""
+    if 0 <= telegram_id < _CODE_SPACE:
+        return encode_referral_code(telegram_id)
+    # IDs beyond 36^8 cannot be encoded in 8 characters
+    return generate_referral_code()
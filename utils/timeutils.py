@@ -0,0 +1,8 @@
+from datetime import datetime, timezone
+
+
+def utc_timestamp(value: datetime) -> float:
+    """POSIX timestamp of a datetime, treating naive values as UTC (as stored by the services)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
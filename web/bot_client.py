@@ -0,0 +1,48 @@
+"""
+Telegram client of the admin panel
+
+Each web process owns one Bot with one pooled aiohttp session, opened in the
+FastAPI lifespan and closed at shutdown. Admin actions reuse its keep-alive
+connections to the Bot API instead of paying a TCP/TLS handshake (and a new
+ClientSession) per request.
+"""
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from bot.channel_manager import ChannelManager
+from bot.middlewares import APIMetricsMiddleware
+from config.settings import settings
+
+
+def create_web_bot(token: str = None, api_server: str = None, connection_limit: int = None) -> Bot:
+    """Bot for the admin panel (custom API server applied, no send queue)"""
+    api_server = settings.TELEGRAM_API_SERVER if api_server is None else api_server
+    limit = settings.WEB_BOT_CONNECTION_LIMIT if connection_limit is None else connection_limit
+    if api_server:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(api_server), limit=limit)
+    else:
+        session = AiohttpSession(limit=limit)
+    session.middleware(APIMetricsMiddleware())
+    return Bot(token=token or settings.BOT_TOKEN, session=session)
+
+
+class BotClient:
+    """The Bot and ChannelManager shared by every request of a web process"""
+    
+    def __init__(self):
+        self.bot: Bot = None
+        self.channel_manager: ChannelManager = None
+    
+    def start(self, **bot_options):
+        self.bot = create_web_bot(**bot_options)
+        self.channel_manager = ChannelManager(self.bot)
+    
+    async def close(self):
+        if self.bot is not None:
+            await self.bot.session.close()
+            self.bot = None
+            self.channel_manager = None
+
+
+# Global instance, started and closed by the web app lifespan
+bot_client = BotClient()
@@ -17,28 +17,50 @@ else:
 
 sys.path.insert(0, str(project_root))
 
-from fastapi import FastAPI, Request, Depends, HTTPException, Form
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Depends, HTTPException, Form, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from prometheus_client import CONTENT_TYPE_LATEST
 from sqlalchemy.orm import Session, joinedload
-from typing import Optional
+from typing import Optional, Tuple
 import hashlib
-import secrets
-from datetime import datetime
+import hmac
+from time import perf_counter
+from datetime import date, datetime, time, timedelta, timezone
 
 from database.base import get_session
-from database.models import Plan, User, Subscription, Payment, SubscriptionStatus, PaymentStatus, PlanDuration
+from database.models import Plan, Subscription, SubscriptionStatus, PaymentStatus, PlanDuration
 from services.plan_service import PlanService
 from services.subscription_service import SubscriptionService
 from services.user_service import UserService
 from services.payment_service import PaymentService
+from services.subscription_cache import subscription_cache, ACTIVATED_VERSION
+from services.stats_service import StatsService, USERS, REVENUE, payment_counter, status_change, subscription_counter
 from config.settings import settings
+from database.instrumentation import query_scope
+from utils.metrics import WEB_REQUEST_QUERIES, WEB_REQUEST_SECONDS, render_metrics
+from utils.pagination import decode_cursor, encode_cursor
+from web.bot_client import bot_client
+from web.session_store import create_session_store
 import logging
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Mared Bot Admin Panel")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared Bot API session at startup and close it at shutdown"""
+    bot_client.start()
+    try:
+        yield
+    finally:
+        await bot_client.close()
+
+
+app = FastAPI(title="Mared Bot Admin Panel", lifespan=lifespan)
 
 # Templates
 # In Docker: /app/web/templates
@@ -52,8 +74,30 @@ else:
 
 templates = Jinja2Templates(directory=str(templates_dir))
 
-# Simple session storage (in production, use proper session management)
-sessions = {}
+SESSION_COOKIE = "admin_session"
+
+session_store = create_session_store(
+    settings.WEB_SESSION_BACKEND,
+    ttl_seconds=settings.WEB_SESSION_TTL_SECONDS,
+    touch_seconds=settings.WEB_SESSION_TOUCH_SECONDS,
+    max_sessions=settings.WEB_SESSION_MAX,
+    database_url=settings.WEB_SESSION_DATABASE_URL,
+)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time each request and count its database statements, by route"""
+    started = perf_counter()
+    with query_scope(f"{request.method} {request.url.path}") as scope:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        # Route template rather than the raw path, so ids do not multiply the metric labels
+        scope.name = f"{request.method} {path}"
+    WEB_REQUEST_SECONDS.labels(request.method, path, str(response.status_code)).observe(perf_counter() - started)
+    WEB_REQUEST_QUERIES.labels(path).observe(scope.count)
+    return response
 
 
 def get_db():
@@ -64,10 +108,10 @@ def get_db():
 
 def check_admin_session(request: Request) -> bool:
     """Check if user has valid admin session"""
-    session_id = request.cookies.get("admin_session")
-    if not session_id or session_id not in sessions:
+    session_id = request.cookies.get(SESSION_COOKIE)
+    if not session_id:
         return False
-    return True
+    return session_store.get(session_id) is not None
 
 
 def require_admin(request: Request):
@@ -77,6 +121,20 @@ def require_admin(request: Request):
     return True
 
 
+def require_metrics_access(request: Request):
+    """Dependency for /metrics: the METRICS_TOKEN bearer token (scrapers) or an admin session"""
+    authorization = request.headers.get("authorization", "")
+    if settings.METRICS_TOKEN and hmac.compare_digest(authorization, f"Bearer {settings.METRICS_TOKEN}"):
+        return True
+    return require_admin(request)
+
+
+@app.get("/metrics")
+def metrics(_: bool = Depends(require_metrics_access)):
+    """Prometheus metrics of this web process (or of every worker in multiprocess mode)"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/", response_class=HTMLResponse)
 async def login_page(request: Request):
     """Login page"""
@@ -84,21 +142,26 @@ async def login_page(request: Request):
 
 
 @app.post("/login")
-async def login(request: Request, password: str = Form(...)):
+def login(request: Request, password: str = Form(...)):
     """Handle login"""
     # Simple password check (in production, use proper authentication)
     admin_password = os.getenv("ADMIN_PASSWORD", "admin123")
     
     if password == admin_password:
         # Create session
-        session_id = secrets.token_urlsafe(32)
-        sessions[session_id] = {
+        session_id = session_store.create({
             "user_id": "admin",
-            "login_time": datetime.now()
-        }
+            "login_time": datetime.now(timezone.utc).isoformat()
+        })
         
         response = RedirectResponse(url="/dashboard", status_code=303)
-        response.set_cookie(key="admin_session", value=session_id, httponly=True)
+        response.set_cookie(
+            key=SESSION_COOKIE,
+            value=session_id,
+            max_age=settings.WEB_SESSION_TTL_SECONDS,
+            httponly=True,
+            samesite="lax",
+        )
         return response
     else:
         return templates.TemplateResponse(
@@ -108,14 +171,14 @@ async def login(request: Request, password: str = Form(...)):
 
 
 @app.get("/logout")
-async def logout(request: Request):
+def logout(request: Request):
     """Handle logout"""
-    session_id = request.cookies.get("admin_session")
+    session_id = request.cookies.get(SESSION_COOKIE)
     if session_id:
-        sessions.pop(session_id, None)
+        session_store.delete(session_id)
     
     response = RedirectResponse(url="/", status_code=303)
-    response.delete_cookie(key="admin_session")
+    response.delete_cookie(key=SESSION_COOKIE)
     return response
 
 
@@ -123,19 +186,12 @@ async def logout(request: Request):
 async def dashboard(request: Request, _: bool = Depends(require_admin)):
     """Admin dashboard"""
     try:
-        with get_session() as session:
-            total_users = session.query(User).count()
-            active_subscriptions = session.query(Subscription).filter(
-                Subscription.status == SubscriptionStatus.ACTIVE
-            ).count()
-            pending_payments = session.query(Payment).filter(
-                Payment.status == PaymentStatus.PENDING
-            ).count()
-            total_revenue = session.query(
-                func.sum(Payment.amount)
-            ).filter(
-                Payment.status == PaymentStatus.COMPLETED
-            ).scalar() or 0
+        # Maintained counters, one primary-key read regardless of table sizes
+        counters = StatsService.get_counters()
+        total_users = int(counters.get(USERS, 0))
+        active_subscriptions = int(counters.get(subscription_counter(SubscriptionStatus.ACTIVE), 0))
+        pending_payments = int(counters.get(payment_counter(PaymentStatus.PENDING), 0))
+        total_revenue = counters.get(REVENUE, 0)
     except Exception as e:
         logger.error(f"Database error in dashboard: {e}", exc_info=True)
         # Return default values if database connection fails
@@ -199,19 +255,16 @@ async def create_plan_api(
 ):
     """Create new plan"""
     try:
-        with get_session() as session:
-            plan = Plan(
-                name=name,
-                name_ar=name_ar,
-                duration=PlanDuration(duration),
-                duration_days=duration_days,
-                price=price,
-                currency=currency,
-                is_active=is_active
-            )
-            session.add(plan)
-            session.commit()
-            return JSONResponse(content={"success": True, "plan_id": plan.id})
+        plan = PlanService.create_plan(
+            name=name,
+            name_ar=name_ar,
+            duration=duration,
+            duration_days=duration_days,
+            price=price,
+            currency=currency,
+            is_active=is_active
+        )
+        return JSONResponse(content={"success": True, "plan_id": plan.id})
     except Exception as e:
         return JSONResponse(
             status_code=400,
@@ -228,31 +281,20 @@ async def update_plan_api(
     """Update plan"""
     data = await request.json()
     try:
-        with get_session() as session:
-            plan = session.query(Plan).filter(Plan.id == plan_id).first()
-            if not plan:
-                return JSONResponse(
-                    status_code=404,
-                    content={"success": False, "error": "Plan not found"}
-                )
-            
-            if "name" in data:
-                plan.name = data["name"]
-            if "name_ar" in data:
-                plan.name_ar = data["name_ar"]
-            if "duration" in data:
-                plan.duration = PlanDuration(data["duration"])
-            if "duration_days" in data:
-                plan.duration_days = data["duration_days"]
-            if "price" in data:
-                plan.price = data["price"]
-            if "currency" in data:
-                plan.currency = data["currency"]
-            if "is_active" in data:
-                plan.is_active = data["is_active"]
-            
-            session.commit()
-            return JSONResponse(content={"success": True})
+        fields = {
+            key: data[key]
+            for key in ("name", "name_ar", "duration", "duration_days", "price", "currency", "is_active")
+            if key in data
+        }
+        if "duration" in fields:
+            fields["duration"] = PlanDuration(fields["duration"])
+        
+        if not PlanService.update_plan(plan_id, **fields):
+            return JSONResponse(
+                status_code=404,
+                content={"success": False, "error": "Plan not found"}
+            )
+        return JSONResponse(content={"success": True})
     except Exception as e:
         return JSONResponse(
             status_code=400,
@@ -264,16 +306,12 @@ async def update_plan_api(
 async def delete_plan_api(plan_id: int, _: bool = Depends(require_admin)):
     """Delete plan"""
     try:
-        with get_session() as session:
-            plan = session.query(Plan).filter(Plan.id == plan_id).first()
-            if not plan:
-                return JSONResponse(
-                    status_code=404,
-                    content={"success": False, "error": "Plan not found"}
-                )
-            session.delete(plan)
-            session.commit()
-            return JSONResponse(content={"success": True})
+        if not PlanService.delete_plan(plan_id):
+            return JSONResponse(
+                status_code=404,
+                content={"success": False, "error": "Plan not found"}
+            )
+        return JSONResponse(content={"success": True})
     except Exception as e:
         return JSONResponse(
             status_code=400,
@@ -281,40 +319,173 @@ async def delete_plan_api(plan_id: int, _: bool = Depends(require_admin)):
         )
 
 
+# Admin list pagination (keyset on created_at, id)
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _optional(value: Optional[str], parse, name: str):
+    """Parse an optional query parameter (empty means unset), 400 on bad input"""
+    if value is None or value == "":
+        return None
+    try:
+        return parse(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: {value}")
+
+
+def _parse_bool(value: str) -> bool:
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise ValueError(value)
+
+
+def _created_range(date_from: Optional[str], date_to: Optional[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Inclusive calendar dates (UTC) as a half-open created_at range"""
+    start = _optional(date_from, date.fromisoformat, "date_from")
+    end = _optional(date_to, date.fromisoformat, "date_to")
+    return (
+        datetime.combine(start, time.min, tzinfo=timezone.utc) if start else None,
+        datetime.combine(end, time.min, tzinfo=timezone.utc) + timedelta(days=1) if end else None,
+    )
+
+
+def _page(rows: list, limit: int) -> Tuple[list, Optional[str]]:
+    """Drop the look-ahead row and build the cursor of the next page"""
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if len(rows) > limit else None
+    return items, next_cursor
+
+
+def _subscriptions_page(status, plan_id, trial, date_from, date_to, cursor, limit) -> Tuple[list, Optional[str]]:
+    created_from, created_to = _created_range(date_from, date_to)
+    rows = SubscriptionService.list_subscriptions(
+        status=_optional(status, lambda value: SubscriptionStatus(value.lower()), "status"),
+        plan_id=_optional(plan_id, int, "plan_id"),
+        is_trial=_optional(trial, _parse_bool, "trial"),
+        created_from=created_from,
+        created_to=created_to,
+        after=_optional(cursor, decode_cursor, "cursor"),
+        limit=limit + 1,
+    )
+    return _page(rows, limit)
+
+
+def _users_page(trial_used, date_from, date_to, cursor, limit) -> Tuple[list, Optional[str]]:
+    created_from, created_to = _created_range(date_from, date_to)
+    rows = UserService.list_users(
+        free_trial_used=_optional(trial_used, _parse_bool, "trial_used"),
+        created_from=created_from,
+        created_to=created_to,
+        after=_optional(cursor, decode_cursor, "cursor"),
+        limit=limit + 1,
+    )
+    return _page(rows, limit)
+
+
+def _next_url(request: Request, next_cursor: Optional[str]) -> Optional[str]:
+    """Current URL (filters kept) pointing at the next page"""
+    if not next_cursor:
+        return None
+    return str(request.url.include_query_params(cursor=next_cursor))
+
+
 @app.get("/subscriptions", response_class=HTMLResponse)
-async def subscriptions_page(request: Request, _: bool = Depends(require_admin)):
+async def subscriptions_page(
+    request: Request,
+    status: Optional[str] = None,
+    plan_id: Optional[str] = None,
+    trial: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    _: bool = Depends(require_admin)
+):
     """Subscriptions management page"""
     try:
-        with get_session() as session:
-            subscriptions = session.query(Subscription).options(
-                joinedload(Subscription.user),
-                joinedload(Subscription.plan)
-            ).order_by(
-                Subscription.created_at.desc()
-            ).limit(100).all()
+        subscriptions, next_cursor = _subscriptions_page(status, plan_id, trial, date_from, date_to, cursor, limit)
+        plans = PlanService.get_all_plans()
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Database error in subscriptions_page: {e}", exc_info=True)
-        subscriptions = []
+        subscriptions, next_cursor, plans = [], None, []
     
     return templates.TemplateResponse("subscriptions.html", {
         "request": request,
-        "subscriptions": subscriptions
+        "subscriptions": subscriptions,
+        "plans": plans,
+        "statuses": list(SubscriptionStatus),
+        "filters": request.query_params,
+        "next_url": _next_url(request, next_cursor),
+        "first_url": str(request.url.remove_query_params("cursor")),
+    })
+
+
+@app.get("/api/subscriptions")
+async def list_subscriptions_api(
+    status: Optional[str] = None,
+    plan_id: Optional[str] = None,
+    trial: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    _: bool = Depends(require_admin)
+):
+    """Subscriptions newest first; pass next_cursor back as cursor for the next page"""
+    items, next_cursor = _subscriptions_page(status, plan_id, trial, date_from, date_to, cursor, limit)
+    return JSONResponse(content={
+        "items": jsonable_encoder([dict(row._mapping) for row in items]),
+        "next_cursor": next_cursor,
     })
 
 
 @app.get("/users", response_class=HTMLResponse)
-async def users_page(request: Request, _: bool = Depends(require_admin)):
+async def users_page(
+    request: Request,
+    trial_used: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    _: bool = Depends(require_admin)
+):
     """Users management page"""
     try:
-        with get_session() as session:
-            users = session.query(User).order_by(User.created_at.desc()).limit(100).all()
+        users, next_cursor = _users_page(trial_used, date_from, date_to, cursor, limit)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Database error in users_page: {e}", exc_info=True)
-        users = []
+        users, next_cursor = [], None
     
     return templates.TemplateResponse("users.html", {
         "request": request,
-        "users": users
+        "users": users,
+        "filters": request.query_params,
+        "next_url": _next_url(request, next_cursor),
+        "first_url": str(request.url.remove_query_params("cursor")),
+    })
+
+
+@app.get("/api/users")
+async def list_users_api(
+    trial_used: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    _: bool = Depends(require_admin)
+):
+    """Users newest first; pass next_cursor back as cursor for the next page"""
+    items, next_cursor = _users_page(trial_used, date_from, date_to, cursor, limit)
+    return JSONResponse(content={
+        "items": jsonable_encoder([dict(row._mapping) for row in items]),
+        "next_cursor": next_cursor,
     })
 
 
@@ -341,7 +512,8 @@ async def activate_subscription_api(
     """Activate subscription manually"""
     try:
         with get_session() as session:
-            subscription = session.query(Subscription).filter(
+            # Load the user with the subscription: it is needed after the commit below
+            subscription = session.query(Subscription).options(joinedload(Subscription.user)).filter(
                 Subscription.id == subscription_id
             ).first()
             if not subscription:
@@ -351,16 +523,15 @@ async def activate_subscription_api(
                 )
             
             # Activate subscription
+            StatsService.bump(session, status_change(
+                subscription_counter, subscription.status, SubscriptionStatus.ACTIVE
+            ))
+            subscription_cache.bump(session, ACTIVATED_VERSION)
             subscription.status = SubscriptionStatus.ACTIVE
             session.commit()
             
             # Add user to channel
-            from bot.channel_manager import ChannelManager
-            from aiogram import Bot
-            bot = Bot(token=settings.BOT_TOKEN)
-            channel_manager = ChannelManager(bot)
-            await channel_manager.add_user(subscription.user.telegram_id)
-            await bot.session.close()
+            await bot_client.channel_manager.add_user(subscription.user.telegram_id)
             
         return JSONResponse(content={"success": True})
     except Exception as e:
@@ -372,15 +543,22 @@ async def activate_subscription_api(
 
 
 @app.post("/api/payments/{payment_id}/confirm")
-async def confirm_payment_api(
+def confirm_payment_api(
     payment_id: int,
+    request: Request,
     _: bool = Depends(require_admin)
 ):
-    """Confirm payment manually"""
+    """Confirm payment manually (retries may send the same Idempotency-Key header)"""
     try:
-        success = PaymentService.confirm_payment(payment_id)
-        if success:
-            return JSONResponse(content={"success": True})
+        confirmation = PaymentService.confirm_payment(
+            payment_id, idempotency_key=request.headers.get("Idempotency-Key")
+        )
+        if confirmation:
+            return JSONResponse(content={
+                "success": True,
+                "subscription_id": confirmation.subscription.id,
+                "already_confirmed": not confirmation.confirmed,
+            })
         else:
             return JSONResponse(
                 status_code=400,
@@ -0,0 +1,173 @@
+"""
+Admin panel login sessions
+
+The session id handed out in the ``admin_session`` cookie is looked up on
+every authenticated request, so validation is a single dict or primary key
+lookup. Sessions slide: each use pushes the expiry back to TTL from now.
+
+- MemorySessionStore keeps sessions in the process (LRU, bounded). Only
+  suitable for a single web worker.
+- DatabaseSessionStore keeps them in the ``admin_sessions`` table, so every
+  uvicorn worker and replica sees the same logins. It stores a hash of the
+  session id rather than the id itself, and only writes the new expiry once
+  per touch interval instead of on every request.
+"""
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import create_engine, delete, insert, select, update
+from sqlalchemy.engine import Engine
+from database.models import AdminSession
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """Interface of the admin session stores"""
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+
+    def create(self, data: dict) -> str:
+        """Start a session holding data (JSON-serializable), returning its id"""
+        raise NotImplementedError
+
+    def get(self, session_id: str) -> Optional[dict]:
+        """Data of a live session, extending its expiry; None if unknown or expired"""
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        """End a session (no-op if it does not exist)"""
+        raise NotImplementedError
+
+    @staticmethod
+    def new_session_id() -> str:
+        return secrets.token_urlsafe(32)
+
+
+class MemorySessionStore(SessionStore):
+    """In-process sessions, least recently used evicted beyond max_sessions"""
+
+    def __init__(self, ttl_seconds: int, max_sessions: int):
+        super().__init__(ttl_seconds)
+        self.max_sessions = max_sessions
+        # session_id -> (monotonic expiry, data), least recently used first
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        # Sync routes and dependencies run in the threadpool
+        self._lock = threading.Lock()
+
+    def create(self, data: dict) -> str:
+        session_id = self.new_session_id()
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            self._sessions[session_id] = (now + self.ttl_seconds, data)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session_id
+
+    def get(self, session_id: str) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at <= now:
+                del self._sessions[session_id]
+                return None
+            self._sessions[session_id] = (now + self.ttl_seconds, data)
+            self._sessions.move_to_end(session_id)
+            return data
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _purge(self, now: float):
+        """Drop expired sessions (expiries grow along the LRU order, so they sit at the front)"""
+        while self._sessions:
+            session_id, (expires_at, _) = next(iter(self._sessions.items()))
+            if expires_at > now:
+                break
+            del self._sessions[session_id]
+
+
+class DatabaseSessionStore(SessionStore):
+    """Sessions shared by every web process through the admin_sessions table"""
+
+    def __init__(self, engine: Engine, ttl_seconds: int, touch_seconds: int):
+        super().__init__(ttl_seconds)
+        self.engine = engine
+        self.touch_seconds = touch_seconds
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        # A leaked table does not leak usable cookies
+        return hashlib.sha256(session_id.encode()).hexdigest()
+
+    def create(self, data: dict) -> str:
+        session_id = self.new_session_id()
+        now = datetime.now(timezone.utc)
+        with self.engine.begin() as conn:
+            # Logins are rare, so they clean up after abandoned sessions
+            conn.execute(delete(AdminSession).where(AdminSession.expires_at <= now))
+            conn.execute(insert(AdminSession).values(
+                session_key=self._key(session_id),
+                data=data,
+                created_at=now,
+                expires_at=now + timedelta(seconds=self.ttl_seconds),
+            ))
+        return session_id
+
+    def get(self, session_id: str) -> Optional[dict]:
+        key = self._key(session_id)
+        now = datetime.now(timezone.utc)
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(AdminSession.data, AdminSession.expires_at).where(AdminSession.session_key == key)
+            ).one_or_none()
+            if row is None:
+                return None
+
+            expires_at = row.expires_at
+            if expires_at.tzinfo is None:  # SQLite drops the offset
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            if expires_at <= now:
+                return None
+
+            # Slide the expiry at most once per touch interval
+            if expires_at - now < timedelta(seconds=self.ttl_seconds - self.touch_seconds):
+                conn.execute(
+                    update(AdminSession).where(AdminSession.session_key == key)
+                    .values(expires_at=now + timedelta(seconds=self.ttl_seconds))
+                )
+            conn.commit()
+            return row.data
+
+    def delete(self, session_id: str):
+        with self.engine.begin() as conn:
+            conn.execute(delete(AdminSession).where(AdminSession.session_key == self._key(session_id)))
+
+
+def create_session_store(backend: str, ttl_seconds: int, touch_seconds: int = 300,
+                         max_sessions: int = 1000, database_url: str = "") -> SessionStore:
+    """Session store for the configured backend ("database" or "memory")"""
+    if backend == "memory":
+        return MemorySessionStore(ttl_seconds, max_sessions)
+    if backend != "database":
+        raise ValueError(f"Unknown session backend: {backend}")
+
+    if database_url:
+        # A dedicated database (e.g. a shared SQLite file) is not managed by the migrations
+        engine = create_engine(database_url, pool_pre_ping=True)
+        AdminSession.__table__.create(engine, checkfirst=True)
+    else:
+        from database.base import engine
+    logger.info(f"Admin sessions stored in the database (ttl={ttl_seconds}s)")
+    return DatabaseSessionStore(engine, ttl_seconds, touch_seconds)